@@ -0,0 +1,123 @@
+#!/usr/local/bin/python3.4
+
+'''
+Aurora site aggregator, subscribes to several inverter publishers
+(``aurx.py``) and publishes or posts one site record per interval.  See
+:mod:`pyaurora.aggregate`.
+
+Sources are given as ``NAME=URL``, the name is used in ``missing`` and
+``weakestString``::
+
+    auragg.py --sub-url east=tcp://10.0.0.2:8080 \\
+              --sub-url west=tcp://10.0.0.3:8080 --rest-url http://...
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import time
+import logging
+from argparse import ArgumentParser
+import zmq
+import pyaurora as pv
+from pyaurora import sinks
+from pyaurora.aggregate import Aggregator
+from pyaurora.cozmq import setsockopts
+from pyaurora.wire import wirecodecs, getcodec, JSONCodec
+
+
+log = logging.getLogger('aurora')
+
+
+def siteoutputs(opt, context):
+    '''
+    Return (outputs, rest): the co-routines site records are sent to and
+    the :class:`~pyaurora.httpsink.HTTPSink` (or None) to close on exit.
+    '''
+    outputs = []
+    rest = None
+    if opt.pub_url:
+        pub = context.socket(zmq.PUB)
+        setsockopts(pub, hwm=opt.hwm, linger=0)
+        pub.bind(opt.pub_url)
+        outputs.append(sinks.make('json', sinks.make('zmq', pub, drop=True)))
+    if opt.rest_url:
+        # HTTPSink posts JSON strings
+        rest = sinks.make('http', opt.rest_url, 'site_data', spool=opt.spool)
+        outputs.append(sinks.make('json', rest))
+    if not outputs:
+        outputs.append(sinks.make('json', sinks.make('stream', flush=True)))
+    return outputs, rest
+
+
+def main():
+
+    a = ArgumentParser()
+    a.add_argument('--sub-url', action='append', required=True,
+            metavar='NAME=URL',
+            help='''Inverter publisher to subscribe to, may be repeated.''')
+    a.add_argument('--codec', choices=sorted(wirecodecs),
+            help='''Decode samples with a :mod:`pyaurora.wire` codec, this must
+match the publishers.''')
+    a.add_argument('--interval', type=int, default=10,
+            help='Seconds per site record (%(default)s).')
+    a.add_argument('--lateness', type=float, default=5.0,
+            help='''Seconds to wait for missing inverters after the end of an
+interval (%(default)s).''')
+    a.add_argument('--hwm', type=int, default=1000,
+            help='''zeromq high water mark (%(default)s).''')
+    a.add_argument('--pub-url',
+            help='''Publish site records as JSON to this zeromq URL.''')
+    a.add_argument('--rest-url',
+            help='''Post site records to this URL.''')
+    a.add_argument('--spool',
+            help='''Spool posts to this directory, see aurout.py.''')
+    opt = a.parse_args()
+
+    pv.startlogging()
+    log.info('auragg starting')
+    log.debug(opt)
+
+    context = zmq.Context()
+    codec = getcodec(opt.codec, pv.pollops) if opt.codec else JSONCodec()
+
+    outputs, rest = siteoutputs(opt, context)
+
+    poller = zmq.Poller()
+    names = {}
+    for spec in opt.sub_url:
+        name, _, url = spec.rpartition('=')
+        zock = context.socket(zmq.SUB)
+        setsockopts(zock, hwm=opt.hwm, linger=0)
+        zock.connect(url)
+        zock.setsockopt_string(zmq.SUBSCRIBE, '')
+        poller.register(zock, zmq.POLLIN)
+        names[zock] = name or url
+
+    agg = Aggregator(pv.tee(outputs), names.values(), interval=opt.interval,
+            lateness=opt.lateness)
+
+    try:
+        while True:
+            for zock, _ in poller.poll(1000):
+                while True:
+                    try:
+                        frames = zock.recv_multipart(zmq.NOBLOCK, copy=False)
+                    except zmq.Again:
+                        break
+                    for frame in frames:
+                        agg.send((names[zock], codec.decode(frame.buffer)))
+            agg.advance(time.time())
+    except KeyboardInterrupt:
+        log.warning('Ctrl-C received, application will exit')
+    finally:
+        agg.flush()
+        if rest is not None:
+            rest.close(timeout=10)
+            log.info('post stats: {0}'.format(rest.stats()))
+
+    log.info('auragg exiting')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/local/bin/python3.4
+
+'''
+Aurora gateway, owns the connection to the WiFi adapter and shares it with
+local clients.  See :mod:`pyaurora.gateway`.
+
+Point pollers at the poll port and everything else (ad hoc queries) at
+the interactive port::
+
+    aurgw.py --host 192.168.1.140
+    aurora.py --gateway 127.0.0.1:8898
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import asyncio
+import logging
+from argparse import ArgumentParser
+import pyaurora as pv
+from pyaurora import metrics
+from pyaurora.gateway import Gateway
+
+
+log = logging.getLogger('aurora')
+
+
+def main():
+
+    a = ArgumentParser()
+    a.add_argument('--host', default='192.168.1.140',
+            help='WiFi adapter address (%(default)s).')
+    a.add_argument('--port', type=int, default=8899,
+            help='WiFi adapter port (%(default)s).')
+    a.add_argument('--read-delay', type=float, default=0.05,
+            help='Time between command and read (%(default)f).')
+    a.add_argument('--default-timeout', type=float, default=5.0,
+            help='Seconds to wait for the inverter to answer (%(default)s).')
+    a.add_argument('--listen', default='127.0.0.1',
+            help='Address to accept clients on (%(default)s).')
+    a.add_argument('--interactive-port', type=int, default=8897,
+            help='''Port for interactive clients, their requests go ahead of
+the poll (%(default)s).''')
+    a.add_argument('--poll-port', type=int, default=8898,
+            help='Port for scheduled pollers (%(default)s).')
+    a.add_argument('--ttl', type=float, default=1.0,
+            help='''Cache seconds for commands without a specific TTL
+(%(default)s).''')
+    a.add_argument('--metrics-port', type=int,
+            help='Serve Prometheus metrics on this port.')
+    opt = a.parse_args()
+
+    pv.startlogging()
+    log.info('aurgw starting')
+    log.debug(opt)
+
+    if opt.metrics_port:
+        metrics.serve(opt.metrics_port)
+
+    gw = Gateway(opt.host, opt.port, readdelay=opt.read_delay,
+            timeout=opt.default_timeout, defaultttl=opt.ttl)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(gw.start(opt.interactive_port, opt.poll_port,
+                addr=opt.listen))
+        loop.run_forever()
+    except KeyboardInterrupt:
+        log.warning('Ctrl-C received, application will exit')
+    finally:
+        loop.close()
+
+    log.info('aurgw exiting')
+
+
+if __name__ == '__main__':
+    main()
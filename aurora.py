@@ -45,42 +45,21 @@ import functools as ft
 from collections import OrderedDict
 from argparse import ArgumentParser
 import pyaurora as pv
+from pyaurora.worker import policies
+from pyaurora import metrics, catalog, sinks
 import logging
-from logging.config import dictConfig
 
 
-dictConfig(pv.logconfig)
 log = logging.getLogger('aurora')
 
 
-operations = (
-        #'getTime',
-        #'getFirmwareRel', 
-        'gridPowerAll', 
-        'powerPeakToday',
-        'dailyEnergy',
-        'weeklyEnergy',
-        #'last7Energy',
-        'partialEnergy',
-        'getEnergy10',
-        'frequencyAll', 
-        'gridVoltageAll', 
-        'gridVoltageAverage', 
-        'gridCurrentAll', 
-        'bulkVoltageDcDc', 
-        'in1Voltage',
-        'in1Current',
-        'in2Voltage',
-        'in2Current',
-        'pin1All', 
-        'pin2All',
-        'iLeakDcDc', 
-        'iLeakInverter', 
-        'boosterTemp',
-    )
+operations = pv.pollops
 '''The inverter operations to be polled in each cycle.'''
 
 
+_polls = metrics.registry.counter('aurora_polls', 'Completed inverter polls.')
+
+
 def inverterpoll(inverterrdr, operations, target):
     '''
     Poll the inverter with a list of operations.
@@ -88,26 +67,98 @@ def inverterpoll(inverterrdr, operations, target):
     :param inverterrdr: function that can issue commands and return
         response.  In general it accepts a command and subcommand (which
         may be None).
-    :param operations: sequence of strings.  The current implementation 
-        looks up the relevant command, subcommand, decoder and formatter
-        to poll that value.
+    :param operations: sequence of field names from
+        :data:`pyaurora.catalog.fields`, each command is sent once however
+        many of its fields are asked for.
     :param target: coroutine that accepts a dict (actually an ordered dict).
     '''
     now = dt.datetime.now()
-    log.debug('polling at {0}'.format(now))
+    log.debug('polling at %s', now)
 
     od = OrderedDict()
     utc = dt.datetime.utcnow()
     od['utc'] = utc
 
-    for ssc in operations:
-        cmd, sc, (decoder, fmt) = pv.command.allops[ssc]
-        resp = inverterrdr(cmd, sc)
-        od[ssc] = decoder(resp)
+    catalog.plan(operations).poll(inverterrdr, od)
 
+    _polls.inc()
     target.send(od)
 
 
+def replaypolls(inverterrdr, operations, target):
+    '''
+    Poll a :class:`~pyaurora.capture.ReplaySocket` until the end of the
+    capture.  A captured timeout ended the live process, here it just skips
+    the poll it happened in, the capture carries on with the next process's
+    first poll.  A captured CRC error is skipped the same way.
+    '''
+    from pyaurora.capture import ReplayedTimeout
+
+    while True:
+        try:
+            inverterpoll(inverterrdr, operations, target=target)
+        except ReplayedTimeout:
+            log.warning('Replayed socket timeout, poll skipped')
+        except pv.CRCException as e:
+            log.warning('Replayed CRC error, poll skipped: %s', e)
+        except pv.GatewayError as e:
+            log.warning('Replayed gateway error, poll skipped: %s', e)
+
+
+def gatewaypoll(inverterrdr, operations, target):
+    '''
+    :func:`inverterpoll` through a gateway, a poll the inverter did not
+    answer is skipped instead of ending the process.
+    '''
+    try:
+        inverterpoll(inverterrdr, operations, target=target)
+    except pv.GatewayError as e:
+        log.warning('Gateway error, poll skipped: %s', e)
+
+
+def queueoutputs(outputs, maxsize, policy):
+    '''
+    Give each of `outputs`, a list of (name, target), its own queue and
+    thread so a slow one (eg a CSV file on a busy SD card) doesn't hold up
+    the others.  Returns the queued outputs and their workers.
+    '''
+    queued = []
+    workers = []
+    for name, target in outputs:
+        # make() takes the sink name, the thread name goes positionally
+        worker = sinks.make('queued', target, maxsize, policy, name)
+        metrics.registry.gauge('aurora_queue_depth', worker.queue.qsize,
+                'Samples waiting in a sink queue.', sink=name)
+        metrics.registry.gauge('aurora_queue_dropped',
+                lambda worker=worker: worker.dropped,
+                'Samples dropped by a sink queue.', sink=name)
+        queued.append((name, worker))
+        workers.append(worker)
+    return queued, workers
+
+
+def anomalyoptions(limits, maxrates):
+    '''
+    Return (limits, maxrates) for :func:`pyaurora.output.detectanomalies`
+    from FIELD=LOW:HIGH and FIELD=N strings, either of LOW and HIGH may be
+    empty.
+    '''
+    lims = {}
+    for spec in limits:
+        field, _, bounds = spec.partition('=')
+        lo, sep, hi = bounds.partition(':')
+        if field not in catalog.fields or not sep:
+            raise ValueError('bad limit: {0}'.format(spec))
+        lims[field] = tuple(float(v) if v else None for v in (lo, hi))
+    rates = {}
+    for spec in maxrates:
+        field, _, n = spec.partition('=')
+        if field not in catalog.fields:
+            raise ValueError('unknown field: {0}'.format(field))
+        rates[field] = float(n)
+    return lims, rates
+
+
 def main():
 
     a = ArgumentParser()
@@ -136,45 +187,197 @@ the night.''')
     a.add_argument('--csv', help='''Optionally write CSV to file.  The name
 may contain `strftime` format strings.  If the string is "stdout" the CSV
 output will be directed to `sys.stdout`.''')
+    a.add_argument('--csv-index', action='store_true',
+            help='''Keep a time index next to the CSV file (NAME.idx) so time
+ranges can be read without scanning, see pyaurora.csvindex.''')
+    a.add_argument('--queue', type=int, default=0,
+            help='''Decouple the outputs from the poller, each (csv, archive,
+shm) gets a queue of this many samples handled on its own thread so a slow one
+doesn't hold up the others.  Zero writes output on the polling thread
+(%(default)s).''')
+    a.add_argument('--overflow', choices=policies, default='drop-oldest',
+            help='''What to do when an output queue is full (%(default)s).''')
+    a.add_argument('--metrics-port', type=int,
+            help='''Serve Prometheus metrics on this local port.''')
+    a.add_argument('--metrics-log', type=float,
+            help='''Log the metrics every this many seconds.''')
+    a.add_argument('--capture',
+            help='''Append every frame sent to and received from the inverter
+to this binary capture file.''')
+    a.add_argument('--replay',
+            help='''Poll a capture file rather than the inverter, polling
+repeats until the end of the capture.''')
+    a.add_argument('--replay-speed', type=float, default=1.0,
+            help='''Replay pace relative to the capture, 0 is as fast as
+possible (%(default)s).''')
+    a.add_argument('--archive', help='''Also append samples to a binary
+archive (see :mod:`pyaurora.wire`).  The name may contain `strftime` format
+strings.''')
+    a.add_argument('--shm', help='''Keep the latest sample in this memory
+mapped file (eg /dev/shm/aurora) for local readers, see pyaurora.shm.  Several
+aurora.py processes may share the file if they poll the same fields and
+different inverters (--inv-addr), only one may write each inverter.''')
+    a.add_argument('--detect-anomalies', action='store_true',
+            help='''Log a warning when leakage currents, temperature,
+isolation resistance or grid values look anomalous.  Watched fields that are
+not normally polled (rIsoRes) are added to the poll, and so to the CSV and
+archive, which must then be new files.''')
+    a.add_argument('--limit', action='append', default=[],
+            metavar='FIELD=LOW:HIGH', help='''With --detect-anomalies, alert
+when FIELD is outside LOW..HIGH, either may be omitted.  May be repeated.''')
+    a.add_argument('--max-rate', action='append', default=[],
+            metavar='FIELD=N', help='''With --detect-anomalies, alert when
+FIELD changes faster than N per second.  May be repeated.''')
+    a.add_argument('--gateway', metavar='HOST:PORT',
+            help='''Poll through an aurgw.py gateway (its poll port, normally
+8898) rather than connecting to the WiFi adapter directly.  Polls the
+inverter does not answer are skipped.''')
+    a.add_argument('--adaptive', action='store_true',
+            help='''Poll faster while grid power or input current is changing
+and slower while they are stable, instead of every --loop-interval.  Samples
+are then unevenly spaced, see pyaurora.scheduler about energy deltas.''')
+    a.add_argument('--min-interval', type=float, default=2.0,
+            help='Shortest adaptive poll interval (%(default)s).')
+    a.add_argument('--max-interval', type=float, default=60.0,
+            help='Longest adaptive poll interval (%(default)s).')
     opt = a.parse_args()
 
+    pv.startlogging()
     log.info('aurora starting')
     log.debug(opt)
 
+    ops = operations
+    if opt.detect_anomalies:
+        try:
+            limits, maxrates = anomalyoptions(opt.limit, opt.max_rate)
+        except ValueError as e:
+            a.error(str(e))
+        from pyaurora.output import anomalyfields
+        watched = anomalyfields + tuple(limits) + tuple(maxrates)
+        ops = tuple(ops) + tuple(f for f in dict.fromkeys(watched)
+                if f not in ops)
+
     if opt.csv:
         if opt.csv == 'stdout':
-            toutput = pv.tocsv(None)
+            toutput = sinks.make('csv', None)
         else:
             csvname = dt.datetime.now().strftime(opt.csv)
-            toutput = pv.tocsv(open(csvname, 'a'))
+            fout = open(csvname, 'a')
+            # tocsv would refuse the first sample, say so before polling
+            if fout.tell():
+                from pyaurora.output import csvheader
+                if csvheader(fout) != ['utc'] + list(ops):
+                    a.error('{0} has other fields (eg --detect-anomalies'
+                            ' changed the poll), use a new --csv'
+                            ' name'.format(csvname))
+            if opt.csv_index:
+                from pyaurora.csvindex import CSVIndex
+                index = CSVIndex(csvname)
+            else:
+                index = None
+            toutput = sinks.make('csv', fout, index=index)
     else:
-        toutput = pv.prettyprint()
+        toutput = sinks.make('pretty')
+
+    if opt.detect_anomalies:
+        toutput = pv.detectanomalies(toutput, alerts=pv.tolog(),
+                limits=limits, maxrates=maxrates)
 
+    outputs = [('csv' if opt.csv else 'pretty', toutput)]
 
-    with skt.create_connection((opt.host, opt.port), 
-            opt.connect_timeout) as sock:
+    if opt.archive:
+        arcname = dt.datetime.now().strftime(opt.archive)
+        try:
+            outputs.append(('archive', sinks.make('archive',
+                    open(arcname, 'ab'), ops)))
+        except ValueError as e:
+            # other fields or not an archive at all
+            a.error('cannot append to {0} ({1}), use a new --archive'
+                    ' name'.format(arcname, e))
+
+    if opt.shm:
+        outputs.append(('shm', sinks.make('shm', opt.shm, ops,
+                'inv{0}'.format(opt.inv_addr))))
+
+    if opt.metrics_port:
+        metrics.serve(opt.metrics_port)
+    if opt.metrics_log:
+        metrics.logdump(opt.metrics_log)
+
+    if opt.queue:
+        outputs, workers = queueoutputs(outputs, opt.queue, opt.overflow)
+    else:
+        workers = []
+    if len(outputs) == 1:
+        toutput = outputs[0][1]
+    else:
+        toutput = pv.tee([target for name, target in outputs])
+    toutput = sinks.make('metered', toutput, 'output')
+
+    if opt.adaptive:
+        from pyaurora.scheduler import (AdaptiveInterval, adapt,
+                adaptivescheduler)
+        controller = AdaptiveInterval(opt.min_interval, opt.max_interval)
+        toutput = adapt(toutput, controller)
+
+    if opt.replay:
+        from pyaurora.capture import ReplaySocket
+        conn = ReplaySocket(open(opt.replay, 'rb'), speed=opt.replay_speed)
+        readdelay = 0
+    elif opt.gateway:
+        host, _, port = opt.gateway.rpartition(':')
+        conn = skt.create_connection((host, int(port)), opt.connect_timeout)
+        # the gateway applies the read delay, recv just waits for the answer
+        readdelay = 0
+    else:
+        conn = skt.create_connection((opt.host, opt.port),
+                opt.connect_timeout)
+        readdelay = opt.read_delay
+
+    with conn as sock:
 
         if opt.default_timeout:
             sock.settimeout(opt.default_timeout)
 
+        if opt.capture:
+            from pyaurora.capture import CaptureSocket
+            sock = CaptureSocket(sock, open(opt.capture, 'ab'))
+
         inverterrdr = ft.partial(pv.execcmd, sock, opt.inv_addr, 
-                readdelay=opt.read_delay)
+                readdelay=readdelay)
+        poll = gatewaypoll if opt.gateway else inverterpoll
 
         try:
-            if opt.loop_interval:
-                pv.scheduler(opt.loop_interval, inverterpoll,
-                    inverterrdr=inverterrdr, operations=operations,
+            if opt.replay:
+                replaypolls(inverterrdr, ops, target=toutput)
+            elif opt.adaptive:
+                adaptivescheduler(controller, poll,
+                    inverterrdr=inverterrdr, operations=ops,
+                    target=toutput)
+            elif opt.loop_interval:
+                pv.scheduler(opt.loop_interval, poll,
+                    inverterrdr=inverterrdr, operations=ops,
                     target=toutput)
             else:
-                inverterpoll(inverterrdr, operations, target=toutput)
+                poll(inverterrdr, ops, target=toutput)
 
         except skt.timeout:
             log.error('Socket timed out, application will exit')
             if opt.backoff:
                 log.info('Backing off for {0} seconds.'.format(opt.backoff))
                 time.sleep(opt.backoff)
+        except EOFError:
+            log.info('End of replay')
         except KeyboardInterrupt:
             log.warning('Ctrl-C received, application will exit')
+        finally:
+            if opt.capture:
+                # closes the capture file, the socket is closed again below
+                sock.close()
+
+    for worker in workers:
+        worker.close(timeout=10)
+        log.info('{0} output stats: {1}'.format(worker.name, worker.stats()))
 
     log.info('aurora exiting')
 
@@ -8,11 +8,16 @@ Aurora zmq receiver subscribes to ZMQ URL and processes JSON.
 
 
 import sys
+import logging
 from argparse import ArgumentParser
 import zmq
 import pyaurora as pv
-from pyaurora.cozmq import fromzmq
-from pyaurora.torest import torest
+from pyaurora import sinks
+from pyaurora.cozmq import fromzmqpoll, setsockopts
+from pyaurora.wire import wirecodecs, getcodec
+
+
+log = logging.getLogger('aurora')
 
 
 def main():
@@ -20,17 +25,54 @@ def main():
     a = ArgumentParser()
     a.add_argument('--sub-url', default='tcp://127.0.0.1:8080',
             help='''Specify a zeromq URL to receive JSON to (%(default)s).''')
+    a.add_argument('--codec', choices=sorted(wirecodecs),
+            help='''Decode samples with a :mod:`pyaurora.wire` codec, this must
+match the publisher.''')
+    a.add_argument('--hwm', type=int, default=1000,
+            help='''zeromq receive high water mark (%(default)s).''')
+    a.add_argument('--max-batch', type=int, default=100,
+            help='''Maximum number of queued messages handled per wakeup
+(%(default)s).''')
+    a.add_argument('--rest-url', default='http://obiwan.home.metrak.com:8888/aurora',
+            help='''Post data to this URL (%(default)s).''')
+    a.add_argument('--post-batch', type=int, default=1,
+            help='''Post up to this many samples per request as a JSON array
+(%(default)s).''')
+    a.add_argument('--post-queue', type=int, default=10000,
+            help='''Samples held while the web service is slow or down, beyond
+this they are dropped (%(default)s).''')
+    a.add_argument('--spool',
+            help='''Spool samples to this directory so they survive outages of
+the web service and restarts, they are replayed once it is reachable.''')
     opt = a.parse_args()
 
+    pv.startlogging()
+
     #sink = pv.tostream(flush=True)
-    sink = torest('http://obiwan.home.metrak.com:8888/aurora', 'inverter_data')
+    rest = sinks.make('http', opt.rest_url, 'inverter_data',
+            batchsize=opt.post_batch, maxsize=opt.post_queue, spool=opt.spool)
+    sink = rest
 
     context = zmq.Context()
     zock = context.socket(zmq.SUB)
+    setsockopts(zock, hwm=opt.hwm, linger=0)
     zock.connect(opt.sub_url)
     zock.setsockopt_string(zmq.SUBSCRIBE, '')
 
-    fromzmq(zock, sink)
+    if opt.codec:
+        codec = getcodec(opt.codec, pv.pollops)
+        sink = sinks.make('json', sink)
+    else:
+        codec = None
+
+    try:
+        fromzmqpoll(zock, pv.unbatch(sink), codec=codec,
+                maxbatch=opt.max_batch)
+    except KeyboardInterrupt:
+        log.warning('Ctrl-C received, application will exit')
+    finally:
+        rest.close(timeout=10)
+        log.info('post stats: {0}'.format(rest.stats()))
 
     log.info('aurout exiting')
 
@@ -0,0 +1,79 @@
+#!/usr/local/bin/python3.4
+
+'''
+Aurora live push server, subscribes to a zeromq URL and pushes each sample
+to dashboards over Server-Sent Events (``/events``) and WebSocket
+(``/ws``).  See :mod:`pyaurora.push`.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import asyncio
+import logging
+import threading
+from argparse import ArgumentParser
+import zmq
+import pyaurora as pv
+from pyaurora import metrics
+from pyaurora.cozmq import fromzmqpoll, setsockopts
+from pyaurora.push import PushServer
+from pyaurora.wire import wirecodecs, getcodec
+
+
+log = logging.getLogger('aurora')
+
+
+def main():
+
+    a = ArgumentParser()
+    a.add_argument('--sub-url', default='tcp://127.0.0.1:8080',
+            help='''zeromq URL to receive samples from (%(default)s).''')
+    a.add_argument('--codec', choices=sorted(wirecodecs),
+            help='''Decode samples with a :mod:`pyaurora.wire` codec, this must
+match the publisher.''')
+    a.add_argument('--listen', default='127.0.0.1',
+            help='Address to accept dashboards on (%(default)s).')
+    a.add_argument('--port', type=int, default=8081,
+            help='HTTP port (%(default)s).')
+    a.add_argument('--client-queue', type=int, default=16,
+            help='''Samples queued per client before it is dropped as too
+slow (%(default)s).''')
+    a.add_argument('--metrics-port', type=int,
+            help='Serve Prometheus metrics on this port.')
+    opt = a.parse_args()
+
+    pv.startlogging()
+    log.info('aurpush starting')
+    log.debug(opt)
+
+    if opt.metrics_port:
+        metrics.serve(opt.metrics_port)
+
+    server = PushServer(maxqueue=opt.client_queue)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(server.start(opt.port, addr=opt.listen))
+
+    context = zmq.Context()
+    zock = context.socket(zmq.SUB)
+    setsockopts(zock, linger=0)
+    zock.connect(opt.sub_url)
+    zock.setsockopt_string(zmq.SUBSCRIBE, '')
+    # JSON strings are pushed as received, no decode and re-encode
+    codec = getcodec(opt.codec, pv.pollops) if opt.codec else None
+    threading.Thread(target=fromzmqpoll, name='zmq', daemon=True,
+            args=(zock, pv.unbatch(server)), kwargs={'codec': codec}).start()
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        log.warning('Ctrl-C received, application will exit')
+    finally:
+        loop.close()
+
+    log.info('aurpush exiting')
+
+
+if __name__ == '__main__':
+    main()
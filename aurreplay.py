@@ -0,0 +1,156 @@
+#!/usr/local/bin/python3.4
+
+'''
+Replay archived samples (CSV, SQLite or binary archive) through an output
+sink to measure its throughput, no inverter or adapter needed.  See
+:mod:`pyaurora.replay`.
+
+As fast as possible, 20 synthetic inverters, into ZeroMQ::
+
+    aurreplay.py --speed 0 --inverters 20 --sink zmq aurora_2015-07-*.csv
+
+The http sink posts on a background thread so ``rate`` only says how fast
+samples were queued, the ``delivered`` stats say how many were posted (or
+failed or were dropped) by the time the queue drained, and how fast.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import sys
+import json
+import time
+import logging
+import datetime as dt
+from argparse import ArgumentParser
+import pyaurora as pv
+from pyaurora import sinks
+from pyaurora.replay import readrows, replay
+
+
+log = logging.getLogger('aurora')
+
+
+sinkchoices = ('null', 'json', 'csv', 'zmq', 'sql', 'http')
+
+
+class NullSink(object):
+
+    def send(self, d):
+        pass
+
+
+def makesink(opt):
+    '''
+    Return (target, close) for the chosen sink, `close` (if not None)
+    returns the stats of a sink that delivers in the background.
+    '''
+    if opt.sink == 'null':
+        return NullSink(), None
+    if opt.sink == 'json':
+        return sinks.make('json', NullSink()), None
+    if opt.sink == 'csv':
+        # None is stdout, which can't tell()
+        fout = open(opt.out, 'a') if opt.out else None
+        return sinks.make('csv', fout), None
+    if opt.sink == 'zmq':
+        import zmq
+        from pyaurora.cozmq import setsockopts
+
+        zock = zmq.Context().socket(zmq.PUB)
+        setsockopts(zock, linger=0)
+        zock.bind(opt.pub_url)
+        return sinks.make('json', sinks.make('zmq', zock, drop=True)), None
+    if opt.sink == 'sql':
+        import sqlite3
+
+        conn = sqlite3.connect(opt.out or 'replay.db')
+        target = sinks.make('sql', conn, replace=True)
+
+        def close():
+            target.send(None)
+
+        return target, close
+    if opt.sink == 'http':
+        rest = sinks.make('http', opt.rest_url, 'inverter_data')
+
+        def close():
+            # waits for what is queued to be posted
+            rest.close(timeout=opt.drain_timeout)
+            stats = rest.stats()
+            log.info('post stats: {0}'.format(stats))
+            return stats
+
+        # HTTPSink posts JSON strings
+        return sinks.make('json', rest), close
+    raise ValueError(opt.sink)
+
+
+def main():
+
+    def when(s):
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+            try:
+                return dt.datetime.strptime(s, fmt)
+            except ValueError:
+                pass
+        raise ValueError(s)
+
+    a = ArgumentParser()
+    a.add_argument('paths', nargs='+',
+            help='CSV, SQLite (.db) or binary archive (.bin) files.')
+    a.add_argument('--speed', type=float, default=0.0,
+            help='''Multiple of real time, 0 for as fast as possible
+(%(default)s).''')
+    a.add_argument('--inverters', type=int, default=1,
+            help='Synthetic inverters per archived sample (%(default)s).')
+    a.add_argument('--start', type=when, help='UTC, eg "2015-07-20 12:00".')
+    a.add_argument('--end', type=when, help='UTC, exclusive.')
+    a.add_argument('--limit', type=int,
+            help='Stop after this many archived samples.')
+    a.add_argument('--sink', choices=sinkchoices, default='json',
+            help='''Where samples go, json encodes and discards
+(%(default)s).''')
+    a.add_argument('--out', help='Output file for the csv and sql sinks.')
+    a.add_argument('--pub-url', default='tcp://127.0.0.1:8080',
+            help='''zeromq URL for the zmq sink (%(default)s).''')
+    a.add_argument('--rest-url', default='http://127.0.0.1:8888/aurora',
+            help='''URL for the http sink (%(default)s).''')
+    a.add_argument('--drain-timeout', type=float, default=30.0,
+            help='''Seconds to wait for the http sink to post what is queued
+at the end (%(default)s).''')
+    opt = a.parse_args()
+
+    pv.startlogging()
+    log.debug(opt)
+
+    target, close = makesink(opt)
+    sinkstats = None
+    t0 = time.perf_counter()
+    try:
+        stats = replay(readrows(sorted(opt.paths), opt.start, opt.end),
+                target, speed=opt.speed, inverters=opt.inverters,
+                limit=opt.limit)
+    except KeyboardInterrupt:
+        log.warning('Ctrl-C received, application will exit')
+        return
+    finally:
+        if close is not None:
+            sinkstats = close()
+
+    if sinkstats is not None:
+        seconds = time.perf_counter() - t0
+        stats['delivered'] = {
+            'processed': sinkstats['processed'],
+            'failed': sinkstats['failed'],
+            'dropped': sinkstats['dropped'],
+            'queued': sinkstats['queued'],
+            'seconds': seconds,
+            'rate': sinkstats['processed'] / seconds if seconds else None,
+            }
+
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -40,47 +40,21 @@ to inspect the data.
 import sys
 import csv
 import socket as skt
-import zmq
 import time
 import datetime as dt
 import functools as ft
 from collections import OrderedDict
 from argparse import ArgumentParser
 import pyaurora as pv
-from pyaurora.cozmq import tozmq
+from pyaurora import sinks, catalog
+from pyaurora.wire import wirecodecs, getcodec
 import logging
-from logging.config import dictConfig
 
 
-dictConfig(pv.logconfig)
 log = logging.getLogger('aurora')
 
 
-operations = (
-        #'getTime',
-        #'getFirmwareRel', 
-        'gridPowerAll', 
-        'powerPeakToday',
-        'dailyEnergy',
-        'weeklyEnergy',
-        #'last7Energy',
-        'partialEnergy',
-        'getEnergy10',
-        'frequencyAll', 
-        'gridVoltageAll', 
-        'gridVoltageAverage', 
-        'gridCurrentAll', 
-        'bulkVoltageDcDc', 
-        'in1Voltage',
-        'in1Current',
-        'in2Voltage',
-        'in2Current',
-        'pin1All', 
-        'pin2All',
-        'iLeakDcDc', 
-        'iLeakInverter', 
-        'boosterTemp',
-    )
+operations = pv.pollops
 '''The inverter operations to be polled in each cycle.'''
 
 
@@ -91,29 +65,49 @@ def mockinverterpoll(dictreader, operations, target):
     with real data, it will sequentially read through the file
     provided.
 
-    :param dictreader: function that can issue commands and return
-        response.  In general it accepts a command and subcommand (which
-        may be None).
-    :param operations: sequence of strings.  The current implementation 
-        looks up the relevant command, subcommand, decoder and formatter
-        to poll that value.
+    Each row is served by a :class:`~pyaurora.catalog.SimulatedInverter`
+    and polled like the real one, so values have the inverter's types and
+    precision.  Fields missing from the row are None.
+
+    :param dictreader: :class:`csv.DictReader` of the file.
+    :param operations: sequence of field names from
+        :data:`pyaurora.catalog.fields`.
     :param target: coroutine that accepts a dict (actually an ordered dict).
     '''
     now = dt.datetime.now()
-    log.debug('polling at {0}'.format(now))
+    log.debug('polling at %s', now)
 
     od = OrderedDict()
     utc = dt.datetime.utcnow()
     od['utc'] = utc
 
-    data = next(dictreader)
-
+    values = catalog.fromstrings(next(dictreader))
+    inverterrdr = ft.partial(pv.execcmd, catalog.SimulatedInverter(values),
+            2, readdelay=0)
+    catalog.plan(operations).poll(inverterrdr, od)
     for ssc in operations:
-        od[ssc] = data.get(ssc, None)
+        if ssc not in values:
+            od[ssc] = None
 
     target.send(od)
 
 
+def compressionrules(deadband, swingingdoor):
+    '''
+    Return :func:`pyaurora.compress.compress` rules from FIELD=N strings.
+    '''
+    from pyaurora.compress import Deadband, SwingingDoor
+
+    rules = {}
+    for cls, specs in ((Deadband, deadband), (SwingingDoor, swingingdoor)):
+        for spec in specs:
+            field, _, n = spec.partition('=')
+            if field not in operations:
+                raise ValueError('unknown field: {0}'.format(field))
+            rules[field] = cls(float(n))
+    return rules
+
+
 def main():
 
     a = ArgumentParser()
@@ -144,29 +138,75 @@ may contain `strftime` format strings.  If the string is "stdout" the CSV
 output will be directed to `sys.stdout`.''')
     a.add_argument('--pub-url', default='tcp://127.0.0.1:8080',
             help='''Specify a zeromq URL to publish JSON to (%(default)s).''')
+    a.add_argument('--codec', choices=sorted(wirecodecs),
+            help='''Publish samples using a :mod:`pyaurora.wire` codec rather
+than JSON strings.''')
+    a.add_argument('--hwm', type=int, default=1000,
+            help='''zeromq high water mark, messages beyond this are dropped
+(%(default)s).''')
+    a.add_argument('--linger', type=int, default=0,
+            help='''Milliseconds to keep unsent messages on exit (%(default)s).''')
+    a.add_argument('--batch', type=int, default=1,
+            help='''Publish this many samples per multipart message
+(%(default)s).''')
+    a.add_argument('--batch-delay', type=float, default=30.0,
+            help='''Publish a partial batch once its oldest sample is this
+many seconds old (%(default)s).  On exit the partial batch is published and
+kept for at least a second whatever --linger is.''')
+    a.add_argument('--deadband', action='append', default=[],
+            metavar='FIELD=N', help='''Only publish FIELD when it moves more
+than N from the last value published.  May be repeated, JSON only.''')
+    a.add_argument('--swinging-door', action='append', default=[],
+            metavar='FIELD=N', help='''Swinging door compression of FIELD
+with deviation N.  May be repeated, JSON only.''')
+    a.add_argument('--keyframe', type=int, default=360,
+            help='''With compression publish every field once every this many
+samples (%(default)s).''')
     a.add_argument('csv_in', nargs='?', default='aurora_2015-07-20.csv',
             help='''Specify and input CSV file for testing (%(default)s).''')
     opt = a.parse_args()
 
+    pv.startlogging()
     log.info('aurora starting')
+    batcher = None
     log.debug(opt)
 
+    try:
+        rules = compressionrules(opt.deadband, opt.swinging_door)
+    except ValueError as e:
+        a.error(str(e))
+    if rules and (opt.csv or opt.codec):
+        a.error('compression needs JSON output')
+
     if opt.csv:
         if opt.csv == 'stdout':
-            toutput = pv.tocsv(None)
+            toutput = sinks.make('csv', None)
         else:
             csvname = dt.datetime.now().strftime(opt.csv)
-            toutput = pv.tocsv(open(csvname, 'a'))
+            toutput = sinks.make('csv', open(csvname, 'a'))
     else:
         if opt.pub_url:
+            import zmq
+            from pyaurora.cozmq import setsockopts
+
             context = zmq.Context()
             zock = context.socket(zmq.PUB)
+            setsockopts(zock, hwm=opt.hwm, linger=opt.linger)
             zock.bind(opt.pub_url)
-            sink = tozmq(zock)
+            codec = getcodec(opt.codec, operations) if opt.codec else None
+            if opt.batch > 1:
+                toutput = batcher = sinks.make('zmqbatch', zock, opt.batch,
+                        maxdelay=opt.batch_delay, codec=codec, drop=True)
+            else:
+                toutput = sinks.make('zmq', zock, codec=codec, drop=True)
+            if codec is None:
+                toutput = sinks.make('json', toutput)
         else:
-            sink = pv.tostream()
+            toutput = sinks.make('json', sinks.make('stream'))
 
-        toutput = pv.tojson(sink)
+    if rules:
+        toutput = sinks.make('compress', toutput, rules,
+                keyframe=opt.keyframe)
 
     with skt.create_connection((opt.host, opt.port), 
             opt.connect_timeout) as sock:
@@ -191,6 +231,12 @@ output will be directed to `sys.stdout`.''')
                 time.sleep(opt.backoff)
         except KeyboardInterrupt:
             log.warning('Ctrl-C received, application will exit')
+        finally:
+            if rules:
+                toutput.send(None)
+            if batcher is not None:
+                batcher.close()
+                zock.close(linger=max(opt.linger, 1000))
 
     log.info('aurora exiting')
 
@@ -0,0 +1,5 @@
+'''
+Benchmarks for pyaurora.
+
+Run these from the repository root, eg ``python -m bench.jsonenc``.
+'''
@@ -0,0 +1,49 @@
+'''
+Compare JSON encoders used by :func:`pyaurora.output.tojson`.
+
+``python -m bench.jsonenc [-n SAMPLES]``
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import time
+from argparse import ArgumentParser
+from pyaurora.dateawarejsonenc import DateAwareJSONEncoder
+from pyaurora.samplejsonenc import SampleJSONEncoder, orjson
+from .samples import makesamples
+
+
+def bench(enc, samples):
+    t0 = time.perf_counter()
+    for d in samples:
+        enc.encode(d)
+    return time.perf_counter() - t0
+
+
+def main():
+    a = ArgumentParser()
+    a.add_argument('-n', type=int, default=100000,
+            help='Number of samples to encode (%(default)s).')
+    opt = a.parse_args()
+
+    samples = list(makesamples(opt.n))
+
+    encoders = [
+        ('DateAwareJSONEncoder', DateAwareJSONEncoder()),
+        ('SampleJSONEncoder', SampleJSONEncoder(useorjson=False)),
+        ]
+    if orjson is not None:
+        encoders.append(('SampleJSONEncoder(orjson)',
+                SampleJSONEncoder(useorjson=True)))
+
+    base = None
+    for name, enc in encoders:
+        elapsed = bench(enc, samples)
+        base = base or elapsed
+        print('{0:28s} {1:10.0f} samples/s {2:6.2f}x'.format(
+                name, opt.n / elapsed, base / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+'''
+Throughput of the output pipelines used by ``aurora.py`` and ``aurx.py``.
+
+Each pipeline runs in its own child process so peak RSS is its own, and is
+fed the same synthetic samples from :func:`~bench.samples.makesamples`.
+Reported per pipeline: samples/s (until the last sample has left the
+pipeline, for the zmq and http ones that is when the receiver has it),
+median and p99 time per ``send()`` and peak RSS.
+
+ZeroMQ pipelines publish over ``inproc://`` to a receiver thread, HTTP
+ones post to a stub server on localhost.  Pipelines whose dependencies
+aren't installed are skipped.
+
+Results are tagged with the git commit, use ``--save`` to append them to a
+JSON lines file and ``--compare`` to show the change from the most recent
+results of a different commit in such a file::
+
+    python -m bench.pipeline --save bench.jsonl --compare bench.jsonl
+
+``python -m bench.pipeline [-n SAMPLES] [PIPELINE ...]``
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import threading
+import subprocess
+from argparse import ArgumentParser, SUPPRESS
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Null(object):
+
+    def send(self, d):
+        pass
+
+
+def _devnull():
+    return open(os.devnull, 'w')
+
+
+def _zmq(codec=None, batch=1):
+    import zmq
+    from pyaurora.cozmq import tozmq, tozmqbatch
+
+    ctx = zmq.Context()
+    pub = ctx.socket(zmq.PAIR)
+    pub.bind('inproc://bench')
+    sub = ctx.socket(zmq.PAIR)
+    sub.connect('inproc://bench')
+    received = [0]
+
+    def drain():
+        while True:
+            frames = sub.recv_multipart(copy=False)
+            received[0] += len(frames)
+
+    threading.Thread(target=drain, daemon=True).start()
+    if batch > 1:
+        target = batcher = tozmqbatch(pub, batch, codec=codec)
+    else:
+        target = tozmq(pub, codec=codec)
+        batcher = None
+    if codec is None:
+        from pyaurora.output import tojson
+        target = tojson(target)
+
+    def done(n):
+        if batcher is not None:
+            # the last partial batch is only sent on flush
+            batcher.flush()
+        return _wait(lambda: received[0] >= n)
+
+    return target, done
+
+
+def _httpstub():
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    received = [0]
+
+    class Handler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            # only JSON samples count, a form encoded dict has no "utc"
+            received[0] += body.count(b'"utc"')
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:{0}/aurora'.format(server.server_port), received
+
+
+def _http(batchsize):
+    import requests  # noqa, skip the pipeline if missing
+    from pyaurora.httpsink import HTTPSink
+    from pyaurora.output import tojson
+
+    url, received = _httpstub()
+    sink = HTTPSink(url, batchsize=batchsize, maxsize=1000000,
+            policy='block')
+
+    def done(n):
+        sink.close()
+        return received[0] >= n
+
+    # HTTPSink posts JSON strings, like the zmq pipelines
+    return tojson(sink), done
+
+
+def _wait(cond, timeout=60.0):
+    t0 = time.monotonic()
+    while not cond() and time.monotonic() - t0 < timeout:
+        time.sleep(0.001)
+    return cond()
+
+
+def _pipelines():
+    import pyaurora as pv
+    from pyaurora.samplejsonenc import SampleJSONEncoder
+    from pyaurora.command import pollops
+    from pyaurora.wire import StructCodec
+
+    return {
+        'csv': lambda: (pv.tocsv(_devnull()), None),
+        'pretty': lambda: (pv.prettyprint(_devnull()), None),
+        'json': lambda: (pv.tojson(Null()), None),
+        'json-sample': lambda: (pv.tojson(Null(),
+                enc=SampleJSONEncoder()), None),
+        'json-orjson': lambda: (pv.tojson(Null(), enc=_orjson()), None),
+        'tee-csv-json': lambda: (pv.tee([pv.tocsv(_devnull()),
+                pv.tojson(Null())]), None),
+        'queued-csv': lambda: _queued(pv.tocsv(_devnull())),
+        'zmq-json': lambda: _zmq(),
+        'zmq-struct': lambda: _zmq(StructCodec(pollops)),
+        'zmq-struct-batch': lambda: _zmq(StructCodec(pollops), batch=10),
+        'http': lambda: _http(1),
+        'http-batch': lambda: _http(50),
+        }
+
+
+def _orjson():
+    import orjson  # noqa, skip the pipeline if missing
+    from pyaurora.samplejsonenc import SampleJSONEncoder
+
+    return SampleJSONEncoder(useorjson=True)
+
+
+def _queued(target):
+    from pyaurora.worker import queued
+
+    worker = queued(target, maxsize=1000000, policy='block')
+
+    def done(n):
+        worker.close()
+        return worker.processed >= n
+
+    return worker, done
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def runone(name, n):
+    '''
+    Run pipeline `name` in this process, returns a result dict.
+    '''
+    from .samples import makesamples
+
+    samples = list(makesamples(n))
+    warmup = list(makesamples(min(1000, n), seed=1))
+    try:
+        target, done = _pipelines()[name]()
+    except ImportError as e:
+        return {'pipeline': name, 'skipped': str(e)}
+
+    for d in warmup:
+        target.send(d)
+    expected = len(warmup) + n
+    latencies = []
+    perf_counter = time.perf_counter
+    t0 = perf_counter()
+    for d in samples:
+        t = perf_counter()
+        target.send(d)
+        latencies.append(perf_counter() - t)
+    delivered = done(expected) if done is not None else True
+    elapsed = perf_counter() - t0
+
+    latencies.sort()
+    return {
+        'pipeline': name,
+        'samples': n,
+        'rate': n / elapsed,
+        'p50': _percentile(latencies, 0.5),
+        'p99': _percentile(latencies, 0.99),
+        # kilobytes on linux, bytes on macOS
+        'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'complete': delivered,
+        }
+
+
+def gitcommit():
+    try:
+        out = subprocess.run(['git', 'describe', '--always', '--dirty'],
+                cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.decode().strip()
+
+
+def runall(names, n):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    for name in names:
+        out = subprocess.run([sys.executable, '-m', 'bench.pipeline',
+                '--child', '-n', str(n), name], cwd=ROOT, env=env,
+                stdout=subprocess.PIPE, check=True)
+        yield json.loads(out.stdout.decode())
+
+
+def baseline(path, commit):
+    '''
+    Most recent result per pipeline from a commit other than `commit`.
+    '''
+    results = {}
+    try:
+        with open(path) as fin:
+            for line in fin:
+                r = json.loads(line)
+                if r.get('commit') != commit and 'rate' in r:
+                    results[r['pipeline']] = r
+    except FileNotFoundError:
+        pass
+    return results
+
+
+def main():
+    a = ArgumentParser()
+    a.add_argument('pipelines', nargs='*',
+            help='Pipelines to run (all).')
+    a.add_argument('-n', type=int, default=20000,
+            help='Number of samples per pipeline (%(default)s).')
+    a.add_argument('--save', help='Append results to this JSON lines file.')
+    a.add_argument('--compare',
+            help='Compare with earlier results in this JSON lines file.')
+    a.add_argument('--list', action='store_true', help='List pipelines.')
+    a.add_argument('--child', action='store_true', help=SUPPRESS)
+    opt = a.parse_args()
+
+    if opt.child:
+        print(json.dumps(runone(opt.pipelines[0], opt.n)))
+        return
+
+    names = opt.pipelines or list(_pipelines())
+    if opt.list:
+        print('\n'.join(names))
+        return
+
+    commit = gitcommit()
+    base = baseline(opt.compare, commit) if opt.compare else {}
+    info = {'commit': commit, 'python': platform.python_version(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    print('commit {commit}  python {python}  {machine}'.format(**info))
+    print('{0:18s} {1:>12s} {2:>10s} {3:>10s} {4:>10s}'.format('pipeline',
+            'samples/s', 'p50 us', 'p99 us', 'rss kB'))
+
+    for r in runall(names, opt.n):
+        r.update(info)
+        if 'skipped' in r:
+            print('{0:18s} skipped: {1}'.format(r['pipeline'], r['skipped']))
+            continue
+        line = '{0:18s} {1:12.0f} {2:10.1f} {3:10.1f} {4:10d}'.format(
+                r['pipeline'], r['rate'], 1e6 * r['p50'], 1e6 * r['p99'],
+                r['maxrss'])
+        if not r['complete']:
+            line += '  (incomplete delivery)'
+        b = base.get(r['pipeline'])
+        if b is not None:
+            line += '  {0:+.1%} vs {1}'.format(r['rate'] / b['rate'] - 1,
+                    b['commit'])
+        print(line)
+        if opt.save:
+            with open(opt.save, 'a') as fout:
+                fout.write(json.dumps(r) + '\n')
+
+
+if __name__ == '__main__':
+    main()
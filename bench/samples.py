@@ -0,0 +1,67 @@
+'''
+Synthetic inverter samples for the benchmarks.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import math
+import struct
+import random
+import datetime as dt
+from collections import OrderedDict
+from pyaurora.command import pollops
+
+
+fields = pollops
+
+
+def makesamples(n, interval=10, start=None, seed=0):
+    '''
+    Generate `n` plausible looking samples `interval` seconds apart.
+    '''
+    rnd = random.Random(seed)
+    if start is None:
+        start = dt.datetime(2015, 7, 20, 6, 0, 0)
+
+    for i in range(n):
+        utc = start + dt.timedelta(seconds=i * interval)
+        sun = max(0.0, math.sin(math.pi * ((i * interval) % 86400) / 43200))
+        od = OrderedDict()
+        od['utc'] = utc
+        for f in fields:
+            od[f] = rnd.uniform(0.9, 1.1) * (1000.0 * sun + 1.0)
+        od['getEnergy10'] = int(od['getEnergy10'])
+        yield od
+
+
+class FakeInverterSocket(object):
+    '''
+    Socket stand-in that answers Aurora commands with plausible values,
+    for driving :func:`pyaurora.protocol.execcmd` without an inverter.
+    '''
+
+    def __init__(self, seed=0):
+        self.rnd = random.Random(seed)
+        self.resp = b''
+
+    def send(self, buf):
+        from pyaurora.protocol import addcrc
+        from pyaurora.command import Cmd
+
+        cmd = buf[1]
+        if cmd == Cmd.getDsp or cmd == Cmd.getCumFloatEnergy:
+            value = struct.pack('!f', self.rnd.uniform(0, 1000))
+        else:
+            value = struct.pack('!l', self.rnd.randint(0, 100000))
+        self.resp = bytes(addcrc(bytearray(b'\x00\x06' + value)))
+        return len(buf)
+
+    def recv(self, n):
+        return self.resp[:n]
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,83 @@
+'''
+Time from process start to the first completed poll.
+
+A capture of a single poll of :data:`pyaurora.command.pollops` is made
+against :class:`~bench.samples.FakeInverterSocket` and ``aurora.py`` is run
+repeatedly to replay it as fast as possible, the process exits at the end
+of the capture.  The import time of :mod:`pyaurora` alone is also reported.
+The target applies to the time above that of starting a bare interpreter.
+
+``python -m bench.startup [-n RUNS]``
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+import subprocess
+from argparse import ArgumentParser
+from pyaurora.capture import CaptureSocket
+from pyaurora.command import allops, pollops
+from pyaurora.protocol import execcmd
+from .samples import FakeInverterSocket
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET = 0.1
+
+
+def makecapture(path):
+    with open(path, 'wb') as fout:
+        sock = CaptureSocket(FakeInverterSocket(), fout)
+        for op in pollops:
+            cmd, sc, decoder = allops[op]
+            execcmd(sock, 2, cmd, sc, readdelay=0)
+
+
+def timeit(args, cwd, runs):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(args, cwd=cwd, env=env, check=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def report(name, times):
+    print('{0:24s} median {1:6.1f} ms  min {2:6.1f} ms'.format(name,
+            1000 * statistics.median(times), 1000 * min(times)))
+
+
+def main():
+    a = ArgumentParser()
+    a.add_argument('-n', type=int, default=10,
+            help='Number of runs (%(default)s).')
+    opt = a.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        capture = os.path.join(tmp, 'poll.cap')
+        makecapture(capture)
+
+        base = timeit([sys.executable, '-c', 'pass'], tmp, opt.n)
+        imp = timeit([sys.executable, '-c', 'import pyaurora'], tmp, opt.n)
+        poll = timeit([sys.executable, os.path.join(ROOT, 'aurora.py'),
+                '--replay', capture, '--replay-speed', '0', '--csv', 'stdout'],
+                tmp, opt.n)
+
+    report('interpreter', base)
+    report('import pyaurora', imp)
+    report('aurora.py first poll', poll)
+    overhead = statistics.median(poll) - statistics.median(base)
+    print('overhead {0:.1f} ms, target {1:.0f} ms: {2}'.format(
+            1000 * overhead, 1000 * TARGET,
+            'ok' if overhead < TARGET else 'MISSED'))
+
+
+if __name__ == '__main__':
+    main()
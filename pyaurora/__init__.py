@@ -8,14 +8,59 @@ I set out to write something specific to my setup which is a PVI-6000 inverter
 with a WiFi to RS-485 converter.  The curtronics code can be made to work
 with this WiFi converter using the linux `socat` command.
 
+The names below are imported from their submodules on first use so that
+``import pyaurora`` stays cheap, optional backends (zmq, requests etc) are
+only imported by the modules that need them, see :mod:`pyaurora.sinks`.
+
 .. moduleauthor:: paul sorenson
 '''
 
 __version__ = '0.1'
 
-from .logconfig import *
-from .protocol import *
-from .command import *
+
+import importlib
+
+# imported eagerly because the function shadows its submodule
 from .scheduler import scheduler
-from .output import *
 
+
+_exports = {
+    'logconfig': ('logconfig', 'startlogging'),
+    'protocol': ('MAXRESP', 'GATEWAYERROR', 'CRCException', 'GatewayError',
+        'tolong', 'getlong', 'tofloat',
+        'getfloat', 'getstring', 'gettime', 'bytes2hex', 'word2bytearray',
+        'crc16', 'addcrc', 'stripcrc', 'pad', 'makecmd', 'execcmd'),
+    'command': ('floatfmt', 'Cmd', 'DspOp', 'CumulatedEnergy', 'allops',
+        'pollops'),
+    'output': ('coroutine', 'tee', 'unbatch', 'tostream', 'tolog',
+        'prettyprint',
+        'tocsv', 'tojson', 'bytes2str', 'detectanomalies', 'FieldStats'),
+    'dateawarejsonenc': ('DateAwareJSONEncoder',),
+    'samplejsonenc': ('SampleJSONEncoder',),
+    }
+
+_lazy = {name: module for module, names in _exports.items()
+        for name in names}
+
+__all__ = sorted(_lazy) + ['scheduler']
+
+
+def __getattr__(name):
+    module = _lazy.get(name)
+    if module is None:
+        try:
+            return importlib.import_module('.' + name, __name__)
+        except ModuleNotFoundError as e:
+            # only a missing submodule is a missing attribute, a submodule
+            # missing one of its dependencies should say so
+            if e.name != __name__ + '.' + name:
+                raise
+            raise AttributeError(
+                    'module {0!r} has no attribute {1!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy))
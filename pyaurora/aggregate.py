@@ -0,0 +1,205 @@
+
+'''
+:mod:`aggregate` - site totals from many inverter streams
+=========================================================
+
+An :class:`Aggregator` takes samples from several inverters (sources),
+puts each into a fixed time bucket by its ``utc`` and, once a bucket is
+complete, sends one site record downstream.  A bucket is complete when
+every expected source has reported, when a later bucket is complete or
+when it is more than `lateness` seconds old, whichever comes first.
+Samples for a bucket that has already been sent are counted as late and
+dropped.  Within a bucket the last sample from each source is used.
+
+A site record is an `OrderedDict`:
+
+``utc``
+    start of the bucket.
+``inverters``
+    number of sources that reported.
+``missing``
+    names of expected sources that did not.
+:data:`sumfields`
+    totals over the sources.
+:data:`meanfields`
+    means over the sources.
+:data:`maxfields`
+    maxima over the sources.
+``stringPowerMin``, ``stringPowerMax``, ``stringPowerMean``
+    statistics of the power of each string (input) of each inverter,
+    ``inNVoltage * inNCurrent``.
+``stringSpread``
+    ``(max - min) / mean`` of string power, a shaded or faulty string
+    shows up here.
+``weakestString``
+    ``source/inN`` of the string with least power.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import time
+import logging
+import datetime as dt
+from collections import OrderedDict
+from .metrics import registry
+
+
+log = logging.getLogger('aurora')
+
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+sumfields = ('gridPowerAll', 'gridCurrentAll', 'pin1All', 'pin2All',
+        'getEnergy10', 'dailyEnergy', 'weeklyEnergy', 'partialEnergy')
+'''Fields totalled over the site.'''
+
+meanfields = ('gridVoltageAll', 'frequencyAll')
+'''Fields averaged over the site.'''
+
+maxfields = ('boosterTemp', 'iLeakDcDc', 'iLeakInverter')
+'''Fields reported as the site maximum.'''
+
+strings = (('in1', 'in1Voltage', 'in1Current'),
+        ('in2', 'in2Voltage', 'in2Current'))
+'''Name, voltage and current field of each inverter input.'''
+
+
+_late = registry.counter('aurora_aggregate_late',
+        'Samples that arrived after their bucket was sent.')
+_incomplete = registry.counter('aurora_aggregate_incomplete',
+        'Buckets sent without every source.')
+
+
+def utcseconds(utc):
+    '''
+    Seconds since the epoch from a datetime, an ISO format string (as sent
+    by the JSON encoders) or a number.
+    '''
+    if isinstance(utc, dt.datetime):
+        return (utc - EPOCH).total_seconds()
+    if isinstance(utc, str):
+        fmt = '%Y-%m-%dT%H:%M:%S.%f' if '.' in utc else '%Y-%m-%dT%H:%M:%S'
+        return (dt.datetime.strptime(utc.replace(' ', 'T'), fmt) -
+                EPOCH).total_seconds()
+    return float(utc)
+
+
+def _float(v):
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if v != v else v
+
+
+class Aggregator(object):
+    '''
+    :param target: co-routine for site records.
+    :param sources: names of the sources expected in every bucket.
+    :param interval: bucket width in seconds.
+    :param lateness: seconds after the end of a bucket to wait for
+        missing sources.
+    '''
+
+    def __init__(self, target, sources, interval=10, lateness=5.0):
+        self.target = target
+        self.sources = list(sources)
+        self.interval = interval
+        self.lateness = lateness
+        self.buckets = {}
+        self.sent = None
+        self.late = 0
+
+    def send(self, item):
+        '''
+        Take a ``(source, sample)`` pair.
+        '''
+        source, d = item
+        try:
+            t = utcseconds(d['utc'])
+        except (KeyError, TypeError, ValueError):
+            log.warning('aggregate: bad utc from %s: %s', source, d.get('utc'))
+            return
+        start = t - t % self.interval
+        if self.sent is not None and start <= self.sent:
+            self.late += 1
+            _late.inc()
+            log.debug('aggregate: late sample from %s for %s', source, start)
+            return
+
+        bucket = self.buckets.setdefault(start, OrderedDict())
+        bucket[source] = d
+        if all(s in bucket for s in self.sources):
+            # everything older goes first so records stay in time order
+            self.advance(start + self.interval + self.lateness - 1e-6)
+            self._emit(start)
+
+    def advance(self, now=None):
+        '''
+        Send every bucket that ended more than `lateness` seconds before
+        `now` (seconds since the epoch, default the current time).  Call
+        this periodically so buckets are sent even when sources go quiet.
+        '''
+        if now is None:
+            now = time.time()
+        for start in sorted(self.buckets):
+            if start + self.interval + self.lateness > now:
+                break
+            self._emit(start)
+
+    def flush(self):
+        '''
+        Send every bucket now.
+        '''
+        for start in sorted(self.buckets):
+            self._emit(start)
+
+    def _emit(self, start):
+        bucket = self.buckets.pop(start)
+        self.sent = start if self.sent is None else max(self.sent, start)
+        record = self.combine(start, bucket)
+        if record['missing']:
+            _incomplete.inc()
+        self.target.send(record)
+
+    def combine(self, start, bucket):
+        '''
+        Return the site record for one bucket, a dict of source: sample.
+        '''
+        od = OrderedDict()
+        od['utc'] = EPOCH + dt.timedelta(seconds=start)
+        od['inverters'] = len(bucket)
+        od['missing'] = [s for s in self.sources if s not in bucket]
+
+        for f in sumfields + meanfields + maxfields:
+            values = [v for v in (_float(d.get(f)) for d in bucket.values())
+                    if v is not None]
+            if not values:
+                od[f] = None
+            elif f in sumfields:
+                od[f] = sum(values)
+            elif f in meanfields:
+                od[f] = sum(values) / len(values)
+            else:
+                od[f] = max(values)
+
+        powers = []
+        for source, d in bucket.items():
+            for name, vfield, ifield in strings:
+                v, i = _float(d.get(vfield)), _float(d.get(ifield))
+                if v is not None and i is not None:
+                    powers.append((v * i, '{0}/{1}'.format(source, name)))
+        if powers:
+            pmin, pmax = min(powers), max(powers)
+            mean = sum(p for p, name in powers) / len(powers)
+            od['stringPowerMin'] = pmin[0]
+            od['stringPowerMax'] = pmax[0]
+            od['stringPowerMean'] = mean
+            od['stringSpread'] = (pmax[0] - pmin[0]) / mean if mean else None
+            od['weakestString'] = pmin[1]
+        else:
+            for k in ('stringPowerMin', 'stringPowerMax', 'stringPowerMean',
+                    'stringSpread', 'weakestString'):
+                od[k] = None
+        return od
@@ -0,0 +1,279 @@
+
+'''
+:mod:`analytics` - daily statistics over archived samples
+=========================================================
+
+:func:`readsamples` streams CSV files written by
+:func:`~pyaurora.output.tocsv`, the SQLite database loaded by
+`auroraload.py` and binary archives written by
+:func:`~pyaurora.wire.toarchive` as chunks of NumPy arrays.  :func:`daily`
+reduces those chunks to one record per day:
+
+``samples``
+    number of samples.
+``yield``
+    inverter reported daily energy (max of ``dailyEnergy``, Wh).
+``energy``
+    integral of ``gridPowerAll`` over time (Wh), gaps longer than `maxgap`
+    seconds are not integrated.
+``peakpower``
+    max ``gridPowerAll`` (W).
+``efficiency``
+    sum of ``gridPowerAll`` over sum of ``pin1All`` + ``pin2All`` while
+    generating.
+``imbalance``
+    mean of ``|P1 - P2| / (P1 + P2)`` where ``Pn = inNVoltage * inNCurrent``,
+    while generating.
+``maxtemp``
+    max ``boosterTemp``.
+``hotfraction``
+    fraction of generating samples with ``boosterTemp`` at or above
+    `deratetemp`.
+``hotefficiency``
+    efficiency over those hot samples, compare with ``efficiency`` to see
+    temperature derating.
+
+Samples must be in time order within and across files.  Run as a script
+to print the daily records as CSV::
+
+    python -m pyaurora.analytics aurora_2015-*.csv
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import os
+import csv
+import sqlite3
+from collections import OrderedDict
+from itertools import islice
+import numpy as np
+from .wire import archiveheader
+
+
+CHUNKSIZE = 100000
+
+
+def _floats(col):
+    try:
+        return np.array(col, dtype=np.float64)
+    except ValueError:
+        return np.array([v if v not in ('', None) else 'nan' for v in col],
+                dtype=np.float64)
+
+
+def _utc(col):
+    return np.array(col, dtype='datetime64[us]')
+
+
+def _chunk(names, rows):
+    cols = list(zip(*rows))
+    chunk = {'utc': _utc(cols[0])}
+    for name, col in zip(names[1:], cols[1:]):
+        chunk[name] = _floats(col)
+    return chunk
+
+
+def readcsv(path, chunksize=CHUNKSIZE):
+    with open(path, newline='') as fin:
+        rdr = csv.reader(fin)
+        names = next(rdr)
+        if names[0] != 'utc':
+            raise ValueError('{0}: first column must be utc'.format(path))
+        while True:
+            rows = list(islice(rdr, chunksize))
+            if not rows:
+                return
+            yield _chunk(names, rows)
+
+
+def readdb(path, table='samples', chunksize=CHUNKSIZE):
+    conn = sqlite3.connect(path)
+    try:
+        cur = conn.execute('select * from {0} order by utc'.format(table))
+        names = [d[0] for d in cur.description]
+        if names[0] != 'utc':
+            raise ValueError('{0}: first column must be utc'.format(path))
+        while True:
+            rows = cur.fetchmany(chunksize)
+            if not rows:
+                return
+            yield _chunk(names, rows)
+    finally:
+        conn.close()
+
+
+def readbin(path, chunksize=CHUNKSIZE):
+    with open(path, 'rb') as fin:
+        fields, offset = archiveheader(fin)
+    dtype = np.dtype([('schema', '<u2'), ('n', '<u2'), ('utc', '<f8')] +
+            [(f, '<f8') for f in fields])
+    n = (os.path.getsize(path) - offset) // dtype.itemsize
+    if n == 0:
+        return
+    records = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n,))
+    for i in range(0, n, chunksize):
+        block = records[i:i + chunksize]
+        us = (block['utc'] * 1e6).astype(np.int64)
+        chunk = {'utc': us.astype('datetime64[us]')}
+        for f in fields:
+            chunk[f] = np.array(block[f])
+        yield chunk
+
+
+readers = {
+    '.csv': readcsv,
+    '.db': readdb,
+    '.sqlite': readdb,
+    '.bin': readbin,
+    '.arc': readbin,
+    }
+'''Reader by file extension.'''
+
+
+def readsamples(paths, chunksize=CHUNKSIZE):
+    '''
+    Yield chunks from each path in turn.  A chunk is a dict of equal length
+    arrays, ``utc`` is ``datetime64[us]`` and the rest are float64.
+    '''
+    for path in paths:
+        ext = os.path.splitext(path)[1].lower()
+        try:
+            reader = readers[ext]
+        except KeyError:
+            raise ValueError('{0}: unknown file type'.format(path))
+        yield from reader(path, chunksize=chunksize)
+
+
+_sums = ('samples', 'energy', 'pout', 'pin', 'imbalance', 'generating',
+        'hot', 'hotpout', 'hotpin')
+_maxes = ('yield', 'peakpower', 'maxtemp')
+
+
+def _col(chunk, name):
+    v = chunk.get(name)
+    if v is None:
+        return np.full(len(chunk['utc']), np.nan)
+    return v
+
+
+def _zero(v):
+    return np.where(np.isnan(v), 0.0, v)
+
+
+def _partials(chunk, prevutc, maxgap, mingen, deratetemp):
+    '''
+    Per day partial sums and maxima for one chunk.
+    '''
+    utc = chunk['utc']
+    days = utc.astype('datetime64[D]')
+    pout = _col(chunk, 'gridPowerAll')
+    pin = _zero(_col(chunk, 'pin1All')) + _zero(_col(chunk, 'pin2All'))
+    p1 = _col(chunk, 'in1Voltage') * _col(chunk, 'in1Current')
+    p2 = _col(chunk, 'in2Voltage') * _col(chunk, 'in2Current')
+    temp = _col(chunk, 'boosterTemp')
+
+    t = utc.astype(np.int64) / 1e6
+    prev = np.concatenate(([t[0] if prevutc is None else prevutc], t[:-1]))
+    dt = t - prev
+    dt[(dt > maxgap) | (dt < 0)] = 0.0
+
+    gen = (pin > mingen) & ~np.isnan(pout)
+    hot = gen & (temp >= deratetemp)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        imb = np.abs(p1 - p2) / (p1 + p2)
+    imb = np.where(gen & np.isfinite(imb), imb, 0.0)
+
+    values = {
+        'samples': np.ones(len(utc)),
+        'energy': _zero(pout) * dt / 3600.0,
+        'pout': np.where(gen, pout, 0.0),
+        'pin': np.where(gen, pin, 0.0),
+        'imbalance': imb,
+        'generating': gen.astype(np.float64),
+        'hot': hot.astype(np.float64),
+        'hotpout': np.where(hot, pout, 0.0),
+        'hotpin': np.where(hot, pin, 0.0),
+        'yield': _col(chunk, 'dailyEnergy'),
+        'peakpower': pout,
+        'maxtemp': temp,
+        }
+
+    starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+    result = {'day': days[starts]}
+    for k in _sums:
+        result[k] = np.add.reduceat(values[k], starts)
+    for k in _maxes:
+        result[k] = np.fmax.reduceat(values[k], starts)
+    return result, t[-1]
+
+
+def _ratio(a, b):
+    return float(a / b) if b else None
+
+
+def _nan2none(v):
+    return None if v != v else float(v)
+
+
+def daily(chunks, maxgap=60.0, mingen=10.0, deratetemp=60.0):
+    '''
+    Reduce chunks (from :func:`readsamples`) to a list of per day
+    `OrderedDict`, see the module documentation for the keys.
+
+    :param maxgap: seconds, longer gaps between samples are not integrated.
+    :param mingen: input power (W) above which the inverter is considered
+        to be generating.
+    :param deratetemp: booster temperature considered hot.
+    '''
+    acc = OrderedDict()
+    prevutc = None
+    for chunk in chunks:
+        if not len(chunk['utc']):
+            continue
+        part, prevutc = _partials(chunk, prevutc, maxgap, mingen, deratetemp)
+        for i, day in enumerate(part['day']):
+            a = acc.get(day)
+            if a is None:
+                acc[day] = {k: part[k][i] for k in _sums + _maxes}
+                continue
+            for k in _sums:
+                a[k] += part[k][i]
+            for k in _maxes:
+                a[k] = np.fmax(a[k], part[k][i])
+
+    days = []
+    for day, a in acc.items():
+        od = OrderedDict()
+        od['day'] = str(day)
+        od['samples'] = int(a['samples'])
+        od['yield'] = _nan2none(a['yield'])
+        od['energy'] = float(a['energy'])
+        od['peakpower'] = _nan2none(a['peakpower'])
+        od['efficiency'] = _ratio(a['pout'], a['pin'])
+        od['imbalance'] = _ratio(a['imbalance'], a['generating'])
+        od['maxtemp'] = _nan2none(a['maxtemp'])
+        od['hotfraction'] = _ratio(a['hot'], a['generating'])
+        od['hotefficiency'] = _ratio(a['hotpout'], a['hotpin'])
+        days.append(od)
+    return days
+
+
+def main():
+    from argparse import ArgumentParser
+    from .output import tocsv
+
+    a = ArgumentParser()
+    a.add_argument('paths', nargs='+',
+            help='CSV, SQLite (.db) or binary archive (.bin) files.')
+    a.add_argument('--derate-temp', type=float, default=60.0,
+            help='Booster temperature considered hot (%(default)s).')
+    opt = a.parse_args()
+
+    out = tocsv(None)
+    for d in daily(readsamples(opt.paths), deratetemp=opt.derate_temp):
+        out.send(d)
+
+
+if __name__ == '__main__':
+    main()
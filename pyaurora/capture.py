@@ -0,0 +1,236 @@
+
+'''
+:mod:`capture` - record and replay raw inverter traffic
+=======================================================
+
+:class:`CaptureSocket` wraps the socket passed to
+:func:`pyaurora.protocol.execcmd` and records every frame sent and
+received.  :class:`ReplaySocket` implements the same socket methods from
+a capture file so the protocol layer and everything downstream can be run
+against real traffic without an inverter, either at the original pace or
+as fast as possible.
+
+The capture file starts with :data:`MAGIC` followed by records::
+
+    t           float64 time.monotonic() when the frame was seen
+    direction   uint8 (TX, RX or TIMEOUT)
+    cmd         uint8 command (of the request an RX or TIMEOUT answers)
+    subcmd      uint8 sub-command (0 if none)
+    length      uint8
+    frame       bytes * length
+
+Files written before the command was recorded (:data:`MAGIC1`) are still
+read, without the check that each response answers the command sent.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import time
+import struct
+import collections
+import socket as skt
+import logging
+from .protocol import bytes2hex
+
+
+log = logging.getLogger('aurora')
+
+
+MAGIC = b'AURCAP02'
+RECORD = struct.Struct('<dBBBB')
+MAGIC1 = b'AURCAP01'
+RECORD1 = struct.Struct('<dBB')
+
+Record = collections.namedtuple('Record', 't direction cmd subcmd frame')
+'''A captured frame, `cmd` and `subcmd` are None in :data:`MAGIC1` files.'''
+
+TX = 0
+RX = 1
+TIMEOUT = 2
+
+
+class ReplayMismatch(Exception):
+    '''
+    Raised by :class:`ReplaySocket` when the command sent is not the one
+    captured at that point, or a captured response answers a different
+    command.  Carrying on would decode one command's response as another's.
+    '''
+
+
+class ReplayedTimeout(skt.timeout):
+    '''
+    Raised by :meth:`ReplaySocket.recv` for a captured timeout.  It is a
+    :class:`socket.timeout` so the protocol layer treats it like the real
+    one, callers replaying a capture can catch it and carry on.
+    '''
+
+
+def readcapture(fin):
+    '''
+    Yield :class:`Record` tuples from binary file `fin`.
+    '''
+    magic = fin.read(len(MAGIC))
+    if magic not in (MAGIC, MAGIC1):
+        raise ValueError('not a capture file')
+    rec = RECORD if magic == MAGIC else RECORD1
+    while True:
+        hdr = fin.read(rec.size)
+        if len(hdr) < rec.size:
+            return
+        if magic == MAGIC:
+            t, direction, cmd, subcmd, length = rec.unpack(hdr)
+        else:
+            t, direction, length = rec.unpack(hdr)
+            cmd = subcmd = None
+        frame = fin.read(length)
+        if len(frame) < length:
+            return
+        yield Record(t, direction, cmd, subcmd, frame)
+
+
+def cmdof(frame):
+    '''
+    Return (cmd, subcmd) from a command frame built by
+    :func:`pyaurora.protocol.makecmd`.
+    '''
+    return frame[1], frame[2]
+
+
+class CaptureSocket(object):
+    '''
+    Socket wrapper that records frames to binary file `fout`.  Anything
+    other than `send` and `recv` is passed to the wrapped socket.  Each
+    response is recorded with the command it answers.
+
+    :param sock: connected socket.
+    :param fout: file opened in binary (append) mode.
+    '''
+
+    def __init__(self, sock, fout, flush=True):
+        self.sock = sock
+        self.fout = fout
+        self.flush = flush
+        self._cmd = (0, 0)
+        if fout.tell() == 0:
+            fout.write(MAGIC)
+
+    def _record(self, direction, frame):
+        self.fout.write(RECORD.pack(time.monotonic(), direction,
+                *self._cmd, len(frame)))
+        self.fout.write(frame)
+        if self.flush:
+            self.fout.flush()
+
+    def send(self, buf):
+        n = self.sock.send(buf)
+        self._cmd = cmdof(buf)
+        self._record(TX, bytes(buf))
+        return n
+
+    def recv(self, n):
+        try:
+            buf = self.sock.recv(n)
+        except skt.timeout:
+            self._record(TIMEOUT, b'')
+            raise
+        self._record(RX, buf)
+        return buf
+
+    def close(self):
+        self.fout.close()
+        self.sock.close()
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReplaySocket(object):
+    '''
+    Replays a capture file through the socket interface used by
+    :func:`pyaurora.protocol.execcmd`.
+
+    :param fin: capture file opened in binary mode.
+    :param speed: 1 replays at the captured pace, 2 twice as fast etc.
+        0 or None replays as fast as possible.
+    :param verify: raise :class:`ReplayMismatch` if a command sent differs
+        from the captured one, or a response was captured for a different
+        command than the one sent.  Other differences (eg the inverter
+        address) are logged.
+    :param maxgap: cap on the pause between frames in seconds (eg across
+        process restarts).
+
+    :raises EOFError: from `send` or `recv` at the end of the capture.
+    :raises ReplayedTimeout: from `recv` where a timeout was captured.
+    :raises ReplayMismatch: see `verify`.
+    '''
+
+    def __init__(self, fin, speed=None, verify=True, maxgap=60.0):
+        self.fin = fin
+        self.records = readcapture(fin)
+        self.speed = speed
+        self.verify = verify
+        self.maxgap = maxgap
+        self._lastt = None
+        self._lastwall = None
+        self._sent = None
+
+    def _next(self, direction):
+        for rec in self.records:
+            if rec.direction == direction or (direction == RX and
+                    rec.direction == TIMEOUT):
+                self._pace(rec.t)
+                return rec
+            log.warning('replay out of step, skipping %s frame',
+                    rec.direction)
+        raise EOFError('end of capture')
+
+    def _check(self, captured, what):
+        if self.verify and captured != self._sent:
+            raise ReplayMismatch('{0} {1} captured for {2}'.format(what,
+                    self._sent, captured))
+
+    def _pace(self, t):
+        now = time.monotonic()
+        if self.speed and self._lastt is not None:
+            gap = min(max(t - self._lastt, 0.0), self.maxgap) / self.speed
+            wait = self._lastwall + gap - now
+            if wait > 0:
+                time.sleep(wait)
+                now += wait
+        self._lastt, self._lastwall = t, now
+
+    def send(self, buf):
+        rec = self._next(TX)
+        self._sent = cmdof(buf)
+        if self.verify and rec.frame != bytes(buf):
+            self._check(cmdof(rec.frame), 'sent')
+            log.warning('replay sent %s captured %s',
+                    bytes2hex(bytes(buf)), bytes2hex(rec.frame))
+        return len(buf)
+
+    def recv(self, n):
+        rec = self._next(RX)
+        if self._sent is not None and rec.cmd is not None:
+            self._check((rec.cmd, rec.subcmd), 'response to')
+        if rec.direction == TIMEOUT:
+            raise ReplayedTimeout('replayed timeout')
+        return rec.frame[:n]
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        self.fin.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
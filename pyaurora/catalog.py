@@ -0,0 +1,382 @@
+
+'''
+:mod:`catalog` - declarative description of the inverter commands
+=================================================================
+
+Every query the inverter answers is described once here as a
+:class:`Command`: command and subcommand bytes, the layout of the 6 byte
+response (CRC stripped) as a precompiled :class:`struct.Struct`, the
+fields it yields with their units, and its cost in bus transactions.
+Everything else is generated from that:
+
+:func:`plan`
+    the transactions needed for a set of fields, each command is sent
+    once however many of its fields are wanted (eg the states from
+    ``getState``).
+:meth:`Plan.poll`
+    run a plan, decoding each response with one ``unpack_from``.
+:func:`simulate`
+    build the response frame (with CRC) a real inverter would send, for
+    test and benchmark stand-ins such as :class:`SimulatedInverter` (eg
+    ``aurx.py`` answering polls from a CSV file read with
+    :func:`fromstrings`).
+:func:`sqlcolumns` and :func:`createtable`
+    SQL schemas for samples, used by :func:`~pyaurora.sqlsink.tosql`.
+
+Field names match :data:`pyaurora.command.allops` where the two overlap so
+existing CSV files and databases keep their columns.  Most responses start
+with the transmission state and global state bytes, they are only reported
+as fields by ``getState``.
+
+Layouts of the less common commands follow aurora-1.8.8.
+``getCumFloatEnergy`` is left out until its subcommand numbering is
+confirmed against an inverter.
+
+.. note::
+    ``getTime`` differs from :data:`~pyaurora.command.allops`, whose
+    :func:`~pyaurora.protocol.gettime` read the inverter clock as seconds
+    since 1970 and returned a `date` (30 years early).  The inverter counts
+    seconds from 2000-01-01 (as aurora-1.8.8 does) so here it is a
+    `datetime` from :data:`AURORA_EPOCH`.  ``getFirmwareRel`` is dotted
+    (``C.0.1.1``) where allops gave the bare characters.  Neither is in
+    :data:`~pyaurora.command.pollops`, whose values are unchanged.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import struct
+import functools
+import datetime as dt
+from collections import OrderedDict, namedtuple
+from .command import Cmd, DspOp, CumulatedEnergy
+from .protocol import addcrc
+
+
+AURORA_EPOCH = dt.datetime(2000, 1, 1)
+
+
+Field = namedtuple('Field', 'name unit')
+'''A value in a response, `name` None for bytes that are skipped.'''
+
+
+def _text(b):
+    return b.decode('ascii', 'replace').strip('\0 ')
+
+
+def _dotted(b):
+    return '.'.join(_text(b))
+
+
+def _auroratime(n):
+    return AURORA_EPOCH + dt.timedelta(seconds=n)
+
+
+converters = {
+    'text': _text,
+    'version': _dotted,
+    'timestamp': _auroratime,
+    }
+'''Conversion of the raw unpacked value by unit, other units are as is.'''
+
+_unconverters = {
+    'text': lambda s: s.encode('ascii'),
+    'version': lambda s: s.replace('.', '').encode('ascii'),
+    'timestamp': lambda t: int((t - AURORA_EPOCH).total_seconds()),
+    }
+
+sqltypes = {
+    'text': 'TEXT',
+    'version': 'TEXT',
+    'timestamp': 'TIMESTAMP',
+    'code': 'INTEGER',
+    's': 'INTEGER',
+    }
+'''SQL column type by unit, anything else is FLOAT.'''
+
+keycolumns = OrderedDict([('utc', 'TIMESTAMP'), ('inverter', 'TEXT')])
+'''Sample columns that are not fields, they make up the primary key.'''
+
+
+class Command(object):
+    '''
+    One query transaction.
+
+    :param fmt: struct format of the response without CRC, network order.
+    :param fields: a :class:`Field` (or None) per item of `fmt`.
+    :param cost: bus transactions, normally 1.
+    '''
+
+    def __init__(self, cmd, subcmd, fmt, fields, cost=1):
+        self.cmd = cmd
+        self.subcmd = subcmd
+        self.struct = struct.Struct(fmt)
+        self.fields = tuple(f if f is not None else Field(None, None)
+                for f in fields)
+        self.cost = cost
+        if len(self.fields) != len(self.struct.unpack(
+                bytes(self.struct.size))):
+            raise ValueError('{0} fields for {1!r}'.format(len(self.fields),
+                    fmt))
+        self.named = tuple((f.name, i, converters.get(f.unit))
+                for i, f in enumerate(self.fields) if f.name is not None)
+
+    @property
+    def key(self):
+        return (self.cmd, self.subcmd)
+
+    def decode(self, resp, names=None):
+        '''
+        Return an `OrderedDict` of the named fields (all by default) of a
+        response.
+        '''
+        values = self.struct.unpack_from(resp)
+        od = OrderedDict()
+        for name, i, conv in self.named:
+            if names is None or name in names:
+                od[name] = values[i] if conv is None else conv(values[i])
+        return od
+
+    def __repr__(self):
+        return 'Command({0}, {1})'.format(getattr(self.cmd, 'name',
+                self.cmd), self.subcmd)
+
+
+commands = []
+'''Every :class:`Command`.'''
+
+fields = OrderedDict()
+'''Field name: (:class:`Command`, index into its response).'''
+
+
+def _add(cmd, subcmd, fmt, *fs, **kwargs):
+    c = Command(cmd, subcmd, fmt, fs, **kwargs)
+    commands.append(c)
+    for i, f in enumerate(c.fields):
+        if f.name is not None:
+            if f.name in fields:
+                raise ValueError('duplicate field {0}'.format(f.name))
+            fields[f.name] = (c, i)
+    return c
+
+
+def _dspunit(name):
+    lname = name.lower()
+    if name.startswith('ToM'):
+        return None
+    for key, unit in (('temp', 'degC'), ('voltage', 'V'), ('current', 'A'),
+            ('ileak', 'A'), ('power', 'W'), ('pin', 'W'), ('frequency', 'Hz'),
+            ('riso', 'MOhm')):
+        if key in lname:
+            return unit
+    return None
+
+
+_status = (None, None)
+
+
+_add(Cmd.getState, None, '!6B',
+        Field('transmissionState', 'code'),
+        Field('globalState', 'code'),
+        Field('inverterState', 'code'),
+        Field('channel1State', 'code'),
+        Field('channel2State', 'code'),
+        Field('alarmState', 'code'))
+_add(Cmd.getPartNumber, None, '!6s', Field('partNumber', 'text'))
+_add(Cmd.getVersion, None, '!2B4s', *_status + (Field('version', 'text'),))
+_add(Cmd.getSerial, None, '!6s', Field('serialNumber', 'text'))
+_add(Cmd.getMfrWeekYear, None, '!2B2s2s',
+        *_status + (Field('mfrWeek', 'text'), Field('mfrYear', 'text')))
+_add(Cmd.getTime, None, '!2BL', *_status + (Field('getTime', 'timestamp'),))
+_add(Cmd.getFirmwareRel, None, '!2B4s',
+        *_status + (Field('getFirmwareRel', 'version'),))
+_add(Cmd.getCumEnergy10, 2, '!2Bl', *_status + (Field('getEnergy10', 'Wh'),))
+_add(Cmd.getConfig, None, '!2BB3x', *_status + (Field('config', 'code'),))
+_add(Cmd.getLastAlarms, None, '!2B4B', *_status + tuple(
+        Field('alarm{0}'.format(i), 'code') for i in range(1, 5)))
+
+for _op in DspOp:
+    _add(Cmd.getDsp, _op.value, '!2Bf',
+            *_status + (Field(_op.name, _dspunit(_op.name)),))
+
+for _op in CumulatedEnergy:
+    _add(Cmd.getCumEnergy, _op.value, '!2Bl',
+            *_status + (Field(_op.name, 'Wh'),))
+
+for _sc, _name in enumerate(('totalRunTime', 'partialRunTime', 'gridRunTime',
+        'resetRunTime')):
+    _add(Cmd.getCounters, _sc, '!2BL', *_status + (Field(_name, 's'),))
+
+
+def unit(name):
+    c, i = fields[name]
+    return c.fields[i].unit
+
+
+class Plan(object):
+    '''
+    The transactions needed to poll some fields, see :func:`plan`.
+    '''
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        steps = OrderedDict()
+        for name in self.names:
+            c, i = fields[name]
+            steps.setdefault(c.key, (c, []))[1].append(name)
+        self.steps = [(c, tuple((name, i, conv) for name, i, conv in c.named
+                if name in wanted)) for c, wanted in steps.values()]
+
+    @property
+    def cost(self):
+        '''
+        Bus transactions per poll.
+        '''
+        return sum(c.cost for c, wanted in self.steps)
+
+    def poll(self, inverterrdr, od=None):
+        '''
+        Run the plan and return the fields in the order they were asked
+        for.
+
+        :param inverterrdr: function taking (cmd, subcmd) and returning the
+            response without CRC, eg :func:`~pyaurora.protocol.execcmd`
+            with the socket and address bound.
+        :param od: `OrderedDict` to add the fields to, eg one already
+            holding ``utc``.
+        '''
+        if od is None:
+            od = OrderedDict()
+        od.update(dict.fromkeys(self.names))
+        for c, wanted in self.steps:
+            values = c.struct.unpack_from(inverterrdr(c.cmd, c.subcmd))
+            for name, i, conv in wanted:
+                od[name] = values[i] if conv is None else conv(values[i])
+        return od
+
+
+@functools.lru_cache(maxsize=32)
+def _plan(names):
+    return Plan(names)
+
+
+def plan(names):
+    '''
+    Return a :class:`Plan` for field `names`, plans are cached so this is
+    cheap to call every poll.
+
+    :raises KeyError: for a name not in :data:`fields`.
+    '''
+    return _plan(tuple(names))
+
+
+def simulate(cmd, subcmd=None, values=None):
+    '''
+    Return the response frame, with CRC, the inverter sends for a command.
+
+    :param values: dict of field values, missing ones are zero and floats
+        are rounded for integer layouts.
+    '''
+    for c in commands:
+        if c.cmd == cmd and (c.subcmd is None or c.subcmd == subcmd):
+            break
+    else:
+        raise KeyError((cmd, subcmd))
+    values = values or {}
+    raw = []
+    for f, v in zip(c.fields, c.struct.unpack(bytes(c.struct.size))):
+        if f.name is not None and values.get(f.name) is not None:
+            zero, v = v, values[f.name]
+            if f.unit in _unconverters:
+                v = _unconverters[f.unit](v)
+            elif isinstance(zero, int):
+                v = int(round(v))
+        raw.append(v)
+    return bytes(addcrc(bytearray(c.struct.pack(*raw))))
+
+
+class SimulatedInverter(object):
+    '''
+    Socket stand-in answering every catalog command from `values` (a dict
+    of field: value, eg a sample read back from a CSV file).
+    '''
+
+    def __init__(self, values=None):
+        self.values = values or {}
+        self.resp = b''
+
+    def send(self, buf):
+        try:
+            self.resp = simulate(buf[1], buf[2], self.values)
+        except KeyError:
+            self.resp = b''
+        return len(buf)
+
+    def recv(self, n):
+        return self.resp[:n]
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def fromstrings(values):
+    '''
+    Return field values parsed from strings, eg a row of a CSV file written
+    by :func:`~pyaurora.output.tocsv`.  Names that are not fields and empty
+    values are left out.
+    '''
+    d = {}
+    for name, v in values.items():
+        if name not in fields or v is None or v == '':
+            continue
+        u = unit(name)
+        if u in ('text', 'version'):
+            d[name] = v
+        elif u == 'timestamp':
+            d[name] = dt.datetime.strptime(v, '%Y-%m-%d %H:%M:%S')
+        elif sqltypes.get(u) == 'INTEGER':
+            d[name] = int(float(v))
+        else:
+            d[name] = float(v)
+    return d
+
+
+def sqltype(name):
+    '''
+    SQL type of sample column `name`, FLOAT if it is neither one of the
+    :data:`keycolumns` nor a field.
+    '''
+    if name in keycolumns:
+        return keycolumns[name]
+    if name in fields:
+        return sqltypes.get(unit(name), 'FLOAT')
+    return 'FLOAT'
+
+
+def sqlcolumns(names):
+    '''
+    Return (name, SQL type) for each of the sample columns `names`.
+    '''
+    return [(name, sqltype(name)) for name in names]
+
+
+def createtable(table, names):
+    '''
+    Return a CREATE TABLE statement for samples with columns `names`, keyed
+    on the :data:`keycolumns` among them.
+    '''
+    cols = ['{0} {1}'.format(n, t) for n, t in sqlcolumns(names)]
+    key = [n for n in keycolumns if n in names]
+    if key:
+        cols.append('PRIMARY KEY ({0})'.format(', '.join(key)))
+    return 'CREATE TABLE IF NOT EXISTS {0} ({1})'.format(table,
+            ', '.join(cols))
@@ -138,3 +138,31 @@ allops.update({ssc: (Cmd.getCumEnergy,
         getattr(CumulatedEnergy, ssc), (getlong, floatfmt))
         for ssc in  CumulatedEnergy.__members__.keys()})
 
+
+pollops = (
+        #'getTime',
+        #'getFirmwareRel',
+        'gridPowerAll',
+        'powerPeakToday',
+        'dailyEnergy',
+        'weeklyEnergy',
+        #'last7Energy',
+        'partialEnergy',
+        'getEnergy10',
+        'frequencyAll',
+        'gridVoltageAll',
+        'gridVoltageAverage',
+        'gridCurrentAll',
+        'bulkVoltageDcDc',
+        'in1Voltage',
+        'in1Current',
+        'in2Voltage',
+        'in2Current',
+        'pin1All',
+        'pin2All',
+        'iLeakDcDc',
+        'iLeakInverter',
+        'boosterTemp',
+    )
+'''The default inverter operations polled in each cycle.  Publishers and
+subscribers of the binary wire format share this as the record schema.'''
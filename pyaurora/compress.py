@@ -0,0 +1,239 @@
+
+'''
+:mod:`compress` - deadband and swinging door compression of samples
+===================================================================
+
+:func:`compress` sits between the poller and the output co-routines and
+sends sparse samples: ``utc`` plus only the fields that need archiving.
+Every `keyframe` samples all fields are sent so a consumer that joins late
+(eg a zmq subscriber) can start from there.
+
+Rules are per field:
+
+:class:`Deadband`
+    archive when the value moves more than `deadband` from the last
+    archived value.  Rebuild by holding the last value.
+:class:`SwingingDoor`
+    archive the previous point when no straight line from the last
+    archived point stays within `deviation` of all points since.  Rebuild
+    by linear interpolation between archived points.
+
+Swinging door decisions are made one sample late so the output is delayed
+by one sample, send None to flush the held sample (eg at exit).  The first
+value of every field is always archived.  As usual for swinging door the
+rebuilt values stay close to, but are not strictly within, `deviation` of
+the originals.  Fields
+without a rule are always sent.  Values of fields with a rule may be
+strings (eg from :class:`csv.DictReader`), they are converted to float,
+empty strings to None.
+
+:func:`expand` fills a compressed stream back out to complete samples
+(holding values), :func:`reconstruct` rebuilds a full series offline with
+interpolation for swinging door fields.
+
+Sparse samples are not suitable for fixed schema outputs like
+:class:`~pyaurora.wire.StructCodec` or :func:`~pyaurora.output.tocsv`,
+send them as JSON.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import datetime as dt
+from collections import OrderedDict
+from .output import coroutine
+
+
+class Deadband(object):
+
+    def __init__(self, deadband):
+        self.deadband = deadband
+        self.archived = None
+
+    def archive(self, t, v, force=False):
+        '''
+        Return True if point (t, v) should be archived.
+        '''
+        if (force or self.archived is None or
+                abs(v - self.archived) > self.deadband):
+            self.archived = v
+            return True
+        return False
+
+
+class SwingingDoor(object):
+    '''
+    The door pivots on the last archived point, `upper` and `lower` are
+    the narrowest slopes seen since that still contain every point.
+    '''
+
+    def __init__(self, deviation):
+        self.deviation = deviation
+        self.anchor = None
+        self.upper = None
+        self.lower = None
+
+    def start(self, t, v):
+        self.anchor = (t, v)
+        self.upper = float('inf')
+        self.lower = float('-inf')
+
+    def archive(self, t, v, force=False):
+        '''
+        Offer point (t, v), return True if the *previous* point should be
+        archived.  The caller is expected to hold one point back.
+        '''
+        if self.anchor is None:
+            self.start(t, v)
+            return False
+
+        at, av = self.anchor
+        dtt = t - at
+        if dtt <= 0:
+            return False
+        upper = min(self.upper, (v + self.deviation - av) / dtt)
+        lower = max(self.lower, (v - self.deviation - av) / dtt)
+        if force or lower > upper:
+            return True
+        self.upper, self.lower = upper, lower
+        return False
+
+
+def _float(v):
+    if v is None or v == '':
+        return None
+    return float(v)
+
+
+def _seconds(utc):
+    if isinstance(utc, dt.datetime):
+        return (utc - dt.datetime(1970, 1, 1)).total_seconds()
+    return float(utc)
+
+
+@coroutine
+def compress(target, rules, keyframe=360):
+    '''
+    Co-routine that sends sparse samples to target.
+
+    :param rules: dict of field: :class:`Deadband` or :class:`SwingingDoor`
+        (or a number, shorthand for a deadband of that size).
+    :param keyframe: send every field once every this many samples, 0 never.
+
+    Send None to send the held sample now.
+    '''
+    rules = {f: Deadband(r) if isinstance(r, (int, float)) else r
+            for f, r in rules.items()}
+    doors = [f for f, r in rules.items() if isinstance(r, SwingingDoor)]
+    held = None
+    n = 0
+    while True:
+        d = (yield)
+        if d is None:
+            if held is not None:
+                ht, hd, hkey = held
+                for f in doors:
+                    if hd.get(f) is not None:
+                        rules[f].start(ht, hd[f])
+                target.send(hd)
+                held = None
+            continue
+        t = _seconds(d['utc'])
+        iskey = keyframe and n % keyframe == 0
+        n += 1
+
+        # swinging door fields decide whether the held (previous) point is
+        # archived now that the current one is known
+        if held is not None:
+            ht, hd, hkey = held
+            for f in doors:
+                v = _float(d.get(f))
+                if v is None or hd.get(f) is None:
+                    continue
+                door = rules[f]
+                # the first point of a field is archived, the door then
+                # pivots on it
+                if hkey or door.anchor is None or door.archive(t, v):
+                    door.start(ht, hd[f])
+                    door.archive(t, v)
+                else:
+                    del hd[f]
+            target.send(hd)
+
+        od = OrderedDict()
+        for k, v in d.items():
+            rule = rules.get(k)
+            if k == 'utc' or rule is None:
+                od[k] = v
+                continue
+            v = _float(v)
+            if v is None or isinstance(rule, SwingingDoor):
+                od[k] = v
+            elif rule.archive(t, v, force=iskey):
+                od[k] = v
+        if iskey:
+            for f in doors:
+                if od.get(f) is not None:
+                    rules[f].start(t, od[f])
+        held = (t, od, iskey)
+
+
+@coroutine
+def expand(target, fields=None):
+    '''
+    Co-routine that turns a compressed stream back into complete samples by
+    holding the last value of each field.
+
+    :param fields: names of all the fields, nothing is sent until each has
+        been seen (eg in a keyframe).  If None the first sample received
+        is assumed to be complete.
+    '''
+    last = OrderedDict()
+    while True:
+        d = (yield)
+        last.update(d)
+        if fields is None:
+            fields = list(d)
+        if all(f in last for f in fields):
+            target.send(OrderedDict(last))
+
+
+def reconstruct(samples, times, rules):
+    '''
+    Rebuild complete values at `times` from a list of compressed samples.
+
+    :param samples: compressed samples in time order.
+    :param times: times (datetime or seconds) to produce values for.
+    :param rules: the rules given to :func:`compress`, swinging door fields
+        are linearly interpolated, everything else is held.
+    :returns: list of `OrderedDict`, one per time.
+    '''
+    points = {}
+    for d in samples:
+        t = _seconds(d['utc'])
+        for k, v in d.items():
+            if k != 'utc' and v is not None:
+                points.setdefault(k, []).append((t, v))
+
+    cursors = {k: 0 for k in points}
+    result = []
+    for utc in times:
+        t = _seconds(utc)
+        od = OrderedDict()
+        od['utc'] = utc
+        for k, pts in points.items():
+            i = cursors[k]
+            while i + 1 < len(pts) and pts[i + 1][0] <= t:
+                i += 1
+            cursors[k] = i
+            t0, v0 = pts[i]
+            if t0 > t:
+                od[k] = None
+            elif (isinstance(rules.get(k), SwingingDoor) and
+                    i + 1 < len(pts)):
+                t1, v1 = pts[i + 1]
+                od[k] = v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+            else:
+                od[k] = v0
+        result.append(od)
+    return result
@@ -4,9 +4,20 @@
 :mod:`cozmq` - coroutines for zeromq
 ====================================
 
-Note that we are using send_string(), recv_string().  Since the data is
-a JSON string this should be fine but a more general solution would send/recv
-bytes and encode/decode as necessary.
+By default we are using send_string(), recv_string() and the data is a JSON
+string.  Alternatively pass a codec from :mod:`pyaurora.wire` to both ends,
+samples (dicts) are then encoded to bytes and sent as zero copy frames and
+the subscriber decodes directly from the frame buffer.
+
+A slow subscriber should never stall the publisher.  PUB sockets drop
+messages once the high water mark is reached, for other socket types
+`tozmq` and `tozmqbatch` can be told to drop rather than block.  PUB
+sockets drop silently so the ``dropped`` count in `stats` is only kept for
+other socket types (eg PUSH or DEALER).  Several
+samples can be sent as one multipart message with `tozmqbatch`, on the
+receiving side `fromzmqpoll` (or `afromzmq` under asyncio) drains whatever
+has arrived and sends a list of messages downstream, use
+:func:`pyaurora.output.unbatch` to go back to one message at a time.
 
 :mod:`zmq` has send_json() and recv_json() however it doesn't look like there is
 an easy way to specify and alternate encoder (eg to handle dates).
@@ -15,23 +26,235 @@ an easy way to specify and alternate encoder (eg to handle dates).
 '''
 
 
-from .output import coroutine
+import time
 import logging
+import threading
+from .output import coroutine
+
+
+log = logging.getLogger('aurora')
+
 try:
     import zmq
-except:
+except ImportError:
+    zmq = None
     log.warning('cannot import zmq')
 
 
+def setsockopts(sock, hwm=None, linger=None):
+    '''
+    Configure queueing on a zmq socket, call this before bind/connect.
+
+    :param hwm: high water mark (messages) for both send and receive.
+    :param linger: milliseconds to hold unsent messages on close, 0 discards
+        them immediately.
+    '''
+    if hwm is not None:
+        sock.setsockopt(zmq.SNDHWM, hwm)
+        sock.setsockopt(zmq.RCVHWM, hwm)
+    if linger is not None:
+        sock.setsockopt(zmq.LINGER, linger)
+
+
+def _encoder(codec):
+    if codec is None:
+        return lambda s: s.encode('utf-8')
+    return codec.encode
+
+
+def _decoder(codec):
+    if codec is None:
+        return lambda frame: frame.bytes.decode('utf-8')
+    decode = codec.decode
+    return lambda frame: decode(frame.buffer)
+
+
+def _sendflags(drop):
+    return zmq.NOBLOCK if drop else 0
+
+
 @coroutine
-def tozmq(sock):
+def tozmq(sock, codec=None, drop=False, stats=None):
+    '''
+    Co-routine that sends to a zmq socket.
+
+    :param sock: zmq socket eg PUB.
+    :param codec: if None the input is expected to be a string, otherwise
+        the input is a sample which is encoded with the codec.
+    :param drop: discard the message rather than block when the socket
+        can't accept it.
+    :param stats: optional dict, the ``dropped`` count is updated in it.
+        Always 0 for PUB sockets, they never report drops.
+    '''
+    flags = _sendflags(drop)
+    stats = {} if stats is None else stats
+    stats.setdefault('dropped', 0)
+    encode = _encoder(codec)
     while True:
-        sock.send_string((yield))
+        try:
+            sock.send(encode((yield)), flags, copy=False)
+        except zmq.Again:
+            stats['dropped'] += 1
+            log.debug('zmq send would block, dropped %s', stats['dropped'])
+
+
+class ZMQBatch(object):
+    '''
+    Collects messages and sends them as a single multipart message, one
+    frame per sample.  It has the same ``send()`` interface as a
+    co-routine.
+
+    With `maxdelay` a background thread sends a partial batch once its
+    oldest message is that many seconds old, otherwise a batch only goes
+    out when it is full or on :meth:`flush`/:meth:`close`.  The socket is
+    only used while holding a lock so it is never used by two threads at
+    once.
+
+    :param batchsize: send once this many messages have been collected.
+    :param maxdelay: send a partial batch after this many seconds.
+    :param codec, drop, stats: see :func:`tozmq`.
+    '''
+
+    def __init__(self, sock, batchsize=10, maxdelay=None, codec=None,
+            drop=False, stats=None):
+        self.sock = sock
+        self.batchsize = batchsize
+        self.maxdelay = maxdelay
+        self.flags = _sendflags(drop)
+        self.stats = {} if stats is None else stats
+        self.stats.setdefault('dropped', 0)
+        self.encode = _encoder(codec)
+        self.batch = []
+        self.first = None
+        self.closed = False
+        self.lock = threading.Condition()
+        if maxdelay is not None:
+            threading.Thread(target=self._run, name='zmqbatch',
+                    daemon=True).start()
+
+    def send(self, m):
+        m = self.encode(m)
+        with self.lock:
+            self.batch.append(m)
+            if self.first is None:
+                self.first = time.monotonic()
+                self.lock.notify()
+            if len(self.batch) >= self.batchsize:
+                self._send()
+
+    def _send(self):
+        batch = self.batch
+        self.batch = []
+        self.first = None
+        try:
+            self.sock.send_multipart(batch, self.flags, copy=False)
+        except zmq.Again:
+            self.stats['dropped'] += len(batch)
+            log.debug('zmq send would block, dropped %s',
+                    self.stats['dropped'])
+
+    def flush(self):
+        '''
+        Send the partial batch, if any.
+        '''
+        with self.lock:
+            if self.batch:
+                self._send()
+
+    def close(self):
+        '''
+        Send the partial batch and stop the timer thread, the socket is left
+        open.
+        '''
+        with self.lock:
+            self.closed = True
+            if self.batch:
+                self._send()
+            self.lock.notify()
+
+    def _run(self):
+        with self.lock:
+            while not self.closed:
+                if self.first is None:
+                    self.lock.wait()
+                    continue
+                delay = self.first + self.maxdelay - time.monotonic()
+                if delay > 0:
+                    self.lock.wait(delay)
+                else:
+                    self._send()
+
+
+def tozmqbatch(sock, batchsize=10, maxdelay=None, codec=None, drop=False,
+        stats=None):
+    '''
+    Return a :class:`ZMQBatch`, a target that sends `batchsize` messages at
+    a time as one multipart message.
+    '''
+    return ZMQBatch(sock, batchsize, maxdelay, codec, drop, stats)
 
 
 # not a coroutine - pulls from a zmq socket
-def fromzmq(sock, target):
+def fromzmq(sock, target, codec=None):
+    '''
+    Receive from `sock` forever sending each message to target.
+
+    :param codec: if None messages are received as strings, otherwise the
+        decoded sample is sent to target.
+    '''
+    if codec is None:
+        while True:
+            target.send(sock.recv_string())
+    else:
+        decode = codec.decode
+        while True:
+            target.send(decode(sock.recv(copy=False).buffer))
+
+
+def _drain(sock, decode, batch, maxbatch):
+    while len(batch) < maxbatch:
+        try:
+            frames = sock.recv_multipart(zmq.NOBLOCK, copy=False)
+        except zmq.Again:
+            break
+        batch.extend(decode(frame) for frame in frames)
+
+
+# not a coroutine - pulls from a zmq socket
+def fromzmqpoll(sock, target, codec=None, timeout=1000, maxbatch=100):
+    '''
+    Receive from `sock` forever, each time the socket becomes readable
+    all waiting messages (up to `maxbatch`) are sent to target as a list.
+    Each frame of a multipart message is treated as a separate message.
+
+    :param codec: see :func:`fromzmq`.
+    :param timeout: poll timeout in milliseconds.
+    :param maxbatch: upper limit on the length of a batch.
+    '''
+    decode = _decoder(codec)
+    poller = zmq.Poller()
+    poller.register(sock, zmq.POLLIN)
+    while True:
+        if not poller.poll(timeout):
+            continue
+        batch = []
+        _drain(sock, decode, batch, maxbatch)
+        if batch:
+            target.send(batch)
+
+
+async def afromzmq(sock, target, codec=None, maxbatch=100):
+    '''
+    asyncio version of :func:`fromzmqpoll`, `sock` is a
+    :mod:`zmq.asyncio` socket.
+    '''
+    decode = _decoder(codec)
     while True:
-        target.send(sock.recv_string())
+        frames = await sock.recv_multipart(copy=False)
+        batch = [decode(frame) for frame in frames]
+        while len(batch) < maxbatch and await sock.poll(0, zmq.POLLIN):
+            frames = await sock.recv_multipart(copy=False)
+            batch.extend(decode(frame) for frame in frames)
+        target.send(batch)
 
 
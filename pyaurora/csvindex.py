@@ -0,0 +1,272 @@
+
+'''
+:mod:`csvindex` - time index for the daily CSV files
+====================================================
+
+A sidecar file (``aurora_2015-07-20.csv.idx``) holds the ``utc`` and byte
+offset of every `stride` th row of a CSV file written by
+:func:`~pyaurora.output.tocsv`, so :func:`readrange` can seek close to the
+start of a time range and read only the rows it needs.
+
+:class:`CSVIndex` is given to :func:`~pyaurora.output.tocsv` to keep the
+index up to date as rows are appended, :func:`buildindex` (re)creates it
+for an existing file.  Rows after the last entry are found by reading
+forward so an index that is behind its CSV file is fine.  It can also be
+ahead: index records are written straight through while the CSV file is
+buffered, so if the writer dies a record can point at or past the end of
+the rows that reached the disk.  :class:`CSVIndex` drops such records when
+it reopens the index, before the offsets they name are reused, and an
+index whose first record isn't the first row of the CSV file (eg it was
+started on a file that already had rows) is rebuilt when it is used.
+
+The index file is :data:`INDEX_MAGIC` followed by records of::
+
+    utc     float64 seconds since the epoch
+    offset  uint64 byte offset of the row
+
+Files without an index are indexed on first use.  Run as a script to print
+a time range as CSV::
+
+    python -m pyaurora.csvindex --start '2015-07-20 12:00' \\
+        --end '2015-07-20 13:00' aurora_2015-*.csv
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import io
+import os
+import csv
+import bisect
+import struct
+import datetime as dt
+
+
+INDEX_MAGIC = b'AURIDX01'
+INDEX_RECORD = struct.Struct('<dQ')
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+def indexpath(path):
+    return path + '.idx'
+
+
+def utcseconds(utc):
+    '''
+    Seconds since the epoch from a datetime or a string as written by
+    :func:`~pyaurora.output.tocsv` (``str(datetime)``).
+    '''
+    if isinstance(utc, dt.datetime):
+        return (utc - EPOCH).total_seconds()
+    if isinstance(utc, bytes):
+        utc = utc.decode('ascii')
+    utc = utc.strip().replace('T', ' ')
+    fmt = '%Y-%m-%d %H:%M:%S.%f' if '.' in utc else '%Y-%m-%d %H:%M:%S'
+    return (dt.datetime.strptime(utc, fmt) - EPOCH).total_seconds()
+
+
+def _firstrow(path):
+    # offset of the first complete row after the header, None if none
+    with open(path, 'rb') as f:
+        f.readline()
+        offset = f.tell()
+        return offset if f.readline().endswith(b'\n') else None
+
+
+def _indexok(path):
+    '''
+    True if the index of `path` exists and starts at its first row.
+    '''
+    try:
+        with open(indexpath(path), 'rb') as f:
+            buf = f.read(len(INDEX_MAGIC) + INDEX_RECORD.size)
+    except FileNotFoundError:
+        return False
+    if buf[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+        return False
+    first = _firstrow(path)
+    if len(buf) < len(INDEX_MAGIC) + INDEX_RECORD.size:
+        return first is None
+    # a writer indexes its first row before the row is flushed
+    return first is None or \
+            INDEX_RECORD.unpack_from(buf, len(INDEX_MAGIC))[1] == first
+
+
+def ensureindex(path, stride=30):
+    '''
+    Build the index of CSV file `path` unless it has a good one.
+    '''
+    if not _indexok(path):
+        buildindex(path, stride)
+
+
+class CSVIndex(object):
+    '''
+    Appends to the index of CSV file `path`.  If the CSV file already has
+    rows they are indexed first, and index records past its end (the rows
+    they point at were lost) are dropped.
+
+    :param stride: index every this many rows.  The first row written is
+        always indexed.
+    '''
+
+    def __init__(self, path, stride=30):
+        self.stride = stride
+        self.count = 0
+        if os.path.exists(path) and os.path.getsize(path):
+            ensureindex(path, stride)
+            _truncate(indexpath(path), os.path.getsize(path))
+        self.f = open(indexpath(path), 'ab', buffering=0)
+        if not self.f.tell():
+            self.f.write(INDEX_MAGIC)
+
+    def add(self, utc, offset):
+        '''
+        Record the row about to be written at `offset`.
+        '''
+        if self.count % self.stride == 0:
+            self.f.write(INDEX_RECORD.pack(utcseconds(utc), offset))
+        self.count += 1
+
+    def close(self):
+        self.f.close()
+
+
+def _truncate(ipath, size):
+    # drop trailing records at or past `size`, the end of the CSV file
+    with open(ipath, 'r+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        end -= (end - len(INDEX_MAGIC)) % INDEX_RECORD.size
+        while end > len(INDEX_MAGIC):
+            f.seek(end - INDEX_RECORD.size)
+            if INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))[1] < size:
+                break
+            end -= INDEX_RECORD.size
+        f.truncate(end)
+
+
+def buildindex(path, stride=30):
+    '''
+    Create or replace the index of an existing CSV file.
+    '''
+    tmp = indexpath(path) + '.tmp'
+    with open(path, 'rb') as fin, open(tmp, 'wb') as fout:
+        fout.write(INDEX_MAGIC)
+        fin.readline()
+        n = 0
+        while True:
+            offset = fin.tell()
+            line = fin.readline()
+            if not line.endswith(b'\n'):
+                break
+            if n % stride == 0:
+                try:
+                    t = utcseconds(line.split(b',', 1)[0])
+                except ValueError:
+                    continue
+                fout.write(INDEX_RECORD.pack(t, offset))
+            n += 1
+    os.replace(tmp, indexpath(path))
+
+
+def loadindex(path):
+    '''
+    Return (utcs, offsets) lists for CSV file `path`, building the index if
+    there isn't a good one.
+    '''
+    ipath = indexpath(path)
+    ensureindex(path)
+    with open(ipath, 'rb') as f:
+        buf = f.read()
+    if buf[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+        raise ValueError('{0}: not a CSV index'.format(ipath))
+    end = len(buf) - (len(buf) - len(INDEX_MAGIC)) % INDEX_RECORD.size
+    records = list(INDEX_RECORD.iter_unpack(buf[len(INDEX_MAGIC):end]))
+    return [r[0] for r in records], [r[1] for r in records]
+
+
+def _firstutc(path):
+    ipath = indexpath(path)
+    ensureindex(path)
+    with open(ipath, 'rb') as f:
+        buf = f.read(len(INDEX_MAGIC) + INDEX_RECORD.size)
+    if len(buf) < len(INDEX_MAGIC) + INDEX_RECORD.size:
+        return None
+    return INDEX_RECORD.unpack_from(buf, len(INDEX_MAGIC))[0]
+
+
+def _utcstr(t):
+    # rows are compared as strings, str(datetime) sorts in time order
+    return str(EPOCH + dt.timedelta(seconds=t)) if t != float('inf') else '~'
+
+
+def _rows(path, offset, start, end):
+    with open(path, 'rb') as fb:
+        header = next(csv.reader([fb.readline().decode('utf-8')]))
+        fb.seek(offset)
+        for row in csv.reader(io.TextIOWrapper(fb, newline='')):
+            if not row or row[0] < start:
+                continue
+            if row[0] >= end:
+                return
+            yield dict(zip(header, row))
+
+
+def readrange(paths, start, end):
+    '''
+    Yield the rows of CSV files `paths` with ``start <= utc < end`` as
+    dicts of strings, like :class:`csv.DictReader`.  Files must be in time
+    order as must the rows within them.
+
+    :param start: datetime (UTC) or seconds since the epoch.
+    :param end: datetime (UTC) or seconds since the epoch.
+    '''
+    start = utcseconds(start) if isinstance(start, dt.datetime) else start
+    end = utcseconds(end) if isinstance(end, dt.datetime) else end
+    firsts = [(path, _firstutc(path)) for path in paths]
+    firsts = [(path, t) for path, t in firsts if t is not None]
+    for i, (path, first) in enumerate(firsts):
+        if first >= end:
+            break
+        if i + 1 < len(firsts) and firsts[i + 1][1] <= start:
+            # the next file starts before the range, nothing needed here
+            continue
+        utcs, offsets = loadindex(path)
+        j = bisect.bisect_right(utcs, start) - 1
+        yield from _rows(path, offsets[max(j, 0)], _utcstr(start),
+                _utcstr(end))
+
+
+def main():
+    from argparse import ArgumentParser
+    from .output import tocsv
+
+    def when(s):
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+            try:
+                return utcseconds(dt.datetime.strptime(s, fmt))
+            except ValueError:
+                pass
+        return utcseconds(s)
+
+    a = ArgumentParser()
+    a.add_argument('paths', nargs='+', help='CSV files written by aurora.py.')
+    a.add_argument('--start', type=when, help='UTC, eg "2015-07-20 12:00".')
+    a.add_argument('--end', type=when, help='UTC, exclusive.')
+    a.add_argument('--build', action='store_true',
+            help='(Re)build the index of each file and exit.')
+    opt = a.parse_args()
+
+    if opt.build:
+        for path in opt.paths:
+            buildindex(path)
+        return
+
+    out = tocsv(None)
+    for row in readrange(sorted(opt.paths), opt.start or 0.0,
+            opt.end or float('inf')):
+        out.send(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+
+'''
+:mod:`gateway` - share one inverter connection between many clients
+====================================================================
+
+The WiFi adapter only copes with one client at a time.  A :class:`Gateway`
+owns the adapter connection and listens on local ports speaking the same
+Aurora frames as the adapter, so existing clients work unchanged: point
+them at the gateway instead of the adapter (``aurora.py --gateway
+127.0.0.1:8898``, the poll port).  No read delay is needed, the gateway
+applies it.
+
+Each request frame is answered
+
+1. from a TTL cache of recent good responses, the TTL depends on the
+   command (see :data:`cachettls`), or
+2. by waiting for an identical request already on its way to the inverter
+   (coalescing), or
+3. by queueing the frame for the adapter.  Frames from the interactive port
+   go ahead of those from the poll port.
+
+Commands with a TTL of 0 (eg ``setTime``) are never cached or coalesced.
+If the inverter does not answer (or the adapter is unreachable) the client
+gets :data:`ERRORFRAME` back straight away rather than waiting out its own
+socket timeout, :func:`~pyaurora.protocol.execcmd` raises
+:class:`~pyaurora.protocol.GatewayError` for it.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import asyncio
+import logging
+import itertools
+from .command import Cmd
+from .protocol import (MAXRESP, GATEWAYERROR, addcrc, stripcrc,
+        CRCException, bytes2hex)
+from .metrics import registry
+
+
+log = logging.getLogger('aurora')
+
+
+FRAMESIZE = 10
+'''Size of a command frame, see :func:`~pyaurora.protocol.makecmd`.'''
+
+INTERACTIVE = 0
+POLL = 1
+
+ERRORFRAME = bytes(addcrc(bytearray((GATEWAYERROR, 0, 0, 0, 0, 0))))
+'''Response sent back for a request the inverter did not answer.'''
+
+
+cachettls = {
+    Cmd.getState: 2.0,
+    Cmd.getPartNumber: 3600.0,
+    Cmd.getVersion: 3600.0,
+    Cmd.getDsp: 2.0,
+    Cmd.getSerial: 3600.0,
+    Cmd.getMfrWeekYear: 3600.0,
+    Cmd.getCumFloatEnergy: 5.0,
+    Cmd.getTime: 0.5,
+    Cmd.setTime: 0.0,
+    Cmd.getFirmwareRel: 3600.0,
+    Cmd.getCumEnergy10: 2.0,
+    Cmd.getConfig: 3600.0,
+    Cmd.getCumEnergy: 5.0,
+    Cmd.getCumEnergyDay: 5.0,
+    Cmd.getCounters: 5.0,
+    Cmd.getLastAlarms: 2.0,
+    Cmd.getPartNumberC: 3600.0,
+    }
+'''Seconds a response to each command is served from the cache.'''
+
+
+def _counter(result):
+    return registry.counter('aurora_gateway_requests',
+            'Client requests by how they were answered.', result=result)
+
+
+_hits = _counter('hit')
+_coalesced = _counter('coalesced')
+_sent = _counter('sent')
+_failed = _counter('failed')
+
+
+class Gateway(object):
+    '''
+    :param host: WiFi adapter address.
+    :param port: WiFi adapter port.
+    :param readdelay: wait this long (seconds) between sending a frame and
+        reading the response.
+    :param timeout: seconds to wait for a response.
+    :param ttls: dict of command: cache seconds, defaults to
+        :data:`cachettls`.
+    :param defaultttl: cache seconds for commands not in `ttls`.
+    :param backoff: seconds between attempts to reconnect to the adapter,
+        requests in between fail immediately.
+    '''
+
+    def __init__(self, host, port, readdelay=0.05, timeout=5.0, ttls=None,
+            defaultttl=1.0, backoff=5.0):
+        self.host = host
+        self.port = port
+        self.readdelay = readdelay
+        self.timeout = timeout
+        self.ttls = cachettls if ttls is None else ttls
+        self.defaultttl = defaultttl
+        self.backoff = backoff
+        self.cache = {}
+        self.pending = {}
+        self.queue = None
+        self.reader = self.writer = None
+        self._lastconnect = None
+        self._seq = itertools.count()
+        registry.gauge('aurora_gateway_queue',
+                lambda: self.queue.qsize() if self.queue else 0,
+                'Frames waiting for the adapter.')
+
+    def ttl(self, frame):
+        return self.ttls.get(frame[1], self.defaultttl)
+
+    async def request(self, frame, priority=POLL):
+        '''
+        Return the response (including CRC) to a command frame or None if
+        the inverter did not answer.
+        '''
+        loop = asyncio.get_event_loop()
+        key = bytes(frame)
+        ttl = self.ttl(key)
+        if ttl > 0:
+            hit = self.cache.get(key)
+            if hit is not None and loop.time() - hit[0] < ttl:
+                _hits.inc()
+                return hit[1]
+            fut = self.pending.get(key)
+            if fut is not None:
+                _coalesced.inc()
+                return await asyncio.shield(fut)
+
+        fut = loop.create_future()
+        if ttl > 0:
+            self.pending[key] = fut
+        self.queue.put_nowait((priority, next(self._seq), key, fut))
+        # shielded so a client going away doesn't cancel the others' answer
+        return await asyncio.shield(fut)
+
+    async def _connect(self):
+        loop = asyncio.get_event_loop()
+        if (self._lastconnect is not None and
+                loop.time() - self._lastconnect < self.backoff):
+            raise ConnectionError('adapter backoff')
+        self._lastconnect = loop.time()
+        self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+        log.info('gateway connected to %s:%s', self.host, self.port)
+
+    def _disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def _exchange(self, frame):
+        if self.writer is None:
+            await self._connect()
+        self.writer.write(frame)
+        await asyncio.sleep(self.readdelay)
+        try:
+            resp = await asyncio.wait_for(self.reader.read(MAXRESP),
+                    self.timeout)
+        except asyncio.TimeoutError:
+            # a late answer would be read as the next response, start over
+            log.warning('gateway timeout, frame %s', bytes2hex(frame))
+            self._disconnect()
+            return None
+        if not resp:
+            log.warning('gateway adapter closed the connection')
+            self._disconnect()
+            return None
+        return resp
+
+    async def _adapter(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            priority, seq, key, fut = await self.queue.get()
+            try:
+                resp = await self._exchange(key)
+            except (OSError, asyncio.TimeoutError) as e:
+                log.error('gateway adapter error: %s', e)
+                self._disconnect()
+                resp = None
+            finally:
+                self.pending.pop(key, None)
+
+            if resp is None:
+                _failed.inc()
+            else:
+                _sent.inc()
+                try:
+                    stripcrc(resp)
+                except CRCException:
+                    pass
+                else:
+                    if self.ttl(key) > 0:
+                        self.cache[key] = (loop.time(), resp)
+            if not fut.done():
+                fut.set_result(resp)
+
+    def _handler(self, priority):
+
+        async def handle(reader, writer):
+            peer = writer.get_extra_info('peername')
+            log.info('gateway client %s connected', peer)
+            try:
+                while True:
+                    frame = await reader.readexactly(FRAMESIZE)
+                    resp = await self.request(frame, priority)
+                    writer.write(ERRORFRAME if resp is None else resp)
+                    await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+                log.info('gateway client %s disconnected', peer)
+
+        return handle
+
+    async def start(self, port, pollport=None, addr='127.0.0.1'):
+        '''
+        Start serving interactive clients on `port` and pollers on
+        `pollport`, returns the servers.
+        '''
+        self.queue = asyncio.PriorityQueue()
+        self._task = asyncio.ensure_future(self._adapter())
+        servers = [await asyncio.start_server(self._handler(INTERACTIVE),
+                addr, port)]
+        if pollport:
+            servers.append(await asyncio.start_server(self._handler(POLL),
+                    addr, pollport))
+        log.info('gateway listening on %s port %s, poll port %s', addr, port,
+                pollport)
+        return servers
@@ -0,0 +1,130 @@
+
+'''
+:mod:`httpsink` - batched HTTP posting on a background thread
+=============================================================
+
+:class:`HTTPSink` replaces :func:`pyaurora.post.topost` and
+:func:`pyaurora.torest.torest` where the web service is slow or unreliable.
+Posts are made on a :class:`~pyaurora.worker.QueueWorker` thread using a
+single :class:`requests.Session` so the connection is kept alive, a slow
+server fills the queue rather than stalling the poller.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import time
+import logging
+from .worker import QueueWorker
+from .spool import Spool, StoreAndForward
+
+
+log = logging.getLogger('aurora')
+
+
+_requests = None
+
+
+def _req():
+    '''
+    :mod:`requests`, imported on first use so this module imports without
+    it.
+    '''
+    global _requests
+    if _requests is None:
+        import requests
+        _requests = requests
+    return _requests
+
+
+class HTTPSink(object):
+    '''
+    Post JSON encoded inverter data to a web service.
+
+    The input may be samples, they are encoded on the worker thread with
+    `enc`, or JSON strings (eg from :func:`pyaurora.tojson`) which are
+    posted as they are.  With `batchsize` 1 each is posted alone, otherwise
+    up to `batchsize` queued samples are posted as a JSON array.
+
+    :param url: where to post.
+    :param datavar: if given post as form data with this variable name (like
+        :func:`~pyaurora.torest.torest`), otherwise the body is the JSON
+        (like :func:`~pyaurora.post.topost`).
+    :param batchsize: maximum samples per request.
+    :param maxsize: queue capacity in samples.
+    :param policy: what to do when the queue is full, see
+        :class:`~pyaurora.worker.QueueWorker`.
+    :param timeout: request timeout in seconds.
+    :param retries: number of retries after a failed request.
+    :param backoff: seconds before the first retry, doubled each retry.
+    :param spool: directory for a :class:`~pyaurora.spool.Spool`.  If given
+        samples are written there first and replayed at `replayrate` samples
+        per second after an outage, rather than dropped.
+    :param enc: JSON encoder for samples, defaults to
+        :class:`~pyaurora.dateawarejsonenc.DateAwareJSONEncoder`.
+    '''
+
+    def __init__(self, url, datavar=None, batchsize=10, maxsize=1000,
+            policy='drop-newest', timeout=5.0, retries=3, backoff=1.0,
+            spool=None, replayrate=10.0, enc=None):
+        self.url = url
+        self.datavar = datavar
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        if enc is None:
+            from .dateawarejsonenc import DateAwareJSONEncoder
+            enc = DateAwareJSONEncoder()
+        self.enc = enc
+        self.session = _req().Session()
+        if spool:
+            self.worker = StoreAndForward(self._post, Spool(spool),
+                    batchsize=batchsize, rate=replayrate, livesize=maxsize,
+                    backoff=backoff, name='httpsink')
+        else:
+            self.worker = QueueWorker(self._post, maxsize=maxsize,
+                    batchsize=batchsize, name='httpsink', policy=policy)
+        self.batchsize = batchsize
+
+    def send(self, data):
+        self.worker.send(data)
+
+    def stats(self):
+        '''
+        See :meth:`pyaurora.worker.QueueWorker.stats`.
+        '''
+        return self.worker.stats()
+
+    def close(self, timeout=None):
+        self.worker.close(timeout)
+        self.session.close()
+
+    def _body(self, batch):
+        batch = [item if isinstance(item, str) else self.enc.encode(item)
+                for item in batch]
+        if len(batch) == 1 and self.batchsize == 1:
+            body = batch[0]
+        else:
+            body = '[' + ','.join(batch) + ']'
+        if self.datavar:
+            return {self.datavar: body}
+        return body
+
+    def _post(self, batch):
+        body = self._body(batch)
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self.session.post(self.url, data=body,
+                        timeout=self.timeout)
+                resp.raise_for_status()
+                log.debug('posted %s samples: %s', len(batch),
+                        resp.status_code)
+                return
+            except _req().RequestException as e:
+                if attempt == self.retries:
+                    raise
+                log.warning('post to %s failed (%s), retry in %s seconds',
+                        self.url, e, delay)
+                time.sleep(delay)
+                delay *= 2
@@ -1,18 +1,45 @@
 '''
 Logging config for pyaurora.
 
+:func:`startlogging` applies :data:`logconfig` and then moves the handlers
+of the ``aurora`` logger behind a queue so that formatting and file writes
+happen on a listener thread rather than the polling thread.
+
+Raw frame dumps go to the ``aurora.frames`` logger which is off (WARNING)
+by default.  Set it to DEBUG to turn them on, they are rate limited by a
+:class:`RateLimitFilter`.
+
 .. moduleauthor:: paul sorenson
 '''
 
 
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+
 logconfig = {
     'version': 1,
 
+    'filters': {
+        'ratelimit': {
+            '()': 'pyaurora.logconfig.RateLimitFilter',
+            'rate': 1.0,
+            'burst': 50,
+        },
+    },
+
     'loggers': {
         'aurora': {
             'level': 'INFO',
             'handlers': ['file', 'console'],
         },
+        'aurora.frames': {
+            'level': 'WARNING',
+            'filters': ['ratelimit'],
+        },
     },
 
     'handlers': {
@@ -42,3 +69,75 @@ logconfig = {
     },
 
 }
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Token bucket filter, passes on average `rate` records per second with
+    bursts of up to `burst`.  The number suppressed is available as
+    `dropped`.
+    '''
+
+    def __init__(self, rate=1.0, burst=10):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.t = time.monotonic()
+        self.dropped = 0
+
+    def filter(self, record):
+        t = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (t - self.t) * self.rate)
+        self.t = t
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.dropped += 1
+        return False
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    '''
+    :class:`~logging.handlers.QueueHandler` that leaves the record alone
+    so the message is formatted by the listener thread, and drops records
+    rather than blocking when the queue is full.
+
+    Only suitable for queues within the process.
+    '''
+
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def startlogging(config=None, logger='aurora', maxsize=10000):
+    '''
+    Configure logging with `config` (default :data:`logconfig`) and hand the
+    handlers of `logger` to a :class:`~logging.handlers.QueueListener`.
+
+    :returns: the listener, it is stopped (flushed) at exit.
+    '''
+    from logging.config import dictConfig
+
+    dictConfig(config or logconfig)
+
+    lg = logging.getLogger(logger)
+    handlers = lg.handlers[:]
+    for h in handlers:
+        lg.removeHandler(h)
+
+    q = queue.Queue(maxsize)
+    lg.addHandler(DeferredQueueHandler(q))
+    listener = logging.handlers.QueueListener(q, *handlers,
+            respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,230 @@
+
+'''
+:mod:`metrics` - counters and histograms for the polling hot path
+=================================================================
+
+Recording is a few attribute updates so it can be left on permanently.
+Metrics live in a :class:`Registry` (normally the module level `registry`)
+and can be exposed in the Prometheus text format with :func:`serve` or
+written to the log periodically with :func:`logdump`.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import time
+import bisect
+import logging
+import threading
+from .output import coroutine
+
+
+log = logging.getLogger('aurora')
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1.0, 2.5, 5.0, 10.0)
+'''Default histogram buckets in seconds.'''
+
+
+def _labelstr(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(k, v)
+            for k, v in labels) + '}'
+
+
+class Counter(object):
+
+    kind = 'counter'
+
+    def __init__(self, name, labels=()):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self):
+        yield self.name + '_total', self.labels, self.value
+
+
+class Gauge(object):
+    '''
+    A value read from `fn` when the metrics are collected, nothing is
+    reported while `fn` returns None.
+    '''
+
+    kind = 'gauge'
+
+    def __init__(self, name, fn, labels=()):
+        self.name = name
+        self.labels = labels
+        self.fn = fn
+
+    def samples(self):
+        v = self.fn()
+        if v is not None:
+            yield self.name, self.labels, v
+
+
+class Histogram(object):
+    '''
+    Fixed bucket histogram, `buckets` are the upper bounds.
+    '''
+
+    kind = 'histogram'
+
+    def __init__(self, name, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def time(self):
+        '''
+        Context manager that observes the elapsed time of its block.
+        '''
+        return _Timer(self)
+
+    def samples(self):
+        cum = 0
+        for le, n in zip(self.buckets + ('+Inf',), self.counts):
+            cum += n
+            yield self.name + '_bucket', self.labels + (('le', le),), cum
+        yield self.name + '_sum', self.labels, self.sum
+        yield self.name + '_count', self.labels, self.count
+
+
+class _Timer(object):
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0)
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, *args):
+        labels = tuple(sorted(labels.items()))
+        key = (name, labels)
+        m = self.metrics.get(key)
+        if m is None:
+            with self.lock:
+                m = self.metrics.setdefault(key, cls(name, *args, labels=labels))
+                if help:
+                    self.help.setdefault(name, help)
+        return m
+
+    def counter(self, name, help=None, **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, fn, help=None, **labels):
+        return self._get(Gauge, name, help, labels, fn)
+
+    def histogram(self, name, help=None, buckets=LATENCY_BUCKETS, **labels):
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def exposition(self):
+        '''
+        Return all metrics in the Prometheus text format.
+        '''
+        # metrics can be added from other threads (eg per command histograms)
+        with self.lock:
+            items = sorted(self.metrics.items(), key=lambda i: i[0])
+        lines = []
+        seen = set()
+        for (name, labels), m in items:
+            if name not in seen:
+                seen.add(name)
+                if name in self.help:
+                    lines.append('# HELP {0} {1}'.format(name, self.help[name]))
+                lines.append('# TYPE {0} {1}'.format(name, m.kind))
+            for sname, slabels, value in m.samples():
+                lines.append('{0}{1} {2}'.format(sname, _labelstr(slabels),
+                        value))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+'''Default registry used by the rest of the package.'''
+
+
+def serve(port, addr='127.0.0.1', reg=None):
+    '''
+    Serve ``/metrics`` on a daemon thread, returns the server.
+    '''
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    reg = reg or registry
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = reg.exposition().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics',
+            daemon=True).start()
+    log.info('metrics on http://{0}:{1}/metrics'.format(addr, port))
+    return server
+
+
+def logdump(interval, reg=None, level=logging.INFO):
+    '''
+    Log the metrics every `interval` seconds from a daemon thread.
+    '''
+    reg = reg or registry
+
+    def dump():
+        while True:
+            time.sleep(interval)
+            log.log(level, 'metrics\n%s', reg.exposition())
+
+    t = threading.Thread(target=dump, name='metricsdump', daemon=True)
+    t.start()
+    return t
+
+
+@coroutine
+def metered(target, name, reg=None):
+    '''
+    Co-routine that passes input to target, recording the time taken by
+    target in histogram ``aurora_sink_seconds{sink=name}``.
+    '''
+    reg = reg or registry
+    hist = reg.histogram('aurora_sink_seconds',
+            'Time taken by output sinks per sample.', sink=name)
+    perf_counter = time.perf_counter
+    while True:
+        d = (yield)
+        t0 = perf_counter()
+        target.send(d)
+        hist.observe(perf_counter() - t0)
@@ -15,9 +15,11 @@ of the keys.
 
 
 import sys
-import pprint
 import csv
-from .dateawarejsonenc import DateAwareJSONEncoder
+import math
+import logging
+import datetime as dt
+from collections import OrderedDict
 
 
 def coroutine(func):
@@ -49,6 +51,17 @@ def tee(ltarget):
             target.send(d)
 
 
+@coroutine
+def unbatch(target):
+    '''
+    Co-routine that accepts a sequence of items and sends them to target
+    one at a time.
+    '''
+    while True:
+        for d in (yield):
+            target.send(d)
+
+
 @coroutine
 def tostream(fout=None, flush=False):
     if fout is None:
@@ -60,8 +73,19 @@ def tostream(fout=None, flush=False):
             fout.flush()
 
 
+@coroutine
+def tolog(logger='aurora', level=logging.WARNING):
+    '''
+    Co-routine that logs each input.
+    '''
+    log = logging.getLogger(logger)
+    while True:
+        log.log(level, '%s', (yield))
+
+
 @coroutine
 def prettyprint(fout=None):
+    import pprint
 
     if fout is None:
         fout = sys.stdout
@@ -73,8 +97,34 @@ def prettyprint(fout=None):
         pp.pprint(d)
 
 
+def csvheader(fout):
+    '''
+    Return the field names in the header of CSV file `fout`, which may be
+    open for appending.
+    '''
+    if fout.readable():
+        pos = fout.tell()
+        fout.seek(0)
+        line = fout.readline()
+        fout.seek(pos)
+    else:
+        with open(fout.name, newline='') as fin:
+            line = fin.readline()
+    return next(csv.reader([line]), [])
+
+
 @coroutine
-def tocsv(fout=None):
+def tocsv(fout=None, index=None):
+    '''
+    Co-routine that writes input to CSV, the fields of the first input
+    become the header.
+
+    :param index: optional :class:`~pyaurora.csvindex.CSVIndex` for `fout`,
+        told the offset of each row as it is written.
+    :raises ValueError: from the first `send()` if `fout` already has a
+        header with different fields (eg the poll operations changed),
+        start a new file instead.
+    '''
 
     if fout is None:
         fout = sys.stdout
@@ -83,13 +133,20 @@ def tocsv(fout=None):
         writehdr = False if fout.tell() else True
 
     d = (yield)
+    if not writehdr:
+        header = csvheader(fout)
+        if header != list(d.keys()):
+            raise ValueError('{0} has fields {1} not {2}'.format(
+                    getattr(fout, 'name', 'output'), ','.join(header),
+                    ','.join(d.keys())))
     wr = csv.DictWriter(fout, fieldnames=d.keys())
     if writehdr:
         wr.writeheader()
-    wr.writerow(d)
     while True:
-        d = (yield)
+        if index is not None:
+            index.add(d['utc'], fout.tell())
         wr.writerow(d)
+        d = (yield)
 
 
 @coroutine
@@ -100,10 +157,13 @@ def tojson(target, enc=None):
     :param target: downstream co-routine.
 
     :param enc: use alternative JSON encoder.  If not specified
-        a :class:`DateAwareJSONEncoder` is used.
+        a :class:`DateAwareJSONEncoder` is used, pass
+        ``SampleJSONEncoder(useorjson=True)`` for speed (see
+        :mod:`pyaurora.samplejsonenc`).
     '''
 
     if enc is None:
+        from .dateawarejsonenc import DateAwareJSONEncoder
         enc = DateAwareJSONEncoder()
     while True:
         target.send(enc.encode((yield)))
@@ -113,3 +173,150 @@ def tojson(target, enc=None):
 def bytes2str(target, enc='utf-8'):
     while True:
         target.send((yield).decode(enc))
+
+
+anomalyfields = ('iLeakDcDc', 'iLeakInverter', 'boosterTemp', 'rIsoRes',
+        'gridVoltageAll', 'frequencyAll')
+'''Fields watched by :func:`detectanomalies` by default.'''
+
+
+class FieldStats(object):
+    '''
+    Constant size online statistics for one field: exponentially weighted
+    mean and variance (for z-scores that follow the daily cycle), Welford
+    mean and variance over all samples and the rate of change.
+    '''
+
+    __slots__ = ('alpha', 'n', 'mean', 'm2', 'ewma', 'ewvar', 'last',
+            'lastt', 'rate')
+
+    def __init__(self, alpha=0.05):
+        self.alpha = alpha
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+        self.ewvar = 0.0
+        self.last = None
+        self.lastt = None
+        self.rate = None
+
+    def zscore(self, x):
+        '''
+        z-score of `x` against the EWMA, call before :meth:`update`.
+        '''
+        if self.ewma is None or self.ewvar <= 0.0:
+            return 0.0
+        return (x - self.ewma) / math.sqrt(self.ewvar)
+
+    def update(self, x, t=None):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+        if self.ewma is None:
+            self.ewma = x
+        else:
+            diff = x - self.ewma
+            incr = self.alpha * diff
+            self.ewma += incr
+            self.ewvar = (1.0 - self.alpha) * (self.ewvar + diff * incr)
+
+        if t is not None and self.lastt is not None and t > self.lastt:
+            self.rate = (x - self.last) / (t - self.lastt)
+        else:
+            # no time or time didn't advance, don't report a stale rate
+            self.rate = None
+        self.last, self.lastt = x, t
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+
+def _seconds(utc):
+    if isinstance(utc, dt.datetime):
+        return (utc - dt.datetime(1970, 1, 1)).total_seconds()
+    return None
+
+
+@coroutine
+def detectanomalies(target=None, alerts=None, fields=anomalyfields,
+        alpha=0.05, zmax=4.0, warmup=30, limits=None, maxrates=None):
+    '''
+    Co-routine that watches fields of each sample and sends an alert to
+    `alerts` when a value is outside its limits, its z-score against the
+    EWMA exceeds `zmax` or it changes faster than its maximum rate.
+    Samples are passed on to `target` unchanged.  State is a
+    :class:`FieldStats` per field so run one of these per inverter.
+
+    An alert is an `OrderedDict` with keys ``utc``, ``field``, ``value``,
+    ``kind`` (``limit``, ``zscore`` or ``rate``) and ``score`` (the limit
+    breached, the z-score or the rate per second).
+
+    :param target: downstream co-routine or None.
+    :param alerts: co-routine for alerts, eg :func:`tojson`.
+    :param fields: names of the fields to watch, fields missing from the
+        samples are skipped.  ``rIsoRes`` (a default) is not in
+        :data:`~pyaurora.command.pollops`, ``aurora.py --detect-anomalies``
+        adds the watched fields to its poll.
+    :param alpha: EWMA smoothing factor.
+    :param zmax: z-score threshold.
+    :param warmup: samples per field before z-scores are checked.
+    :param limits: dict of field: (low, high), either may be None.  These
+        fields are watched as well as `fields`.
+    :param maxrates: dict of field: maximum absolute change per second,
+        also watched.
+    '''
+    limits = limits or {}
+    maxrates = maxrates or {}
+    fields = tuple(fields) + tuple(f for f in list(limits) + list(maxrates)
+            if f not in fields)
+    stats = OrderedDict((f, FieldStats(alpha)) for f in fields)
+
+    def alert(utc, field, value, kind, score):
+        if alerts is not None:
+            od = OrderedDict()
+            od['utc'] = utc
+            od['field'] = field
+            od['value'] = value
+            od['kind'] = kind
+            od['score'] = score
+            alerts.send(od)
+
+    while True:
+        d = (yield)
+        utc = d.get('utc')
+        t = _seconds(utc)
+        for f, st in stats.items():
+            x = d.get(f)
+            if x is None or x == '':
+                continue
+            try:
+                x = float(x)
+            except (TypeError, ValueError):
+                # eg a firmware string, or a garbled CSV cell
+                continue
+            if x != x:
+                continue
+
+            lo, hi = limits.get(f, (None, None))
+            if lo is not None and x < lo:
+                alert(utc, f, x, 'limit', lo)
+            elif hi is not None and x > hi:
+                alert(utc, f, x, 'limit', hi)
+
+            if st.n >= warmup:
+                z = st.zscore(x)
+                if abs(z) > zmax:
+                    alert(utc, f, x, 'zscore', z)
+
+            st.update(x, t)
+            maxrate = maxrates.get(f)
+            if maxrate is not None and st.rate is not None and \
+                    abs(st.rate) > maxrate:
+                alert(utc, f, x, 'rate', st.rate)
+
+        if target is not None:
+            target.send(d)
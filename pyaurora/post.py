@@ -8,7 +8,6 @@ Test post aurora data.
 
 
 from .output import coroutine
-import requests as req
 
 
 @coroutine
@@ -16,9 +15,14 @@ def topost(url):
     '''
     Co-routine for posting inverter data to web service.
 
-    The incoming data should be encoded as JSON.
+    The incoming data should be encoded as JSON.  The post is made on the
+    calling thread, see :class:`pyaurora.httpsink.HTTPSink` for a
+    non-blocking alternative.
     '''
+    import requests as req
+
+    session = req.Session()
     while True:
         data = (yield)
-        resp = req.post(url, data=data)
+        resp = session.post(url, data=data)
 
@@ -33,14 +33,36 @@ import socket as skt
 import struct
 from argparse import ArgumentParser
 import logging
+from .metrics import registry
 
 
 log = logging.getLogger('aurora')
+frames = logging.getLogger('aurora.frames')
 
 
 MAXRESP = 16
 'It is probably more like 10 but not sure.'''
 
+GATEWAYERROR = 255
+'''Transmission state of the response an aurgw.py gateway sends when the
+inverter did not answer, inverters only use 0 and 51..58.'''
+
+
+_crcerrors = registry.counter('aurora_crc_errors',
+        'Responses with a bad CRC.')
+_timeouts = registry.counter('aurora_timeouts',
+        'Commands that timed out.')
+_rtt = {}
+
+
+def _rtthist(cmd):
+    hist = _rtt.get(cmd)
+    if hist is None:
+        hist = _rtt[cmd] = registry.histogram('aurora_command_seconds',
+                'Command round trip time including the read delay.',
+                cmd=getattr(cmd, 'name', cmd))
+    return hist
+
 
 class CRCException(Exception):
 
@@ -54,6 +76,13 @@ class CRCException(Exception):
                 bytes2hex(self.crc))
 
 
+class GatewayError(Exception):
+    '''
+    A gateway answered for an inverter that did not, see
+    :mod:`pyaurora.gateway`.
+    '''
+
+
 def tolong(buf):
     '''
     Convert 4 bytes to long.
@@ -85,7 +114,11 @@ def getfloat(buf):
 
 
 def getstring(buf):
-    return str(buf[2:])
+    '''
+    Take an inverter response and decode the ASCII characters after the
+    state bytes.
+    '''
+    return bytes(buf[2:]).decode('ascii', 'replace').strip('\0 ')
 
 
 def gettime(buf):
@@ -100,6 +133,22 @@ def bytes2hex(buf):
     return codecs.encode(buf, 'hex_codec')
 
 
+class HexDump(object):
+    '''
+    Log message argument that hex encodes `buf` only when the message is
+    formatted, so frames dropped by a filter (or formatted later on the
+    log listener thread) cost the poller nothing.
+    '''
+
+    __slots__ = ('buf',)
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def __str__(self):
+        return str(bytes2hex(self.buf))
+
+
 def word2bytearray(i):
     b = bytearray()
     b.append(i & 0xff)
@@ -174,7 +223,7 @@ def makecmd(addr, cmd, subcmd=None):
     :param cmd: aurora command byte.
     '''
 
-    log.debug('cmd: {0} subcmd: {1}'.format(cmd, subcmd))
+    log.debug('cmd: %s subcmd: %s', cmd, subcmd)
 
     buf = bytearray([b for b in (addr, cmd, subcmd, 0) if b is not None])
 
@@ -198,13 +247,30 @@ def execcmd(sock, addr, cmd, subcmd=None, readdelay=0.05):
 
     :raises: CRCException if the calculated CRC does not match the 
         response buffer.
+    :raises: GatewayError if a gateway sent its error response.
     '''
+    t0 = time.perf_counter()
     cmdbuf = makecmd(addr, cmd, subcmd)
-    log.debug('cmd buffer: {0}'.format(bytes2hex(cmdbuf)))
-    sock.send(cmdbuf)
-    time.sleep(readdelay)
-    respbuf = sock.recv(MAXRESP)
-    log.debug('response buffer: {0}'.format(bytes2hex(respbuf)))
-
-    return stripcrc(respbuf)
+    if frames.isEnabledFor(logging.DEBUG):
+        frames.debug('cmd buffer: %s', HexDump(cmdbuf))
+    try:
+        sock.send(cmdbuf)
+        time.sleep(readdelay)
+        respbuf = sock.recv(MAXRESP)
+    except skt.timeout:
+        _timeouts.inc()
+        raise
+    if frames.isEnabledFor(logging.DEBUG):
+        frames.debug('response buffer: %s', HexDump(respbuf))
+    _rtthist(cmd).observe(time.perf_counter() - t0)
+
+    try:
+        resp = stripcrc(respbuf)
+    except CRCException:
+        _crcerrors.inc()
+        raise
+    if resp[:1] == bytes((GATEWAYERROR,)):
+        raise GatewayError('no answer to {0}'.format(getattr(cmd, 'name',
+                cmd)))
+    return resp
 
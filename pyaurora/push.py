@@ -0,0 +1,256 @@
+
+'''
+:mod:`push` - live samples for dashboards over SSE and WebSocket
+================================================================
+
+A :class:`PushServer` is a small asyncio HTTP server that fans each sample
+out to every connected browser:
+
+``GET /events``
+    Server-Sent Events, one ``data:`` line of JSON per sample.
+``GET /ws``
+    WebSocket, one text message of JSON per sample.  Anything the client
+    sends is ignored apart from close, which is echoed before the server
+    closes the connection.
+
+Each sample is encoded once, the same bytes are queued for every client of
+a kind.  Every client has a short bounded queue, a client that can't keep
+up (its queue is full) is disconnected rather than buffered for, the
+browser's EventSource or dashboard code reconnects and gets the latest
+sample straight away.
+
+:meth:`PushServer.send` is thread safe so the server can be the target of a
+co-routine pipeline running on another thread, eg
+:func:`~pyaurora.cozmq.fromzmqpoll`.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import base64
+import struct
+import asyncio
+import hashlib
+import logging
+from .metrics import registry
+
+
+log = logging.getLogger('aurora')
+
+
+WSGUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+SSE, WS = 'sse', 'ws'
+
+
+_messages = registry.counter('aurora_push_messages',
+        'Samples pushed to dashboard clients.')
+_dropped = registry.counter('aurora_push_dropped_clients',
+        'Dashboard clients disconnected for being too slow.')
+
+
+def sseframe(payload):
+    return b'data: ' + payload + b'\n\n'
+
+
+def wsframe(payload, opcode=0x1):
+    '''
+    Unmasked final WebSocket frame as sent by a server.
+    '''
+    n = len(payload)
+    if n < 126:
+        hdr = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 0x10000:
+        hdr = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        hdr = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return hdr + payload
+
+
+_keepalives = {SSE: b': keepalive\n\n', WS: wsframe(b'', 0x9)}
+
+
+def _response(status, headers=()):
+    lines = ['HTTP/1.1 ' + status] + ['{0}: {1}'.format(k, v)
+            for k, v in headers]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+class _Client(object):
+
+    def __init__(self, kind, writer, maxqueue):
+        self.kind = kind
+        self.writer = writer
+        self.queue = asyncio.Queue(maxqueue)
+
+
+class PushServer(object):
+    '''
+    :param maxqueue: messages queued per client before it is dropped.
+    :param keepalive: seconds of silence before a keepalive is sent (an SSE
+        comment or a WebSocket ping).
+    :param enc: JSON encoder for samples that aren't already strings,
+        defaults to :class:`~pyaurora.dateawarejsonenc.DateAwareJSONEncoder`.
+    :param writebuffer: bytes buffered by the transport for each client
+        before writes wait, keeps slow clients from hiding in the kernel.
+    '''
+
+    def __init__(self, maxqueue=16, keepalive=15.0, enc=None,
+            writebuffer=65536):
+        if enc is None:
+            from .dateawarejsonenc import DateAwareJSONEncoder
+            enc = DateAwareJSONEncoder()
+        self.enc = enc
+        self.maxqueue = maxqueue
+        self.keepalive = keepalive
+        self.writebuffer = writebuffer
+        self.clients = set()
+        self.latest = None
+        self.loop = None
+        registry.gauge('aurora_push_clients', lambda: len(self.clients),
+                'Connected dashboard clients.')
+
+    def send(self, d):
+        '''
+        Push a sample (dict or JSON string) to every client, may be called
+        from any thread once the server has started.
+        '''
+        self.loop.call_soon_threadsafe(self.publish, d)
+
+    def publish(self, d):
+        '''
+        Push a sample, must be called on the event loop thread.
+        '''
+        payload = (d if isinstance(d, str) else self.enc.encode(d)).encode(
+                'utf-8')
+        frames = {SSE: sseframe(payload), WS: wsframe(payload)}
+        self.latest = frames
+        _messages.inc()
+        for client in list(self.clients):
+            try:
+                client.queue.put_nowait(frames[client.kind])
+            except asyncio.QueueFull:
+                _dropped.inc()
+                log.info('push: dropping slow client %s',
+                        client.writer.get_extra_info('peername'))
+                self._drop(client, abort=True)
+
+    def _drop(self, client, abort=False):
+        self.clients.discard(client)
+        if abort:
+            # don't wait for a slow client to take what is already buffered
+            client.writer.transport.abort()
+        else:
+            client.writer.close()
+
+    async def _pump(self, client):
+        writer = client.writer
+        if self.latest is not None:
+            client.queue.put_nowait(self.latest[client.kind])
+        try:
+            while client in self.clients:
+                try:
+                    msg = await asyncio.wait_for(client.queue.get(),
+                            self.keepalive)
+                except asyncio.TimeoutError:
+                    msg = _keepalives[client.kind]
+                if client not in self.clients:
+                    # the WebSocket was closed while we waited
+                    break
+                writer.write(msg)
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _wsreader(self, reader, client):
+        # client frames are read and discarded, only close matters
+        try:
+            while True:
+                b0, b1 = await reader.readexactly(2)
+                n = b1 & 0x7f
+                if n == 126:
+                    n = struct.unpack('!H', await reader.readexactly(2))[0]
+                elif n == 127:
+                    n = struct.unpack('!Q', await reader.readexactly(8))[0]
+                buf = await reader.readexactly(n + (4 if b1 & 0x80 else 0))
+                if b0 & 0x0f == 0x8:
+                    # echo the status code (if any) as the closing handshake
+                    if b1 & 0x80:
+                        mask, buf = buf[:4], buf[4:]
+                        buf = bytes(b ^ mask[i % 4] for i, b in
+                                enumerate(buf[:2]))
+                    self.clients.discard(client)
+                    client.writer.write(wsframe(buf[:2], 0x8))
+                    await client.writer.drain()
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                    10.0)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError):
+            writer.close()
+            return
+        lines = head.decode('latin-1').split('\r\n')
+        method, path = (lines[0].split() + ['', ''])[:2]
+        headers = {}
+        for line in lines[1:]:
+            k, _, v = line.partition(':')
+            headers[k.strip().lower()] = v.strip()
+        path = path.split('?')[0]
+
+        if method != 'GET' or path not in ('/events', '/ws'):
+            writer.write(_response('404 Not Found',
+                    [('Content-Length', '0'), ('Connection', 'close')]))
+            writer.close()
+            return
+
+        if path == '/ws':
+            key = headers.get('sec-websocket-key')
+            if headers.get('upgrade', '').lower() != 'websocket' or not key:
+                writer.write(_response('400 Bad Request',
+                        [('Content-Length', '0'), ('Connection', 'close')]))
+                writer.close()
+                return
+            accept = base64.b64encode(hashlib.sha1(key.encode('latin-1') +
+                    WSGUID).digest()).decode('ascii')
+            writer.write(_response('101 Switching Protocols', [
+                    ('Upgrade', 'websocket'),
+                    ('Connection', 'Upgrade'),
+                    ('Sec-WebSocket-Accept', accept)]))
+            client = _Client(WS, writer, self.maxqueue)
+        else:
+            writer.write(_response('200 OK', [
+                    ('Content-Type', 'text/event-stream'),
+                    ('Cache-Control', 'no-cache'),
+                    ('Access-Control-Allow-Origin', '*'),
+                    ('Connection', 'keep-alive')]))
+            client = _Client(SSE, writer, self.maxqueue)
+
+        writer.transport.set_write_buffer_limits(high=self.writebuffer)
+        self.clients.add(client)
+        log.info('push: %s client %s connected', client.kind, peer)
+        tasks = [asyncio.ensure_future(self._pump(client))]
+        if client.kind == WS:
+            tasks.append(asyncio.ensure_future(self._wsreader(reader, client)))
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._drop(client)
+            log.info('push: %s client %s disconnected', client.kind, peer)
+
+    async def start(self, port, addr='127.0.0.1'):
+        '''
+        Start listening, returns the server.
+        '''
+        self.loop = asyncio.get_event_loop()
+        server = await asyncio.start_server(self._handle, addr, port)
+        log.info('push: listening on http://%s:%s/events and /ws', addr,
+                port)
+        return server
@@ -0,0 +1,218 @@
+
+'''
+:mod:`replay` - play archived samples through output pipelines
+===============================================================
+
+:func:`readrows` streams samples back from the CSV files written by
+:func:`~pyaurora.output.tocsv` (using :mod:`~pyaurora.csvindex` when a time
+range is given), an SQLite database loaded by `auroraload.py` or a binary
+archive written by :func:`~pyaurora.wire.toarchive`.  The original ``utc``
+is kept, values are floats (None when missing).
+
+:func:`replay` sends them to any target at the original pace, `speed`
+times faster or as fast as possible and can fan every sample out to a
+number of synthetic inverters, each copy carries an ``inverter`` field.
+It returns throughput and per-send latency so sinks can be pushed until
+they saturate::
+
+    stats = replay(readrows(paths), tojson(tozmq(zock)), speed=None,
+            inverters=50)
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import os
+import csv
+import time
+import random
+import sqlite3
+import logging
+import datetime as dt
+from collections import OrderedDict
+from .wire import readarchive
+
+
+log = logging.getLogger('aurora')
+
+
+RESERVOIR = 10000
+'''Send latencies kept for the percentiles, a uniform sample of them all.'''
+
+
+def _float(v):
+    if v is None or v == '':
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        return v
+
+
+def _utc(v):
+    if isinstance(v, dt.datetime):
+        return v
+    v = v.replace('T', ' ')
+    fmt = '%Y-%m-%d %H:%M:%S.%f' if '.' in v else '%Y-%m-%d %H:%M:%S'
+    return dt.datetime.strptime(v, fmt)
+
+
+def _sample(names, row):
+    od = OrderedDict()
+    for n, v in zip(names, row):
+        od[n] = _utc(v) if n == 'utc' else _float(v)
+    return od
+
+
+def readcsv(path, start=None, end=None):
+    if start is not None or end is not None:
+        from .csvindex import readrange
+        for row in readrange([path], start or 0.0, end or float('inf')):
+            yield _sample(row.keys(), row.values())
+        return
+    with open(path, newline='') as fin:
+        rdr = csv.reader(fin)
+        names = next(rdr)
+        for row in rdr:
+            if row:
+                yield _sample(names, row)
+
+
+def readdb(path, start=None, end=None, table='samples'):
+    conn = sqlite3.connect(path)
+    try:
+        sql = 'select * from {0}'.format(table)
+        where = []
+        args = []
+        if start is not None:
+            where.append('utc >= ?')
+            args.append(str(start))
+        if end is not None:
+            where.append('utc < ?')
+            args.append(str(end))
+        if where:
+            sql += ' where ' + ' and '.join(where)
+        cur = conn.execute(sql + ' order by utc', args)
+        names = [d[0] for d in cur.description]
+        for row in cur:
+            yield _sample(names, row)
+    finally:
+        conn.close()
+
+
+def readbin(path, start=None, end=None):
+    with open(path, 'rb') as fin:
+        for d in readarchive(fin):
+            if start is not None and d['utc'] < start:
+                continue
+            if end is not None and d['utc'] >= end:
+                return
+            yield d
+
+
+readers = {
+    '.csv': readcsv,
+    '.db': readdb,
+    '.sqlite': readdb,
+    '.bin': readbin,
+    '.arc': readbin,
+    }
+'''Reader by file extension.'''
+
+
+def readrows(paths, start=None, end=None):
+    '''
+    Yield samples from each path in turn, optionally only those with
+    ``start <= utc < end`` (datetimes, UTC).
+    '''
+    for path in paths:
+        ext = os.path.splitext(path)[1].lower()
+        try:
+            reader = readers[ext]
+        except KeyError:
+            raise ValueError('{0}: unknown file type'.format(path))
+        yield from reader(path, start, end)
+
+
+def _percentile(sortedvalues, p):
+    if not sortedvalues:
+        return None
+    return sortedvalues[min(len(sortedvalues) - 1,
+            int(p * len(sortedvalues)))]
+
+
+def replay(samples, target, speed=1.0, inverters=1, limit=None):
+    '''
+    Send `samples` to `target`.
+
+    :param speed: 1 replays at the pace of the original timestamps, 10 ten
+        times faster, None or 0 as fast as the target accepts them.
+    :param inverters: send each sample this many times, with an
+        ``inverter`` field of ``inv0``, ``inv1``, ...  If 1 samples are
+        sent unchanged.
+    :param limit: stop after this many samples (before multiplexing).
+    :returns: dict of ``samples`` (sent, including copies), ``seconds``,
+        ``rate`` (samples per second), ``p50``/``p99``/``max`` seconds per
+        send and ``lag``, the furthest the replay fell behind its schedule
+        in seconds.  The percentiles are estimated from at most
+        :data:`RESERVOIR` sends so memory doesn't grow with the replay.
+    '''
+    names = ['inv{0}'.format(i) for i in range(inverters)]
+    latencies = []
+    slowest = None
+    sent = 0
+    lag = 0.0
+    first = None
+    perf_counter = time.perf_counter
+    t0 = perf_counter()
+    for n, d in enumerate(samples):
+        if limit is not None and n >= limit:
+            break
+        if speed:
+            if first is None:
+                first = d['utc']
+            due = t0 + (d['utc'] - first).total_seconds() / speed
+            delay = due - perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+
+        if inverters == 1:
+            copies = (d,)
+        else:
+            copies = []
+            for name in names:
+                od = OrderedDict(utc=d['utc'], inverter=name)
+                od.update(d)
+                # an inverter field in the sample keeps its place only
+                od['inverter'] = name
+                copies.append(od)
+        for c in copies:
+            t = perf_counter()
+            target.send(c)
+            latency = perf_counter() - t
+            sent += 1
+            if slowest is None or latency > slowest:
+                slowest = latency
+            # reservoir sampling
+            if len(latencies) < RESERVOIR:
+                latencies.append(latency)
+            else:
+                i = random.randrange(sent)
+                if i < RESERVOIR:
+                    latencies[i] = latency
+
+    seconds = perf_counter() - t0
+    latencies.sort()
+    stats = {
+        'samples': sent,
+        'seconds': seconds,
+        'rate': sent / seconds if seconds else None,
+        'p50': _percentile(latencies, 0.5),
+        'p99': _percentile(latencies, 0.99),
+        'max': slowest,
+        'lag': lag,
+        }
+    log.info('replay: %s', stats)
+    return stats
@@ -0,0 +1,121 @@
+
+'''
+:mod:`samplejsonenc` - fast JSON encoding of inverter samples
+=============================================================
+
+:class:`DateAwareJSONEncoder` is general purpose, every datetime goes
+through :meth:`~json.JSONEncoder.default` and the key strings are escaped
+again for every sample.  The samples produced by the poller are flat
+dictionaries whose keys rarely change so the encoder here caches the escaped
+key prefixes per key sequence and formats the values directly.  Its output
+is the same as :class:`DateAwareJSONEncoder` but, written in Python, it is
+no faster than the C accelerated :mod:`json` encoder (``python -m
+bench.jsonenc``) so it is not the default anywhere.
+
+With ``useorjson=True`` :mod:`orjson` is used when it is installed, more
+than ten times faster.  Its output is not the same: it is compact (no
+spaces after separators) and writes NaN and infinities as ``null``, so it
+is opt-in.  The key prefix
+cache is bounded by `maxprefixes`, sparse samples (eg from
+:mod:`~pyaurora.compress`) would otherwise grow it without limit.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import datetime as dt
+import math
+from json.encoder import encode_basestring_ascii
+from .dateawarejsonenc import DateAwareJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _fmtfloat(f):
+    if f != f:
+        return 'NaN'
+    if math.isinf(f):
+        return 'Infinity' if f > 0 else '-Infinity'
+    return float.__repr__(f)
+
+
+def _fmtdatetime(d):
+    return '"' + d.isoformat() + '"'
+
+
+_formatters = {
+    float: _fmtfloat,
+    int: int.__repr__,
+    str: encode_basestring_ascii,
+    bool: lambda b: 'true' if b else 'false',
+    type(None): lambda n: 'null',
+    dt.datetime: _fmtdatetime,
+    dt.date: _fmtdatetime,
+}
+
+
+class SampleJSONEncoder(object):
+    '''
+    Encoder specialised for flat dictionaries of inverter values.
+
+    It has the same :meth:`encode` interface as :class:`json.JSONEncoder`
+    so it can be passed to :func:`pyaurora.output.tojson` as `enc`.  Values
+    of types it doesn't know about, and nested containers, are handed to
+    a :class:`DateAwareJSONEncoder` so the output is the same as before.
+
+    :param useorjson: use :mod:`orjson` if it is available, see above.
+    :param maxprefixes: key sequences to cache prefixes for, the cache is
+        cleared when it is full.
+    '''
+
+    def __init__(self, useorjson=False, maxprefixes=64):
+        self.useorjson = useorjson and orjson is not None
+        self.maxprefixes = maxprefixes
+        self._fallback = DateAwareJSONEncoder()
+        self._prefixes = {}
+
+    def _keyprefixes(self, keys):
+        try:
+            return self._prefixes[keys]
+        except KeyError:
+            pass
+        if all(type(k) is str for k in keys):
+            prefixes = tuple(
+                    ('{' if i == 0 else ', ') + encode_basestring_ascii(k) + ': '
+                    for i, k in enumerate(keys))
+        else:
+            prefixes = None
+        if len(self._prefixes) >= self.maxprefixes:
+            self._prefixes.clear()
+        self._prefixes[keys] = prefixes
+        return prefixes
+
+    def encode(self, o):
+        if not isinstance(o, dict):
+            return self._fallback.encode(o)
+
+        if self.useorjson:
+            try:
+                return orjson.dumps(o).decode('utf-8')
+            except TypeError:
+                return self._fallback.encode(o)
+
+        if not o:
+            return '{}'
+
+        prefixes = self._keyprefixes(tuple(o))
+        if prefixes is None:
+            return self._fallback.encode(o)
+
+        parts = []
+        fmts = _formatters
+        fallback = self._fallback.encode
+        for prefix, v in zip(prefixes, o.values()):
+            fmt = fmts.get(type(v))
+            parts.append(prefix)
+            parts.append(fmt(v) if fmt is not None else fallback(v))
+        parts.append('}')
+        return ''.join(parts)
@@ -2,16 +2,52 @@
 
 '''
 Simple cron scheduler with focus on "accurate" clock time.
+
+:func:`adaptivescheduler` instead takes its interval from an
+:class:`AdaptiveInterval` fed with the polled samples by :func:`adapt`, so
+the inverter is polled quickly while power is changing and slowly while it
+is stable::
+
+    ctl = AdaptiveInterval(2, 60)
+    adaptivescheduler(ctl, inverterpoll, inverterrdr=rdr,
+            operations=operations, target=adapt(target, ctl))
+
+Samples are then no longer evenly spaced.  The difference between two
+readings of a cumulative counter such as ``getEnergy10`` is the energy over
+whatever time separated them, from 2 seconds to a minute or more, so
+consumers must divide by the ``utc`` difference (or resample) rather than
+treat each delta as the energy of one fixed interval.
 '''
 
 
 import time
 import sched
 import logging
+import datetime as dt
+from .metrics import registry
+from .output import coroutine
 
 log = logging.getLogger('aurora')
 
 
+_lateness = registry.histogram('aurora_schedule_lateness_seconds',
+        'How late each scheduled run started.')
+_cycle = registry.histogram('aurora_cycle_seconds',
+        'Duration of each scheduled run (eg a complete inverter poll).')
+# set by AdaptiveInterval.update(), one gauge however many controllers
+_interval = registry.gauge('aurora_poll_interval_seconds', lambda: None,
+        'Latest adaptive poll interval.')
+
+
+def _timed(due, func, *args, **kwargs):
+    t = time.time()
+    _lateness.observe(max(0.0, t - due))
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _cycle.observe(time.time() - t)
+
+
 def scheduler(interval, func, offset=0, *args, **kwargs):
     '''
     Run func every interval seconds + offset.
@@ -29,16 +65,111 @@ def scheduler(interval, func, offset=0, *args, **kwargs):
     modt = (int(t) % interval) - offset
     deltat = interval - modt - (t - (int(t)))
     while True:
-        log.debug('deltat: {0} seconds'.format(deltat))
-        s.enter(deltat, 0, func, argument=args, kwargs=kwargs)
+        log.debug('deltat: %s seconds', deltat)
+        s.enter(deltat, 0, _timed, argument=(time.time() + deltat, func) + args,
+                kwargs=kwargs)
         s.run()
         t = time.time()
         modt = (int(t) % interval) - offset
         deltat = interval - modt - (t - (int(t))) 
 
 
+adaptrates = {'gridPowerAll': 20.0, 'in1Current': 0.05}
+'''Rate of change per second of each field that is considered fast.'''
+
+
+class AdaptiveInterval(object):
+    '''
+    Poll interval controller.  After each sample the fastest rate of change
+    of the watched fields, relative to its entry in `rates`, decides the
+    next interval: at or above 1 it drops straight to `mininterval`, below
+    `calm` it grows by `grow` up to `maxinterval`, otherwise it is kept.
+
+    :param rates: dict of field: rate of change per second considered
+        fast, defaults to :data:`adaptrates`.
+    '''
+
+    def __init__(self, mininterval, maxinterval, rates=None, calm=0.25,
+            grow=1.5):
+        if not 0 < mininterval <= maxinterval:
+            raise ValueError('need 0 < mininterval <= maxinterval')
+        self.mininterval = mininterval
+        self.maxinterval = maxinterval
+        self.rates = rates or adaptrates
+        self.calm = calm
+        self.grow = grow
+        self.interval = mininterval
+        self.activity = None
+        self._last = {}
+
+    def update(self, d):
+        '''
+        Take a sample, return the interval until the next poll.
+        '''
+        t = d.get('utc')
+        if isinstance(t, dt.datetime):
+            t = (t - dt.datetime(1970, 1, 1)).total_seconds()
+        else:
+            t = time.time()
+
+        activity = None
+        for f, rate in self.rates.items():
+            try:
+                v = float(d[f])
+            except (KeyError, TypeError, ValueError):
+                continue
+            last = self._last.get(f)
+            self._last[f] = (t, v)
+            if last is None or t <= last[0] or v != v:
+                continue
+            a = abs(v - last[1]) / (t - last[0]) / rate
+            activity = a if activity is None else max(activity, a)
+
+        if activity is not None:
+            if activity >= 1.0:
+                self.interval = self.mininterval
+            elif activity < self.calm:
+                self.interval = min(self.maxinterval, self.interval * self.grow)
+            log.debug('activity %.3f, interval %.1f seconds', activity,
+                    self.interval)
+        self.activity = activity
+        interval = self.interval
+        _interval.fn = lambda: interval
+        return interval
+
+
+@coroutine
+def adapt(target, controller):
+    '''
+    Co-routine that passes samples to target after feeding them to an
+    :class:`AdaptiveInterval`.
+    '''
+    while True:
+        d = (yield)
+        controller.update(d)
+        target.send(d)
+
+
+def adaptivescheduler(controller, func, *args, **kwargs):
+    '''
+    Run func repeatedly, waiting ``controller.interval`` seconds from the
+    start of one run to the start of the next.  Something (normally
+    :func:`adapt` on the output) must feed the polled samples to
+    `controller`.  If a run takes longer than the interval the next one
+    starts immediately.
+    '''
+    s = sched.scheduler()
+
+    due = time.time()
+    while True:
+        deltat = max(0.0, due - time.time())
+        log.debug('deltat: %s seconds', deltat)
+        s.enter(deltat, 0, _timed, argument=(due, func) + args, kwargs=kwargs)
+        s.run()
+        due = max(due + controller.interval, time.time())
+
+
 def main():
-    import datetime as dt
     def test():
         print(dt.datetime.now())
     scheduler(5, test, offset=3)
@@ -0,0 +1,295 @@
+
+'''
+:mod:`shm` - latest sample of each inverter in shared memory
+============================================================
+
+:func:`toshm` keeps the most recent sample from each inverter in a memory
+mapped file (put it on a tmpfs such as ``/dev/shm``) so any local process
+can read the current values with a :class:`LatestReader`, no sockets, no
+parsing and no system calls once the file is mapped.
+
+The file is a header followed by a fixed number of slots::
+
+    magic       b'AURSHM01'
+    nslots      uint16
+    namelen     uint16
+    names       comma separated field names, padded to 8 bytes
+
+    slot:
+    seq         uint64
+    inverter    16 bytes, NUL padded
+    record      StructCodec record (see pyaurora.wire)
+
+Each slot is a seqlock: the writer makes `seq` odd, writes the record and
+makes `seq` even again.  A reader takes `seq`, copies the record and takes
+`seq` again, if it was odd or has changed the read is retried, up to
+`retries` times after which :class:`TornSlot` is raised (a writer that dies
+mid update leaves `seq` odd until it is restarted).
+
+Several processes may write to one file as long as they use the same
+fields and each inverter name has only one writer, eg one ``aurora.py``
+per inverter address.  Slots are claimed by name under an exclusive
+:func:`fcntl.flock` of the file, so a restarted writer gets its old slot
+back.  A file with a different layout is never truncated, mapped readers
+would get SIGBUS, it is replaced by a new file instead and readers of the
+old one see no more updates until they reopen it.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import os
+import mmap
+import fcntl
+import struct
+import logging
+from .wire import StructCodec
+from .output import coroutine
+
+
+log = logging.getLogger('aurora')
+
+
+SHM_MAGIC = b'AURSHM01'
+SHM_HDR = struct.Struct('<8sHH')
+SLOT_HDR = struct.Struct('<Q16s')
+_SEQ = struct.Struct('<Q')
+_VALUE = struct.Struct('<d')
+
+RETRIES = 10000
+'''Default attempts at a consistent read of a slot.'''
+
+
+class TornSlot(Exception):
+    '''
+    A slot stayed mid update for every read attempt.
+    '''
+
+
+def _layout(fields, nslots):
+    names = ','.join(fields).encode('ascii')
+    hdrsize = SHM_HDR.size + len(names)
+    hdrsize += -hdrsize % 8
+    codec = StructCodec(fields)
+    slotsize = SLOT_HDR.size + codec.struct.size
+    slotsize += -slotsize % 8
+    return names, hdrsize, slotsize, codec
+
+
+class LatestTable(object):
+    '''
+    Writer side, creates (or reuses if the layout matches) `path`.
+
+    :param fields: field names, normally :data:`pyaurora.command.pollops`.
+    :param nslots: maximum number of inverters.
+    '''
+
+    def __init__(self, path, fields, nslots=8):
+        names, self.hdrsize, self.slotsize, self.codec = _layout(fields,
+                nslots)
+        self.nslots = nslots
+        self.header = SHM_HDR.pack(SHM_MAGIC, nslots, len(names)) + names
+        size = self.hdrsize + nslots * self.slotsize
+        self.fd = self._open(path, size)
+        try:
+            self.mm = mmap.mmap(self.fd, size)
+        except Exception:
+            os.close(self.fd)
+            raise
+        self.slots = {}
+
+    def _open(self, path, size):
+        '''
+        Return a descriptor of `path` with this layout, locked while the
+        header is checked so concurrent writers agree.
+        '''
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                    # replaced while we waited for the lock
+                    os.close(fd)
+                    continue
+                fsize = os.fstat(fd).st_size
+                hdr = os.pread(fd, len(self.header), 0)
+                if fsize == 0:
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, self.header, 0)
+                elif hdr != self.header or fsize < size:
+                    log.warning('%s has a different layout, replacing it',
+                            path)
+                    tmp = '{0}.{1}'.format(path, os.getpid())
+                    tfd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC,
+                            0o644)
+                    try:
+                        os.ftruncate(tfd, size)
+                        os.pwrite(tfd, self.header, 0)
+                        os.replace(tmp, path)
+                    finally:
+                        os.close(tfd)
+                    # the old file (and its lock) is left to its readers
+                    os.close(fd)
+                    continue
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                return fd
+            except BaseException:
+                os.close(fd)
+                raise
+
+    def _offset(self, i):
+        return self.hdrsize + i * self.slotsize
+
+    def _claim(self, inverter, record):
+        '''
+        Write `record` to the slot named `inverter`, taking the first free
+        one if there is none, and return its index.  Other writers may claim
+        slots at the same time so the names in the file, not :attr:`slots`,
+        are authoritative.
+        '''
+        name = inverter.encode('utf-8')[:16].ljust(16, b'\0')
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            for i in range(self.nslots):
+                off = self._offset(i)
+                seq, slotname = SLOT_HDR.unpack_from(self.mm, off)
+                if slotname == name:
+                    self._write(off, record)
+                    return i
+                if slotname == bytes(16):
+                    self._write(off, record, name)
+                    return i
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        raise ValueError('no free slot for {0}'.format(inverter))
+
+    def write(self, inverter, d):
+        record = self.codec.encode(d)
+        i = self.slots.get(inverter)
+        if i is None:
+            self.slots[inverter] = self._claim(inverter, record)
+        else:
+            self._write(self._offset(i), record)
+
+    def _write(self, off, record, name=None):
+        seq = _SEQ.unpack_from(self.mm, off)[0]
+        # odd if a previous writer of the slot died mid update
+        seq += 1 + (seq & 1)
+        _SEQ.pack_into(self.mm, off, seq)
+        if name is not None:
+            self.mm[off + 8:off + SLOT_HDR.size] = name
+        start = off + SLOT_HDR.size
+        self.mm[start:start + len(record)] = record
+        _SEQ.pack_into(self.mm, off, seq + 1)
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+
+class LatestReader(object):
+    '''
+    Reader side, maps an existing file read only.
+
+    :param retries: attempts at a consistent read before :class:`TornSlot`
+        is raised.
+    '''
+
+    def __init__(self, path, retries=RETRIES):
+        with open(path, 'rb') as f:
+            magic, nslots, namelen = SHM_HDR.unpack(f.read(SHM_HDR.size))
+            if magic != SHM_MAGIC:
+                raise ValueError('{0}: not a latest value table'.format(path))
+            fields = f.read(namelen).decode('ascii').split(',')
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.fields = fields
+        self.nslots = nslots
+        self.retries = retries
+        names, self.hdrsize, self.slotsize, self.codec = _layout(fields,
+                nslots)
+        self.view = memoryview(self.mm)
+        self._slots = {}
+        # offset of each value within a slot, skipping schema id and nfields
+        self._valueoffsets = {f: SLOT_HDR.size + 4 + 8 * i
+                for i, f in enumerate(['utc'] + fields)}
+
+    def _offset(self, i):
+        return self.hdrsize + i * self.slotsize
+
+    def _consistent(self, i, read):
+        off = self._offset(i)
+        for _ in range(self.retries):
+            seq = _SEQ.unpack_from(self.mm, off)[0]
+            if seq & 1:
+                continue
+            value = read(off)
+            if _SEQ.unpack_from(self.mm, off)[0] == seq:
+                return seq, value
+        raise TornSlot('slot {0} stayed mid update'.format(i))
+
+    def inverters(self):
+        '''
+        Names of the inverters with a slot.
+        '''
+        names = []
+        for i in range(self.nslots):
+            seq, name = self._consistent(i,
+                    lambda off: self.mm[off + 8:off + SLOT_HDR.size])
+            name = name.rstrip(b'\0').decode('utf-8')
+            if not name:
+                break
+            names.append(name)
+            self._slots[name] = i
+        return names
+
+    def _slot(self, inverter):
+        i = self._slots.get(inverter)
+        if i is None:
+            self.inverters()
+            i = self._slots[inverter]
+        return i
+
+    def read(self, inverter):
+        '''
+        Return the latest sample of `inverter` as an `OrderedDict` and the
+        slot sequence number, which goes up by 2 with every write.
+
+        :raises KeyError: if nothing has been written for `inverter`.
+        :raises TornSlot: if the slot stayed mid update.
+        '''
+        start = SLOT_HDR.size
+        end = start + self.codec.struct.size
+        seq, d = self._consistent(self._slot(inverter),
+                lambda off: self.codec.decode(
+                    self.view[off + start:off + end]))
+        return d, seq
+
+    def get(self, inverter, field):
+        '''
+        Return the latest value of one field (``utc`` as seconds since the
+        epoch), NaN if it was not polled.  Much cheaper than :meth:`read`.
+        '''
+        off = self._offset(self._slot(inverter))
+        voff = off + self._valueoffsets[field]
+        mm = self.mm
+        for _ in range(self.retries):
+            seq = _SEQ.unpack_from(mm, off)[0]
+            value = _VALUE.unpack_from(mm, voff)[0]
+            if not seq & 1 and _SEQ.unpack_from(mm, off)[0] == seq:
+                return value
+        raise TornSlot('{0} stayed mid update'.format(inverter))
+
+    def close(self):
+        self.view.release()
+        self.mm.close()
+
+
+@coroutine
+def toshm(path, fields, inverter='aurora', nslots=8):
+    '''
+    Co-routine that writes each sample to the `inverter` slot of a
+    :class:`LatestTable`.
+    '''
+    table = LatestTable(path, fields, nslots)
+    while True:
+        table.write(inverter, (yield))
@@ -0,0 +1,83 @@
+'''
+:mod:`sinks` - registry of output sinks
+=======================================
+
+Sinks are registered by name with a ``module:attribute`` string and the
+module is only imported when the sink is first used, so optional backends
+like :mod:`zmq` and :mod:`requests` cost nothing unless they are needed::
+
+    target = sinks.make('zmq', zock)
+
+The scripts (``aurora.py``, ``aurx.py``, ``aurout.py`` ...) build their
+outputs this way.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import importlib
+
+
+_registry = {
+    'stream': 'pyaurora.output:tostream',
+    'pretty': 'pyaurora.output:prettyprint',
+    'csv': 'pyaurora.output:tocsv',
+    'json': 'pyaurora.output:tojson',
+    'archive': 'pyaurora.wire:toarchive',
+    'shm': 'pyaurora.shm:toshm',
+    'sql': 'pyaurora.sqlsink:tosql',
+    'zmq': 'pyaurora.cozmq:tozmq',
+    'zmqbatch': 'pyaurora.cozmq:tozmqbatch',
+    'post': 'pyaurora.post:topost',
+    'rest': 'pyaurora.torest:torest',
+    'http': 'pyaurora.httpsink:HTTPSink',
+    'queued': 'pyaurora.worker:queued',
+    'spooled': 'pyaurora.spool:spooled',
+    'metered': 'pyaurora.metrics:metered',
+    'compress': 'pyaurora.compress:compress',
+    'expand': 'pyaurora.compress:expand',
+    }
+
+_loaded = {}
+
+
+def register(name, spec):
+    '''
+    Register a sink factory.
+
+    :param spec: ``'module:attribute'`` naming a co-routine or a callable
+        returning an object with a `send()` method.
+    '''
+    _registry[name] = spec
+    _loaded.pop(name, None)
+
+
+def available():
+    return sorted(_registry)
+
+
+def load(name):
+    '''
+    Return the sink factory registered as `name`, importing its module.
+
+    :raises KeyError: if `name` is not registered.
+    :raises ImportError: if the module or a dependency can't be imported.
+    '''
+    try:
+        return _loaded[name]
+    except KeyError:
+        pass
+    module, attr = _registry[name].split(':')
+    try:
+        factory = getattr(importlib.import_module(module), attr)
+    except ImportError as e:
+        raise ImportError('sink {0!r} is not available: {1}'.format(name, e))
+    _loaded[name] = factory
+    return factory
+
+
+def make(name, *args, **kwargs):
+    '''
+    Construct sink `name` with the given arguments.
+    '''
+    return load(name)(*args, **kwargs)
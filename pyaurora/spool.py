@@ -0,0 +1,433 @@
+
+'''
+:mod:`spool` - durable store and forward for network sinks
+==========================================================
+
+:class:`Spool` is a write ahead log in a directory of append only segment
+files.  Each record is::
+
+    seq         uint64
+    length      uint32
+    crc32       uint32
+    payload     bytes * length
+
+Appends are flushed immediately but only fsync'd every `syncevery` records
+or `syncinterval` seconds.  Delivered records are acknowledged, the highest
+contiguous acknowledged sequence number (the cursor) is saved alongside the
+segments and segments entirely below it are deleted.  If the spool grows
+beyond `maxbytes` the oldest segment is deleted, acknowledged or not.
+
+:class:`StoreAndForward` writes everything sent to it to a spool and
+delivers from a background thread.  Live items are delivered first, after
+an outage the backlog is replayed at no more than `rate` items per second
+in between live items.  Delivery is at least once and not necessarily in
+order.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import os
+import time
+import zlib
+import glob
+import pickle
+import struct
+import logging
+import threading
+from collections import deque
+
+
+log = logging.getLogger('aurora')
+
+
+RECORD = struct.Struct('<QII')
+SEGFMT = '{0:020d}.seg'
+CURSOR = 'cursor'
+
+
+class Spool(object):
+    '''
+    Segmented append only record store, see the module documentation.
+
+    :param path: directory, created if necessary.
+    :param segmentsize: start a new segment once the current one is this
+        many bytes.
+    :param maxbytes: upper limit on the total size of the segments.
+    :param syncevery: fsync after this many appends.
+    :param syncinterval: or after this many seconds.
+    '''
+
+    def __init__(self, path, segmentsize=1 << 22, maxbytes=1 << 28,
+            syncevery=16, syncinterval=1.0):
+        self.path = path
+        self.segmentsize = segmentsize
+        self.maxbytes = maxbytes
+        self.syncevery = syncevery
+        self.syncinterval = syncinterval
+        self.lock = threading.RLock()
+        self.acked = set()
+        self.dropped = 0
+        self._unsynced = 0
+        self._lastsync = time.monotonic()
+        self._readhint = (None, None, None)
+
+        os.makedirs(path, exist_ok=True)
+        self.cursor = self._loadcursor()
+        self.segments = sorted(
+                int(os.path.basename(p)[:-4])
+                for p in glob.glob(os.path.join(path, '*.seg')))
+        if self.segments:
+            self.nextseq = self._recover(self.segments[-1])
+            self.f = open(self._segpath(self.segments[-1]), 'ab')
+        else:
+            self.nextseq = self.cursor + 1
+            self._newsegment()
+        self._savedcursor = self.cursor
+
+    def _segpath(self, start):
+        return os.path.join(self.path, SEGFMT.format(start))
+
+    def _loadcursor(self):
+        try:
+            with open(os.path.join(self.path, CURSOR)) as f:
+                return int(f.read())
+        except (IOError, ValueError):
+            return 0
+
+    def _savecursor(self):
+        tmp = os.path.join(self.path, CURSOR + '.tmp')
+        with open(tmp, 'w') as f:
+            f.write(str(self.cursor))
+        os.replace(tmp, os.path.join(self.path, CURSOR))
+        self._savedcursor = self.cursor
+
+    def _scan(self, f, start, offset=0):
+        '''
+        Yield (seq, offset, payload) from segment file `f`, stopping at the
+        end or at the first torn or corrupt record.
+        '''
+        f.seek(offset)
+        while True:
+            hdr = f.read(RECORD.size)
+            if len(hdr) < RECORD.size:
+                return
+            seq, length, crc = RECORD.unpack(hdr)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield seq, offset, payload
+            offset += RECORD.size + length
+
+    def _recover(self, start):
+        '''
+        Find the next sequence number and truncate a torn record at the end
+        of the last segment.
+        '''
+        nextseq, end = start, 0
+        with open(self._segpath(start), 'r+b') as f:
+            for seq, offset, payload in self._scan(f, start):
+                nextseq = seq + 1
+                end = offset + RECORD.size + len(payload)
+            if end != f.seek(0, os.SEEK_END):
+                log.warning('spool %s truncating torn record', self.path)
+                f.truncate(end)
+        return max(nextseq, self.cursor + 1)
+
+    def _newsegment(self):
+        self.segments.append(self.nextseq)
+        self.f = open(self._segpath(self.nextseq), 'ab')
+
+    def _size(self):
+        return sum(os.path.getsize(self._segpath(s)) for s in self.segments)
+
+    def append(self, payload):
+        '''
+        Append bytes to the spool and return the sequence number.
+        '''
+        with self.lock:
+            if self.f.tell() >= self.segmentsize:
+                self.sync()
+                self.f.close()
+                self._newsegment()
+                self._enforcelimit()
+            seq = self.nextseq
+            self.f.write(RECORD.pack(seq, len(payload), zlib.crc32(payload)))
+            self.f.write(payload)
+            self.f.flush()
+            self.nextseq += 1
+            self._unsynced += 1
+            if (self._unsynced >= self.syncevery or
+                    time.monotonic() - self._lastsync >= self.syncinterval):
+                self.sync()
+            return seq
+
+    def _enforcelimit(self):
+        while len(self.segments) > 1 and self._size() > self.maxbytes:
+            start, end = self.segments[0], self.segments[1] - 1
+            lost = sum(1 for s in range(max(start, self.cursor + 1), end + 1)
+                    if s not in self.acked)
+            self.dropped += lost
+            log.warning('spool %s full, dropped %s records', self.path, lost)
+            os.remove(self._segpath(self.segments.pop(0)))
+            self.acked = set(s for s in self.acked if s > end)
+            self.cursor = max(self.cursor, end)
+
+    def read(self, fromseq, n):
+        '''
+        Return up to `n` (seq, payload) tuples with seq >= `fromseq` that
+        have not been acknowledged.
+        '''
+        with self.lock:
+            self.f.flush()
+            fromseq = max(fromseq, self.cursor + 1)
+            segs = [s for s in self.segments if s <= fromseq] or self.segments
+            items = []
+            for start in self.segments[self.segments.index(segs[-1]):]:
+                hintseq, hintstart, hintoffset = self._readhint
+                offset = hintoffset if (hintstart == start and
+                        hintseq <= fromseq) else 0
+                with open(self._segpath(start), 'rb') as f:
+                    for seq, offset, payload in self._scan(f, start, offset):
+                        if seq < fromseq or seq in self.acked:
+                            continue
+                        items.append((seq, payload))
+                        self._readhint = (seq, start, offset)
+                        if len(items) >= n:
+                            return items
+            return items
+
+    def ack(self, seq):
+        '''
+        Acknowledge delivery of record `seq`.
+        '''
+        with self.lock:
+            if seq <= self.cursor:
+                return
+            self.acked.add(seq)
+            while self.cursor + 1 in self.acked:
+                self.cursor += 1
+                self.acked.remove(self.cursor)
+            while (len(self.segments) > 1 and
+                    self.segments[1] - 1 <= self.cursor):
+                os.remove(self._segpath(self.segments.pop(0)))
+
+    def savecursor(self):
+        '''
+        Persist the cursor if it has moved, so acknowledged records are not
+        replayed after a restart.
+        '''
+        with self.lock:
+            if self.cursor != self._savedcursor:
+                self._savecursor()
+
+    def pending(self):
+        '''
+        Number of records not yet acknowledged.
+        '''
+        with self.lock:
+            return self.nextseq - 1 - self.cursor - len(self.acked)
+
+    def sync(self):
+        with self.lock:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            if self.cursor != self._savedcursor:
+                self._savecursor()
+            self._unsynced = 0
+            self._lastsync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            self.f.close()
+
+
+class StoreAndForward(object):
+    '''
+    Deliver items via `deliver` on a background thread, spooling them first
+    so nothing is lost while the destination is unreachable or the process
+    restarts.
+
+    It has the same `send()`, `stats()` and `close()` methods as
+    :class:`~pyaurora.worker.QueueWorker` so it can replace one, `stats()`
+    has the same keys plus ``live``, ``backlog`` and ``healthy``.
+
+    :param deliver: called with a list of items, it should raise if they
+        were not delivered.
+    :param spool: a :class:`Spool`.
+    :param batchsize: maximum items per `deliver` call.
+    :param rate: maximum backlog items replayed per second, it may be less
+        than 1.
+    :param livesize: live items held in memory, older ones are left in the
+        spool for replay.
+    :param backoff: seconds before retrying after a failure, doubled on each
+        failure up to `maxbackoff`.
+    '''
+
+    def __init__(self, deliver, spool, batchsize=10, rate=10.0,
+            livesize=1000, backoff=1.0, maxbackoff=60.0, name=None,
+            dumps=pickle.dumps, loads=pickle.loads):
+        self.deliver = deliver
+        self.spool = spool
+        self.batchsize = batchsize
+        self.rate = rate
+        self.backoff = backoff
+        self.maxbackoff = maxbackoff
+        self.name = name or 'spool'
+        self.dumps = dumps
+        self.loads = loads
+        self.live = deque()
+        self.livesize = livesize
+        self.cond = threading.Condition()
+        self.healthy = True
+        self.delivered = 0
+        self.failed = 0
+        self.latency = None
+        self.maxlatency = 0.0
+        self._delay = backoff
+        self._retryat = 0.0
+        self._maxtokens = max(rate, 1.0)
+        self._tokens = self._maxtokens
+        self._tokent = time.monotonic()
+        self._history = deque([(self._tokent, 0)], maxlen=64)
+        self._stop = False
+        self.replaypos = spool.cursor + 1
+        self.backlogend = spool.nextseq - 1
+        self._thread = threading.Thread(target=self._run, name=self.name,
+                daemon=True)
+        self._thread.start()
+
+    def send(self, item):
+        seq = self.spool.append(self.dumps(item))
+        with self.cond:
+            self.live.append((seq, time.monotonic(), item))
+            if len(self.live) > self.livesize:
+                self._tobacklog(self.live.popleft()[0])
+            self.cond.notify()
+
+    def _tobacklog(self, seq):
+        self.backlogend = max(self.backlogend, seq)
+
+    def stats(self):
+        '''
+        See :meth:`pyaurora.worker.QueueWorker.stats`, ``queued`` counts
+        every record not yet acknowledged, ``spilled`` the backlog and
+        ``failed`` the items of failed delivery attempts (they are retried).
+        '''
+        t = time.monotonic()
+        processed = self.delivered
+        t0, processed0 = self._history[0]
+        backlog = max(0, self.backlogend - self.replaypos + 1)
+        return {
+            'queued': self.spool.pending(),
+            'spilled': backlog,
+            'processed': processed,
+            'dropped': self.spool.dropped,
+            'failed': self.failed,
+            'rate': (processed - processed0) / max(t - t0, 1e-9),
+            'latency': self.latency,
+            'maxlatency': self.maxlatency,
+            'live': len(self.live),
+            'backlog': backlog,
+            'healthy': self.healthy,
+            }
+
+    def close(self, timeout=None):
+        with self.cond:
+            self._stop = True
+            self.cond.notify()
+        self._thread.join(timeout)
+        self.spool.close()
+
+    def _hasbacklog(self):
+        return self.replaypos <= self.backlogend
+
+    def _refill(self):
+        t = time.monotonic()
+        self._tokens = min(self._maxtokens,
+                self._tokens + (t - self._tokent) * self.rate)
+        self._tokent = t
+
+    def _attempt(self, batch):
+        try:
+            self.deliver([item for seq, t, item in batch])
+        except Exception as e:
+            log.warning('%s delivery failed (%s), retry in %s seconds',
+                    self.name, e, self._delay)
+            self.healthy = False
+            self.failed += len(batch)
+            self._retryat = time.monotonic() + self._delay
+            self._delay = min(self._delay * 2, self.maxbackoff)
+            return False
+        for seq, t, item in batch:
+            self.spool.ack(seq)
+        self.spool.savecursor()
+        self.delivered += len(batch)
+        now = time.monotonic()
+        self._history.append((now, self.delivered))
+        if batch[0][1] is not None:
+            self.latency = now - batch[0][1]
+            self.maxlatency = max(self.maxlatency, self.latency)
+        self.healthy = True
+        self._delay = self.backoff
+        return True
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.healthy:
+                    while self.live:
+                        self._tobacklog(self.live.popleft()[0])
+                if not self.live and not self._stop:
+                    self.cond.wait(0.1 if self._hasbacklog() else None)
+                if self._stop:
+                    break
+                live = []
+                if self.healthy:
+                    while self.live and len(live) < self.batchsize:
+                        live.append(self.live.popleft())
+
+            if live:
+                if not self._attempt(live):
+                    self._tobacklog(live[-1][0])
+                continue
+
+            if self._hasbacklog() and time.monotonic() >= self._retryat:
+                self._refill()
+                n = min(self.batchsize, int(self._tokens))
+                if n < 1:
+                    continue
+                records = [(seq, None, self.loads(payload))
+                        for seq, payload in self.spool.read(self.replaypos, n)
+                        if seq <= self.backlogend]
+                if not records:
+                    self.replaypos = self.backlogend + 1
+                    continue
+                if self._attempt(records):
+                    self._tokens -= len(records)
+                    self.replaypos = records[-1][0] + 1
+
+
+def spooled(makesink, spool, **kwargs):
+    '''
+    Store and forward to a co-routine.
+
+    :param makesink: callable returning a new co-routine target, it is
+        called again after a delivery fails because an exception raised
+        inside a co-routine finishes it.
+    :param spool: a :class:`Spool` or a directory name.
+    '''
+    if not isinstance(spool, Spool):
+        spool = Spool(spool)
+    sink = [makesink()]
+
+    def deliver(batch):
+        try:
+            for d in batch:
+                sink[0].send(d)
+        except Exception:
+            sink[0] = makesink()
+            raise
+
+    return StoreAndForward(deliver, spool, **kwargs)
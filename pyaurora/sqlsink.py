@@ -0,0 +1,55 @@
+
+'''
+:mod:`sqlsink` - write samples to an SQL table
+==============================================
+
+:func:`tosql` inserts samples into a table through any DB-API connection
+(``qmark`` parameters, eg :mod:`sqlite3`), the columns are those of the
+first sample.  The table is created if it doesn't exist, keyed on ``utc``
+(and ``inverter`` if present) like the one made by `auroraload.py`, with
+column types from :func:`pyaurora.catalog.createtable`.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import logging
+from .output import coroutine
+from .catalog import createtable
+
+
+log = logging.getLogger('aurora')
+
+
+def _create(conn, table, names):
+    conn.execute(createtable(table, names))
+
+
+@coroutine
+def tosql(conn, table='samples', batchsize=100, create=True, replace=False):
+    '''
+    Co-routine that inserts samples into `table`, committing every
+    `batchsize` samples.  Send None to commit what has been received so far.
+
+    :param replace: use ``INSERT OR REPLACE`` (sqlite) so replaying the same
+        samples twice doesn't fail on the primary key.
+    '''
+    d = (yield)
+    while d is None:
+        # nothing to commit yet
+        d = (yield)
+    names = list(d.keys())
+    if create:
+        _create(conn, table, names)
+    sql = '{0} INTO {1} ({2}) VALUES ({3})'.format(
+            'INSERT OR REPLACE' if replace else 'INSERT', table,
+            ', '.join(names), ', '.join('?' * len(names)))
+    batch = []
+    while True:
+        if d is not None:
+            batch.append(tuple(d.get(n) for n in names))
+        if batch and (d is None or len(batch) >= batchsize):
+            conn.executemany(sql, batch)
+            conn.commit()
+            batch = []
+        d = (yield)
@@ -7,13 +7,24 @@ Simple rest co-routine.
 '''
 
 
+import logging
 from .output import coroutine
-import requests as req
+
+
+log = logging.getLogger('aurora')
 
 
 @coroutine
 def torest(url, datavar):
+    '''
+    Post each input as form variable `datavar`.  See
+    :class:`pyaurora.httpsink.HTTPSink` for a non-blocking alternative.
+    '''
+    import requests as req
+
+    session = req.Session()
     while True:
         data = {datavar: (yield)}
-        resp = req.post(url, data=data)
-        print(resp.text)
+        resp = session.post(url, data=data)
+        log.debug('%s: %s', resp.status_code, resp.text)
+
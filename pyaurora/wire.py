@@ -0,0 +1,182 @@
+
+'''
+:mod:`wire` - encodings for samples sent between processes
+==========================================================
+
+A codec has an ``encode(d)`` method returning bytes and a ``decode(buf)``
+method that accepts any object supporting the buffer protocol (bytes,
+memoryview, the ``buffer`` of a :class:`zmq.Frame`) and returns a sample
+dictionary.
+
+:class:`StructCodec` packs a sample into a fixed layout::
+
+    schema id   uint16
+    nfields     uint16
+    utc         float64 seconds since the epoch
+    values      float64 * nfields
+
+All values travel as doubles (numeric strings, eg from a CSV file, are
+converted), `None` is sent as NaN and comes back as `None`.  The schema id
+is the CRC16 of the comma separated field names so both ends must be
+constructed with the same fields, normally :data:`pyaurora.command.pollops`.
+
+An archive file is :data:`ARCHIVE_MAGIC`, a uint16 length and the comma
+separated field names followed by :class:`StructCodec` records back to back.
+The records are fixed size so the file can be memory mapped as an array,
+which only works if every record has the fields in the header so
+:func:`toarchive` refuses to append different fields to an existing archive.
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import json
+import struct
+import datetime as dt
+from collections import OrderedDict
+from .protocol import crc16
+from .dateawarejsonenc import DateAwareJSONEncoder
+from .output import coroutine
+
+
+EPOCH = dt.datetime(1970, 1, 1)
+ARCHIVE_MAGIC = b'AURARC01'
+ARCHIVE_HDR = struct.Struct('<8sH')
+
+
+class SchemaError(ValueError):
+
+    def __init__(self, expected, got):
+        self.expected = expected
+        self.got = got
+
+    def __str__(self):
+        return 'expected schema id {0:#06x} got {1:#06x}'.format(
+                self.expected, self.got)
+
+
+class JSONCodec(object):
+    '''
+    JSON encoded UTF-8 bytes.
+
+    :param enc: JSON encoder, defaults to :class:`DateAwareJSONEncoder`.
+    '''
+
+    name = 'json'
+
+    def __init__(self, fields=None, enc=None):
+        self.enc = enc or DateAwareJSONEncoder()
+
+    def encode(self, d):
+        return self.enc.encode(d).encode('utf-8')
+
+    def decode(self, buf):
+        return json.loads(bytes(buf), object_pairs_hook=OrderedDict)
+
+
+class StructCodec(object):
+    '''
+    Fixed layout binary records, see the module documentation.
+
+    :param fields: sequence of field names excluding ``utc``.
+    '''
+
+    name = 'struct'
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.schemaid = crc16(','.join(self.fields).encode('ascii'))
+        self.struct = struct.Struct('<HHd{0}d'.format(len(self.fields)))
+
+    def encode(self, d):
+        utc = d.get('utc')
+        if isinstance(utc, dt.datetime):
+            utc = (utc - EPOCH).total_seconds()
+        nan = float('nan')
+        values = [d.get(f) for f in self.fields]
+        return self.struct.pack(self.schemaid, len(values),
+                nan if utc is None else utc,
+                *[nan if v is None or v == '' else float(v) for v in values])
+
+    def decode(self, buf):
+        values = self.struct.unpack_from(buf)
+        if values[0] != self.schemaid:
+            raise SchemaError(self.schemaid, values[0])
+
+        od = OrderedDict()
+        utc = values[2]
+        od['utc'] = None if utc != utc else EPOCH + dt.timedelta(seconds=utc)
+        for f, v in zip(self.fields, values[3:]):
+            od[f] = None if v != v else v
+        return od
+
+
+wirecodecs = {
+    JSONCodec.name: JSONCodec,
+    StructCodec.name: StructCodec,
+    }
+'''Codec classes by name, for command line options.'''
+
+
+def getcodec(name, fields):
+    '''
+    Construct a codec by name.
+
+    :param name: one of the keys of :data:`wirecodecs`.
+    :param fields: field names used by codecs with a fixed schema.
+    '''
+    return wirecodecs[name](fields)
+
+
+@coroutine
+def toarchive(fout, fields):
+    '''
+    Co-routine that appends samples to binary archive `fout`, writing the
+    header if the file is empty.
+
+    :param fout: file opened in binary append mode.
+    :param fields: field names excluding ``utc``.
+    :raises SchemaError: if `fout` is an archive of different fields (eg
+        the poll operations changed), start a new archive instead.
+    :raises ValueError: if `fout` is not empty and not an archive.
+    '''
+    codec = StructCodec(fields)
+    if fout.tell() == 0:
+        names = ','.join(codec.fields).encode('ascii')
+        fout.write(ARCHIVE_HDR.pack(ARCHIVE_MAGIC, len(names)) + names)
+    else:
+        # an append mode file can't be read, look at it again
+        with open(fout.name, 'rb') as fin:
+            existing, offset = archiveheader(fin)
+        if existing != codec.fields:
+            raise SchemaError(codec.schemaid, StructCodec(existing).schemaid)
+    while True:
+        fout.write(codec.encode((yield)))
+
+
+def archiveheader(fin):
+    '''
+    Read the header of an archive, returns (fields, offset of first record).
+    '''
+    hdr = fin.read(ARCHIVE_HDR.size)
+    if len(hdr) < ARCHIVE_HDR.size:
+        raise ValueError('not an archive file')
+    magic, n = ARCHIVE_HDR.unpack(hdr)
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError('not an archive file')
+    fields = tuple(fin.read(n).decode('ascii').split(','))
+    return fields, ARCHIVE_HDR.size + n
+
+
+def readarchive(fin):
+    '''
+    Yield samples from binary archive `fin`.
+    '''
+    fields, offset = archiveheader(fin)
+    codec = StructCodec(fields)
+    size = codec.struct.size
+    while True:
+        buf = fin.read(size)
+        if len(buf) < size:
+            return
+        yield codec.decode(buf)
@@ -0,0 +1,270 @@
+
+'''
+:mod:`worker` - background queue workers
+========================================
+
+A :class:`QueueWorker` owns a thread and a bounded queue.  Unless the
+overflow policy is ``block`` its `send()` method never blocks so it can be
+used anywhere a co-routine target is expected, the slow work (network, disk)
+happens on the worker thread.
+
+:func:`queued` wraps an existing co-routine in a worker, to decouple several
+sinks from the poller give each one its own worker::
+
+    target = tee([queued(tocsv(fout)), queued(tojson(tozmq(zock)))])
+
+.. moduleauthor:: paul sorenson
+'''
+
+
+import os
+import time
+import collections
+import queue
+import pickle
+import logging
+import threading
+
+
+log = logging.getLogger('aurora')
+
+
+_STOP = object()
+
+
+policies = ('block', 'drop-oldest', 'drop-newest', 'spill')
+'''What to do when an item is sent to a full queue.'''
+
+
+class WorkerStopped(Exception):
+    '''
+    Raised by `send()` once a worker has stopped because its handler failed.
+    '''
+
+
+class SpillFile(object):
+    '''
+    Unbounded FIFO of pickled items in a temporary file.  It is emptied
+    (truncated) each time the reader catches up with the writer.
+    '''
+
+    def __init__(self, dir=None):
+        import tempfile
+
+        self.lock = threading.Lock()
+        self.f = tempfile.TemporaryFile(prefix='aurora-spill-', dir=dir)
+        self.readpos = 0
+        self.count = 0
+
+    def write(self, item):
+        with self.lock:
+            self.f.seek(0, os.SEEK_END)
+            pickle.dump(item, self.f, pickle.HIGHEST_PROTOCOL)
+            self.count += 1
+
+    def read(self, n):
+        with self.lock:
+            items = []
+            self.f.seek(self.readpos)
+            while self.count and len(items) < n:
+                items.append(pickle.load(self.f))
+                self.count -= 1
+            if self.count:
+                self.readpos = self.f.tell()
+            else:
+                self.f.seek(0)
+                self.f.truncate()
+                self.readpos = 0
+            return items
+
+    def __len__(self):
+        return self.count
+
+
+class QueueWorker(object):
+    '''
+    Pass items to `handler` on a background thread.
+
+    :param handler: called with a list of items (at most `batchsize` long).
+        If it raises, the items are counted as failed and the worker carries
+        on unless `stoponerror` is set.  Then the worker stops and further
+        calls to `send()` raise :class:`WorkerStopped`.
+    :param maxsize: queue capacity.
+    :param batchsize: maximum number of queued items passed to the handler
+        at once.
+    :param name: thread name, also used in log messages.
+    :param policy: one of :data:`policies`.  ``block`` makes the sender
+        wait, ``drop-oldest`` discards the oldest queued item, ``drop-newest``
+        discards the item being sent and ``spill`` writes it to a temporary
+        file in `spilldir` to be handled once the queue has drained (so
+        items are not necessarily handled in order).
+    :param stoponerror: see `handler`.
+    '''
+
+    def __init__(self, handler, maxsize=1000, batchsize=1, name=None,
+            policy='drop-newest', spilldir=None, stoponerror=False):
+        if policy not in policies:
+            raise ValueError('unknown overflow policy: {0}'.format(policy))
+        self.handler = handler
+        self.batchsize = batchsize
+        self.name = name or 'worker'
+        self.policy = policy
+        self.stoponerror = stoponerror
+        self.error = None
+        self._abandon = False
+        self.queue = queue.Queue(maxsize)
+        self.spill = SpillFile(spilldir) if policy == 'spill' else None
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.latency = None
+        self.maxlatency = 0.0
+        self._history = collections.deque([(time.monotonic(), 0)],
+                maxlen=64)
+        self._thread = threading.Thread(target=self._run, name=self.name,
+                daemon=True)
+        self._thread.start()
+
+    def send(self, item):
+        if self.error is not None:
+            raise WorkerStopped('{0} stopped after: {1!r}'.format(self.name,
+                    self.error)) from self.error
+        entry = (time.monotonic(), item)
+        if self.policy == 'block':
+            self.queue.put(entry)
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(entry)
+                return
+            except queue.Full:
+                if self.policy == 'spill':
+                    self.spill.write(entry)
+                    return
+                if self.policy == 'drop-newest':
+                    self._drop()
+                    return
+            try:
+                self.queue.get_nowait()
+                self._drop()
+            except queue.Empty:
+                pass
+
+    def _drop(self):
+        self.dropped += 1
+        log.debug('%s queue full, dropped %s', self.name, self.dropped)
+
+    def stats(self):
+        '''
+        Return a dict with queue depth and delivery counters.  `latency` is
+        the time in seconds from `send()` to the handler completing for the
+        oldest item of the last batch, `rate` is items handled per second
+        over the last 64 batches (or since the worker started).  Reading the
+        stats changes nothing so any number of callers can use them.
+        '''
+        t = time.monotonic()
+        processed = self.processed
+        t0, processed0 = self._history[0]
+        rate = (processed - processed0) / max(t - t0, 1e-9)
+        return {
+            'queued': self.queue.qsize(),
+            'spilled': len(self.spill) if self.spill is not None else 0,
+            'processed': processed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'rate': rate,
+            'latency': self.latency,
+            'maxlatency': self.maxlatency,
+            }
+
+    def close(self, timeout=None):
+        '''
+        Process what is already queued then stop the thread, waiting at most
+        `timeout` seconds.  If the queue is still full after `timeout` (the
+        handler is stuck, eg retrying during an outage) the queued items are
+        abandoned once the current batch is done.
+        '''
+        t0 = time.monotonic()
+        try:
+            self.queue.put((None, _STOP), timeout=timeout)
+        except queue.Full:
+            self._abandon = True
+            log.warning('%s queue still full after %s seconds, abandoning %s'
+                    ' items', self.name, timeout, self.queue.qsize())
+        if timeout is not None:
+            timeout = max(0.0, timeout - (time.monotonic() - t0))
+        self._thread.join(timeout)
+
+    def _batch(self):
+        if self.spill is not None and self.queue.empty():
+            batch = self.spill.read(self.batchsize)
+            if batch:
+                return batch
+
+        batch = [self.queue.get()]
+        while len(batch) < self.batchsize and batch[-1][1] is not _STOP:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._abandon and self.error is None:
+            batch = self._batch()
+            stop = batch[-1][1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                self._handle(batch)
+            if stop:
+                while self.spill and self.error is None:
+                    self._handle(self.spill.read(self.batchsize))
+                break
+        if self.error is not None:
+            # wake senders blocked on a full queue
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.failed += 1
+
+    def _handle(self, batch):
+        try:
+            self.handler([item for t, item in batch])
+        except Exception as e:
+            self.failed += len(batch)
+            log.exception('%s handler failed, %s items lost', self.name,
+                    len(batch))
+            if self.stoponerror:
+                log.error('%s stopping', self.name)
+                self.error = e
+        else:
+            self.processed += len(batch)
+            t = time.monotonic()
+            self._history.append((t, self.processed))
+            self.latency = t - batch[0][0]
+            self.maxlatency = max(self.maxlatency, self.latency)
+
+
+def queued(target, maxsize=1000, policy='drop-oldest', name=None, **kwargs):
+    '''
+    Run co-routine `target` on its own :class:`QueueWorker` thread.
+
+    The returned worker has a `send()` method so it can stand in for the
+    target, eg as one of the targets of :func:`pyaurora.output.tee`.
+    Further keyword arguments are passed to :class:`QueueWorker`.
+
+    A co-routine that has raised is finished, so the worker stops and the
+    next `send()` raises :class:`WorkerStopped` rather than failing (and
+    logging) every later item.
+    '''
+    def handler(batch):
+        for d in batch:
+            target.send(d)
+
+    kwargs.setdefault('stoponerror', True)
+    return QueueWorker(handler, maxsize=maxsize, policy=policy,
+            name=name or getattr(target, '__name__', None), **kwargs)
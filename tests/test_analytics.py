@@ -0,0 +1,119 @@
+import sqlite3
+import datetime as dt
+from collections import OrderedDict
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from pyaurora.analytics import daily, readsamples
+from pyaurora.output import tocsv
+from pyaurora.wire import toarchive
+
+
+FIELDS = ('gridPowerAll', 'pin1All', 'pin2All', 'in1Voltage', 'in1Current',
+        'in2Voltage', 'in2Current', 'boosterTemp', 'dailyEnergy')
+
+ROWS = [
+    (dt.datetime(2015, 7, 20, 10, 0, 0),
+            (1000.0, 600.0, 500.0, 300.0, 2.0, 250.0, 2.0, 50.0, 100.0)),
+    (dt.datetime(2015, 7, 20, 10, 0, 10),
+            (2000.0, 1100.0, 1100.0, 275.0, 4.0, 275.0, 4.0, 65.0, 105.0)),
+    # 290 s gap, not integrated, not generating
+    (dt.datetime(2015, 7, 20, 10, 5, 0),
+            (0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 40.0, 110.0)),
+    (dt.datetime(2015, 7, 21, 0, 0, 0),
+            (500.0, 300.0, 300.0, 100.0, 3.0, 150.0, 2.0, 30.0, 5.0)),
+    ]
+
+# worked by hand from ROWS
+EXPECTED = [
+    OrderedDict([('day', '2015-07-20'), ('samples', 3), ('yield', 110.0),
+        ('energy', 2000.0 * 10 / 3600), ('peakpower', 2000.0),
+        ('efficiency', 3000.0 / 3300.0), ('imbalance', (100.0 / 1100) / 2),
+        ('maxtemp', 65.0), ('hotfraction', 0.5),
+        ('hotefficiency', 2000.0 / 2200.0)]),
+    OrderedDict([('day', '2015-07-21'), ('samples', 1), ('yield', 5.0),
+        ('energy', 0.0), ('peakpower', 500.0), ('efficiency', 500.0 / 600.0),
+        ('imbalance', 0.0), ('maxtemp', 30.0), ('hotfraction', 0.0),
+        ('hotefficiency', None)]),
+    ]
+
+
+def samples():
+    for utc, values in ROWS:
+        d = OrderedDict(utc=utc)
+        d.update(zip(FIELDS, values))
+        yield d
+
+
+@pytest.fixture
+def csvpath(tmp_path):
+    path = str(tmp_path / 'aurora.csv')
+    with open(path, 'w', newline='') as fout:
+        target = tocsv(fout)
+        for d in samples():
+            target.send(d)
+    return path
+
+
+@pytest.fixture
+def dbpath(tmp_path):
+    path = str(tmp_path / 'aurora.db')
+    conn = sqlite3.connect(path)
+    conn.execute('create table samples (utc timestamp, {0})'.format(
+            ', '.join(f + ' float' for f in FIELDS)))
+    conn.executemany('insert into samples values ({0})'.format(
+            ', '.join('?' * (len(FIELDS) + 1))),
+            [(str(utc),) + values for utc, values in ROWS])
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def binpath(tmp_path):
+    path = str(tmp_path / 'aurora.bin')
+    with open(path, 'ab') as fout:
+        target = toarchive(fout, FIELDS)
+        for d in samples():
+            target.send(d)
+    return path
+
+
+def check(days):
+    assert [list(d) for d in days] == [list(d) for d in EXPECTED]
+    for got, want in zip(days, EXPECTED):
+        for k, v in want.items():
+            if isinstance(v, float):
+                assert got[k] == pytest.approx(v), k
+            else:
+                assert got[k] == v, k
+
+
+@pytest.mark.parametrize('fixture', ['csvpath', 'dbpath', 'binpath'])
+@pytest.mark.parametrize('chunksize', [1, 2, 3, 100])
+def test_daily(request, fixture, chunksize):
+    path = request.getfixturevalue(fixture)
+    check(daily(readsamples([path], chunksize=chunksize)))
+
+
+def test_missing_values(tmp_path):
+    path = str(tmp_path / 'sparse.csv')
+    with open(path, 'w') as fout:
+        fout.write('utc,gridPowerAll,boosterTemp\n')
+        fout.write('2015-07-20 10:00:00,100.0,\n')
+        fout.write('2015-07-20 10:00:30,,45.0\n')
+    days = daily(readsamples([path]))
+    assert len(days) == 1
+    d = days[0]
+    assert d['samples'] == 2
+    assert d['peakpower'] == 100.0
+    assert d['maxtemp'] == 45.0
+    assert d['yield'] is None
+    assert d['energy'] == 0.0
+    assert d['efficiency'] is None
+
+
+def test_unknown_extension():
+    with pytest.raises(ValueError):
+        list(readsamples(['aurora.txt']))
@@ -0,0 +1,93 @@
+import datetime as dt
+from collections import OrderedDict
+import pytest
+import aurora
+from pyaurora.output import FieldStats, detectanomalies
+
+
+class Collect(object):
+
+    def __init__(self):
+        self.items = []
+
+    def send(self, d):
+        self.items.append(d)
+
+
+def sample(utc, **values):
+    d = OrderedDict(utc=utc)
+    d.update(values)
+    return d
+
+
+def test_rate_cleared_without_time():
+    st = FieldStats()
+    st.update(1.0, 0.0)
+    st.update(5.0, 1.0)
+    assert st.rate == 4.0
+    st.update(5.0, None)
+    assert st.rate is None
+    st.update(6.0, 1.0)
+    assert st.rate is None
+
+
+def test_rate_alert_not_repeated():
+    alerts = Collect()
+    target = detectanomalies(alerts=alerts, fields=('boosterTemp',),
+            maxrates={'boosterTemp': 0.5})
+    t0 = dt.datetime(2015, 7, 20, 12)
+    target.send(sample(t0, boosterTemp=40.0))
+    target.send(sample(t0 + dt.timedelta(seconds=10), boosterTemp=50.0))
+    assert [a['kind'] for a in alerts.items] == ['rate']
+    # same timestamp, then no timestamp: no new rate alerts
+    target.send(sample(t0 + dt.timedelta(seconds=10), boosterTemp=50.0))
+    target.send(sample(None, boosterTemp=50.0))
+    target.send(sample(None, boosterTemp=50.0))
+    assert len(alerts.items) == 1
+
+
+def test_limits_and_extra_fields():
+    alerts = Collect()
+    out = Collect()
+    target = detectanomalies(out, alerts=alerts, fields=(),
+            limits={'rIsoRes': (1.0, None)})
+    utc = dt.datetime(2015, 7, 20, 12)
+    target.send(sample(utc, rIsoRes='0.5'))
+    target.send(sample(utc, rIsoRes=20.0))
+    assert [(a['field'], a['kind'], a['score']) for a in alerts.items] == [
+            ('rIsoRes', 'limit', 1.0)]
+    assert len(out.items) == 2
+
+
+def test_zscore_after_warmup():
+    alerts = Collect()
+    target = detectanomalies(alerts=alerts, fields=('gridVoltageAll',),
+            warmup=20)
+    utc = dt.datetime(2015, 7, 20, 12)
+    for i in range(40):
+        target.send(sample(utc + dt.timedelta(seconds=10 * i),
+                gridVoltageAll=240.0 + (i % 2)))
+    assert not alerts.items
+    target.send(sample(utc + dt.timedelta(seconds=400), gridVoltageAll=300.0))
+    assert [a['kind'] for a in alerts.items] == ['zscore']
+
+
+def test_anomalyoptions():
+    limits, rates = aurora.anomalyoptions(['rIsoRes=1:', 'boosterTemp=:70'],
+            ['gridPowerAll=500'])
+    assert limits == {'rIsoRes': (1.0, None), 'boosterTemp': (None, 70.0)}
+    assert rates == {'gridPowerAll': 500.0}
+    for bad in (['nosuch=1:2'], ['rIsoRes=1'], ['rIsoRes=x:']):
+        with pytest.raises(ValueError):
+            aurora.anomalyoptions(bad, [])
+
+
+def test_non_numeric_values_skipped():
+    alerts = Collect()
+    target = detectanomalies(alerts=alerts, fields=('boosterTemp',),
+            limits={'boosterTemp': (None, 60.0)})
+    t0 = dt.datetime(2015, 7, 20, 12)
+    target.send(sample(t0, boosterTemp='n/a'))
+    target.send(sample(t0, boosterTemp=b'\x00'))
+    target.send(sample(t0, boosterTemp=70.0))
+    assert [a['value'] for a in alerts.items] == [70.0]
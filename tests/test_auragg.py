@@ -0,0 +1,62 @@
+import json
+import time
+import datetime as dt
+from argparse import Namespace
+from collections import OrderedDict
+import pytest
+
+pytest.importorskip('zmq')
+pytest.importorskip('requests')
+
+import auragg
+import pyaurora as pv
+from pyaurora.aggregate import Aggregator
+
+
+class Response(object):
+
+    status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+
+class Session(object):
+
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, data=None, timeout=None):
+        self.posts.append((url, data))
+        return Response()
+
+    def close(self):
+        pass
+
+
+def test_site_record_is_posted(tmp_path):
+    for spool in (None, str(tmp_path / 'spool')):
+        opt = Namespace(pub_url=None, rest_url='http://localhost/site',
+                spool=spool, hwm=10)
+        outputs, rest = auragg.siteoutputs(opt, None)
+        session = rest.session = Session()
+        agg = Aggregator(pv.tee(outputs), ['east', 'west'], interval=10)
+        t = dt.datetime(2020, 6, 1, 12, 0, 3)
+        for name, power in (('east', 1000.0), ('west', 500.5)):
+            agg.send((name, OrderedDict([('utc', t),
+                    ('gridPowerAll', power)])))
+        deadline = time.monotonic() + 10
+        while not session.posts and time.monotonic() < deadline:
+            # the spooled sink leaves undelivered records for the next run
+            time.sleep(0.01)
+        rest.close(timeout=10)
+
+        assert rest.stats()['processed'] == 1
+        assert len(session.posts) == 1
+        url, data = session.posts[0]
+        assert url == 'http://localhost/site'
+        records = json.loads(data['site_data'])
+        assert len(records) == 1
+        assert records[0]['utc'].startswith('2020-06-01')
+        assert records[0]['inverters'] == 2
+        assert records[0]['gridPowerAll'] == 1500.5
@@ -0,0 +1,86 @@
+import io
+import sys
+import json
+import datetime as dt
+from collections import OrderedDict
+import pytest
+import aurreplay
+from pyaurora.output import tocsv
+
+
+def writecsv(path, n):
+    with open(path, 'w', newline='') as fout:
+        target = tocsv(fout)
+        for i in range(n):
+            target.send(OrderedDict([('utc', dt.datetime(2020, 6, 1, 12, 0,
+                    i)), ('gridPowerAll', 100.0 * i)]))
+
+
+class Response(object):
+
+    status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+
+class Session(object):
+
+    posts = []
+
+    def post(self, url, data=None, timeout=None):
+        self.posts.append((url, data))
+        return Response()
+
+    def close(self):
+        pass
+
+
+def run(monkeypatch, capsys, *args):
+    monkeypatch.setattr(sys, 'argv', ['aurreplay.py'] + list(args))
+    # stats are printed to stderr, keep log lines out of it
+    monkeypatch.setattr(aurreplay.pv, 'startlogging', lambda: None)
+    aurreplay.main()
+    return json.loads(capsys.readouterr().err)
+
+
+def test_http_sink_posts_json_and_reports_delivery(tmp_path, monkeypatch,
+        capsys):
+    requests = pytest.importorskip('requests')
+    monkeypatch.setattr(requests, 'Session', Session)
+    Session.posts = []
+    path = str(tmp_path / 'aurora.csv')
+    writecsv(path, 25)
+
+    stats = run(monkeypatch, capsys, '--sink', 'http', '--rest-url',
+            'http://localhost/aurora', path)
+    assert stats['samples'] == 25
+    delivered = stats['delivered']
+    assert delivered['processed'] == 25
+    assert delivered['failed'] == delivered['dropped'] == 0
+    assert delivered['queued'] == 0
+    assert delivered['rate'] > 0
+
+    posted = [d for url, data in Session.posts
+            for d in json.loads(data['inverter_data'])]
+    assert [d['gridPowerAll'] for d in posted] == [100.0 * i
+            for i in range(25)]
+
+
+def test_csv_to_unseekable_stdout(tmp_path, monkeypatch, capsys):
+
+    class Pipe(io.StringIO):
+
+        def tell(self):
+            raise io.UnsupportedOperation('not seekable')
+
+    path = str(tmp_path / 'aurora.csv')
+    writecsv(path, 3)
+    pipe = Pipe()
+    monkeypatch.setattr(sys, 'stdout', pipe)
+    stats = run(monkeypatch, capsys, '--sink', 'csv', path)
+    assert stats['samples'] == 3
+    assert 'delivered' not in stats
+    lines = pipe.getvalue().splitlines()
+    assert lines[0] == 'utc,gridPowerAll'
+    assert len(lines) == 4
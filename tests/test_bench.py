@@ -0,0 +1,19 @@
+import pytest
+from bench import pipeline
+
+
+@pytest.mark.parametrize('name', ['http', 'http-batch'])
+def test_http_pipelines_deliver(name):
+    pytest.importorskip('requests')
+    r = pipeline.runone(name, 200)
+    assert r['samples'] == 200
+    assert r['complete']
+
+
+@pytest.mark.parametrize('name', ['zmq-json', 'zmq-struct-batch'])
+def test_zmq_pipelines_deliver(name):
+    pytest.importorskip('zmq')
+    # 2 * 203 samples, not a whole number of batches
+    r = pipeline.runone(name, 203)
+    assert r['samples'] == 203
+    assert r['complete']
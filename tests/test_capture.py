@@ -0,0 +1,172 @@
+import io
+import socket as skt
+import functools as ft
+import pytest
+import aurora
+import pyaurora as pv
+from pyaurora.capture import (CaptureSocket, ReplaySocket, ReplayedTimeout,
+        ReplayMismatch, readcapture, TX, RX, TIMEOUT, MAGIC1, RECORD1)
+from pyaurora.catalog import SimulatedInverter
+from pyaurora.command import Cmd
+from pyaurora.protocol import execcmd
+
+
+OPS = ('gridPowerAll', 'dailyEnergy', 'boosterTemp')
+
+
+class Collect(object):
+
+    def __init__(self):
+        self.samples = []
+
+    def send(self, d):
+        self.samples.append(d)
+
+
+class FlakySocket(SimulatedInverter):
+    '''Times out on the `n`th recv.'''
+
+    def __init__(self, values, n):
+        super().__init__(values)
+        self.n = n
+        self.count = 0
+
+    def recv(self, n):
+        self.count += 1
+        if self.count == self.n:
+            raise skt.timeout('timed out')
+        return super().recv(n)
+
+
+class GarbledSocket(SimulatedInverter):
+    '''Corrupts the CRC of the `n`th response.'''
+
+    def __init__(self, values, n):
+        super().__init__(values)
+        self.n = n
+        self.count = 0
+
+    def recv(self, n):
+        self.count += 1
+        buf = super().recv(n)
+        if self.count == self.n:
+            buf = buf[:-1] + bytes([buf[-1] ^ 0xff])
+        return buf
+
+
+class NoClose(io.BytesIO):
+
+    def close(self):
+        pass
+
+
+VALUES = {'gridPowerAll': 1500.0, 'dailyEnergy': 1234, 'boosterTemp': 40.0}
+
+
+def capture(inverter=None, error=skt.timeout):
+    fout = NoClose()
+    sock = CaptureSocket(inverter or FlakySocket(VALUES, 5), fout)
+    rdr = ft.partial(execcmd, sock, 2, readdelay=0)
+    target = Collect()
+    aurora.inverterpoll(rdr, OPS, target)
+    with pytest.raises(error):
+        aurora.inverterpoll(rdr, OPS, target)
+    aurora.inverterpoll(rdr, OPS, target)
+    sock.close()
+    return fout.getvalue(), target.samples
+
+
+def test_replay_continues_after_captured_timeout():
+    data, live = capture()
+    records = list(readcapture(io.BytesIO(data)))
+    assert [r.direction for r in records].count(TIMEOUT) == 1
+    # each response is tagged with the command it answers
+    for sent, answer in zip(records[::2], records[1::2]):
+        assert (sent.direction, answer.direction) in ((TX, RX),
+                (TX, TIMEOUT))
+        assert (answer.cmd, answer.subcmd) == (sent.frame[1], sent.frame[2])
+
+    sock = ReplaySocket(io.BytesIO(data))
+    rdr = ft.partial(execcmd, sock, 2, readdelay=0)
+    target = Collect()
+    with pytest.raises(EOFError):
+        aurora.replaypolls(rdr, OPS, target)
+    assert len(target.samples) == len(live) == 2
+    for replayed, captured in zip(target.samples, live):
+        assert [replayed[k] for k in OPS] == [captured[k] for k in OPS]
+
+
+def test_replayed_timeout_is_socket_timeout():
+    data, live = capture()
+    sock = ReplaySocket(io.BytesIO(data))
+    rdr = ft.partial(execcmd, sock, 2, readdelay=0)
+    for op in OPS:
+        aurora.inverterpoll(rdr, (op,), Collect())
+    aurora.inverterpoll(rdr, OPS[:1], Collect())
+    with pytest.raises(skt.timeout) as e:
+        rdr(Cmd.getCumEnergy, 0)
+    assert isinstance(e.value, ReplayedTimeout)
+
+
+def test_capture_close_closes_file():
+    fout = io.BytesIO()
+    sock = CaptureSocket(SimulatedInverter(), fout)
+    sock.close()
+    assert fout.closed
+
+
+def test_replay_skips_poll_with_captured_crc_error():
+    data, live = capture(GarbledSocket(VALUES, 5), pv.CRCException)
+    sock = ReplaySocket(io.BytesIO(data))
+    rdr = ft.partial(execcmd, sock, 2, readdelay=0)
+    target = Collect()
+    with pytest.raises(EOFError):
+        aurora.replaypolls(rdr, OPS, target)
+    assert len(target.samples) == len(live) == 2
+    for replayed, captured in zip(target.samples, live):
+        assert [replayed[k] for k in OPS] == [captured[k] for k in OPS]
+
+
+def test_replay_different_command_fails_fast():
+    data, live = capture()
+    sock = ReplaySocket(io.BytesIO(data))
+    rdr = ft.partial(execcmd, sock, 2, readdelay=0)
+    with pytest.raises(ReplayMismatch):
+        aurora.inverterpoll(rdr, tuple(reversed(OPS)), Collect())
+
+
+def test_response_to_another_command_fails_fast():
+    # the live process died between sending getCumEnergy and its response,
+    # the next one started with getDsp
+    data, live = capture()
+    records = list(readcapture(io.BytesIO(data)))
+    fout = NoClose()
+    sock = CaptureSocket(SimulatedInverter(), fout)
+    for r in records[2:3] + records[:2]:
+        sock._cmd = (r.cmd, r.subcmd)
+        sock._record(r.direction, r.frame)
+    sock = ReplaySocket(io.BytesIO(fout.getvalue()))
+    rdr = ft.partial(execcmd, sock, 2, readdelay=0)
+    with pytest.raises(ReplayMismatch):
+        rdr(Cmd.getCumEnergy, 0)
+
+
+def test_reads_old_captures():
+    data, live = capture()
+    old = io.BytesIO()
+    old.write(MAGIC1)
+    for r in readcapture(io.BytesIO(data)):
+        old.write(RECORD1.pack(r.t, r.direction, len(r.frame)))
+        old.write(r.frame)
+    old.seek(0)
+    records = list(readcapture(old))
+    assert len(records) == 16
+    assert records[1].cmd is None
+
+    old.seek(0)
+    sock = ReplaySocket(old)
+    rdr = ft.partial(execcmd, sock, 2, readdelay=0)
+    target = Collect()
+    with pytest.raises(EOFError):
+        aurora.replaypolls(rdr, OPS, target)
+    assert len(target.samples) == 2
@@ -0,0 +1,125 @@
+import csv
+import io
+import sqlite3
+import struct
+import datetime as dt
+import functools as ft
+from collections import OrderedDict
+import pytest
+import aurx
+import pyaurora as pv
+from pyaurora import catalog
+from pyaurora.command import Cmd, allops, pollops
+from pyaurora.output import tocsv
+from pyaurora.sqlsink import tosql
+
+
+def f32(v):
+    return struct.unpack('!f', struct.pack('!f', v))[0]
+
+
+VALUES = {name: 100.0 + 7.25 * i for i, name in enumerate(pollops)}
+
+
+def reader(values):
+    return ft.partial(pv.execcmd, catalog.SimulatedInverter(values), 2,
+            readdelay=0)
+
+
+def test_plan_matches_allops_for_pollops():
+    rdr = reader(VALUES)
+    polled = catalog.plan(pollops).poll(rdr)
+    assert list(polled) == list(pollops)
+    assert len(pollops) == 20
+    for name in pollops:
+        cmd, sc, (decoder, fmt) = allops[name]
+        old = decoder(rdr(cmd, sc))
+        assert polled[name] == old, name
+        assert type(polled[name]) is type(old), name
+
+
+def test_plan_sends_each_command_once():
+    sent = []
+
+    def rdr(cmd, subcmd=None):
+        sent.append((cmd, subcmd))
+        return pv.stripcrc(catalog.simulate(cmd, subcmd))
+
+    p = catalog.plan(['inverterState', 'alarmState', 'gridPowerAll'])
+    assert p.cost == 2
+    p.poll(rdr)
+    assert sent == [(Cmd.getState, None), (Cmd.getDsp, 3)]
+
+
+def test_every_field_round_trips():
+    values = {}
+    for name, (c, i) in catalog.fields.items():
+        unit = catalog.unit(name)
+        if unit == 'text':
+            values[name] = 'AB'
+        elif unit == 'version':
+            values[name] = 'C.0.1.1'
+        elif unit == 'timestamp':
+            values[name] = dt.datetime(2020, 6, 1, 12, 30, 5)
+        elif c.struct.format.endswith('f'):
+            values[name] = f32(1.5 + len(name))
+        else:
+            values[name] = len(name)
+    polled = catalog.plan(list(catalog.fields)).poll(reader(values))
+    assert dict(polled) == values
+
+
+def test_gettime_epoch():
+    rdr = reader({'getTime': dt.datetime(2000, 1, 1, 0, 1)})
+    assert pv.stripcrc(catalog.simulate(Cmd.getTime))[2:] == bytes(4)
+    assert rdr(Cmd.getTime)[2:] == struct.pack('!L', 60)
+    assert catalog.plan(['getTime']).poll(rdr)['getTime'] == \
+            dt.datetime(2000, 1, 1, 0, 1)
+
+
+def test_no_guessed_commands():
+    assert not any(c.cmd == Cmd.getCumFloatEnergy for c in catalog.commands)
+
+
+def test_unknown_field():
+    with pytest.raises(KeyError):
+        catalog.plan(['nosuchfield'])
+
+
+def test_tosql_schema():
+    conn = sqlite3.connect(':memory:')
+    target = tosql(conn)
+    target.send(OrderedDict([('utc', dt.datetime(2020, 6, 1)),
+            ('inverter', 'inv0'), ('gridPowerAll', 1.0),
+            ('globalState', 6), ('partNumber', 'AB'), ('extra', 2.0)]))
+    target.send(None)
+    info = conn.execute('PRAGMA table_info(samples)').fetchall()
+    assert [(r[1], r[2], r[5]) for r in info] == [
+            ('utc', 'TIMESTAMP', 1), ('inverter', 'TEXT', 2),
+            ('gridPowerAll', 'FLOAT', 0), ('globalState', 'INTEGER', 0),
+            ('partNumber', 'TEXT', 0), ('extra', 'FLOAT', 0)]
+
+
+def test_mockinverterpoll_through_simulator():
+    fout = io.StringIO()
+    target = tocsv(fout)
+    row = OrderedDict([('utc', dt.datetime(2020, 6, 1))])
+    row.update(VALUES)
+    row['getEnergy10'] = 1234.0
+    target.send(row)
+    text = fout.getvalue().replace(',{0},'.format(VALUES['in1Voltage']),
+            ',,')
+
+    polled = []
+
+    class Collect(object):
+        def send(self, d):
+            polled.append(d)
+
+    aurx.mockinverterpoll(csv.DictReader(io.StringIO(text)), pollops,
+            Collect())
+    d = polled[0]
+    assert list(d) == ['utc'] + list(pollops)
+    assert d['in1Voltage'] is None
+    assert d['getEnergy10'] == 1234 and isinstance(d['getEnergy10'], int)
+    assert d['gridPowerAll'] == f32(VALUES['gridPowerAll'])
@@ -0,0 +1,119 @@
+import csv
+import io
+import math
+import datetime as dt
+from collections import OrderedDict
+import aurx
+from pyaurora.compress import (Deadband, SwingingDoor, compress, expand,
+        reconstruct)
+
+
+class Collect(object):
+
+    def __init__(self):
+        self.items = []
+
+    def send(self, d):
+        self.items.append(d)
+
+
+T0 = dt.datetime(2020, 6, 1, 6)
+
+
+def series(n, f):
+    return [OrderedDict([('utc', T0 + dt.timedelta(seconds=10 * i)),
+            ('outputPower', f(i)), ('gridVoltage', 240 + (i % 7) * 0.3)])
+            for i in range(n)]
+
+
+def run(samples, rules, keyframe=0):
+    out = Collect()
+    c = compress(out, rules, keyframe=keyframe)
+    for d in samples:
+        c.send(OrderedDict(d))
+    c.send(None)
+    return out.items
+
+
+def test_deadband_round_trip():
+    samples = series(200, lambda i: 1000 * math.sin(i / 300.0))
+    rules = {'outputPower': Deadband(25), 'gridVoltage': 1.0}
+    sparse = run(samples, rules, keyframe=50)
+    assert len(sparse) == len(samples)
+    assert sum('outputPower' in d for d in sparse) < len(samples) / 2
+
+    out = Collect()
+    e = expand(out, fields=['utc', 'outputPower', 'gridVoltage'])
+    for d in sparse:
+        e.send(d)
+    assert len(out.items) == len(samples)
+    for orig, full in zip(samples, out.items):
+        assert full['utc'] == orig['utc']
+        assert abs(full['outputPower'] - orig['outputPower']) <= 25
+        assert abs(full['gridVoltage'] - orig['gridVoltage']) <= 1.0
+
+    rebuilt = reconstruct(sparse, [d['utc'] for d in samples], rules)
+    assert [d['outputPower'] for d in rebuilt] == [d['outputPower']
+            for d in out.items]
+
+
+def test_swinging_door_round_trip():
+    samples = series(300, lambda i: 2000 * math.sin(i / 400.0) + (i % 3))
+    rules = {'outputPower': SwingingDoor(5)}
+    for keyframe in (0, 1, 7, 100):
+        sparse = run(samples, {'outputPower': SwingingDoor(5)}, keyframe)
+        kept = [d for d in sparse if 'outputPower' in d]
+        if keyframe != 1:
+            assert len(kept) < len(samples) / 2
+        assert kept[0]['utc'] == samples[0]['utc']
+        assert kept[-1]['utc'] == samples[-1]['utc']
+        rebuilt = reconstruct(sparse, [d['utc'] for d in samples], rules)
+        for orig, full in zip(samples, rebuilt):
+            assert abs(full['outputPower'] - orig['outputPower']) <= 10
+
+
+def test_swinging_door_first_point_without_keyframe():
+    samples = series(5, lambda i: 10.0 * i * i)
+    sparse = run(samples, {'outputPower': SwingingDoor(1)}, keyframe=0)
+    assert sparse[0]['outputPower'] == 0.0
+    assert [d['utc'] for d in sparse] == [d['utc'] for d in samples]
+    # a parabola needs every point
+    assert all('outputPower' in d for d in sparse)
+
+
+def test_straight_line_keeps_ends_only():
+    samples = series(20, lambda i: 3.0 * i)
+    sparse = run(samples, {'outputPower': SwingingDoor(0.5)}, keyframe=0)
+    kept = [d['outputPower'] for d in sparse if 'outputPower' in d]
+    assert kept == [0.0, 57.0]
+
+
+def test_string_values_from_csv():
+    text = ('gridPowerAll,gridVoltageAll\n' +
+            ''.join('{0},{1}\n'.format(i * 100, 240 + i) for i in range(6)) +
+            ',241\n')
+    rdr = csv.DictReader(io.StringIO(text))
+    out = Collect()
+    c = compress(out, aurx.compressionrules(['gridVoltageAll=0.5'],
+            ['gridPowerAll=1']), keyframe=0)
+    ops = ['gridPowerAll', 'gridVoltageAll']
+    for _ in range(7):
+        aurx.mockinverterpoll(rdr, ops, c)
+    c.send(None)
+    assert len(out.items) == 7
+    assert out.items[0]['gridPowerAll'] == 0.0
+    assert out.items[0]['gridVoltageAll'] == 240.0
+    assert out.items[-1]['gridPowerAll'] is None
+    assert all(isinstance(d.get('gridVoltageAll', 0.0), float)
+            for d in out.items)
+
+
+def test_expand_waits_for_every_field():
+    out = Collect()
+    e = expand(out, fields=['utc', 'a', 'b'])
+    e.send(OrderedDict([('utc', 1), ('a', 1)]))
+    assert out.items == []
+    e.send(OrderedDict([('utc', 2), ('b', 2)]))
+    e.send(OrderedDict([('utc', 3), ('a', 3)]))
+    assert out.items == [OrderedDict([('utc', 2), ('a', 1), ('b', 2)]),
+            OrderedDict([('utc', 3), ('a', 3), ('b', 2)])]
@@ -0,0 +1,57 @@
+import time
+import pytest
+
+zmq = pytest.importorskip('zmq')
+
+from pyaurora.cozmq import tozmqbatch
+from pyaurora.wire import StructCodec
+
+
+@pytest.fixture
+def pair():
+    ctx = zmq.Context()
+    pub = ctx.socket(zmq.PAIR)
+    pub.bind('inproc://test')
+    sub = ctx.socket(zmq.PAIR)
+    sub.connect('inproc://test')
+    yield pub, sub
+    pub.close(linger=0)
+    sub.close(linger=0)
+    ctx.term()
+
+
+def test_partial_batch_sent_after_maxdelay(pair):
+    pub, sub = pair
+    batch = tozmqbatch(pub, batchsize=10, maxdelay=0.05)
+    for i in range(3):
+        batch.send('m{0}'.format(i))
+    t0 = time.monotonic()
+    assert sub.poll(2000)
+    assert sub.recv_multipart() == [b'm0', b'm1', b'm2']
+    assert time.monotonic() - t0 < 1.0
+    batch.close()
+
+
+def test_full_batch_and_close(pair):
+    pub, sub = pair
+    batch = tozmqbatch(pub, batchsize=2)
+    for i in range(3):
+        batch.send('m{0}'.format(i))
+    assert sub.recv_multipart() == [b'm0', b'm1']
+    assert not sub.poll(100)
+    batch.close()
+    assert sub.recv_multipart() == [b'm2']
+
+
+def test_codec(pair):
+    import datetime as dt
+    from collections import OrderedDict
+
+    pub, sub = pair
+    codec = StructCodec(['a', 'b'])
+    batch = tozmqbatch(pub, batchsize=1, codec=codec)
+    d = OrderedDict([('utc', dt.datetime(2015, 7, 20, 12)), ('a', 1.0),
+            ('b', 2.0)])
+    batch.send(d)
+    frames = sub.recv_multipart()
+    assert codec.decode(frames[0]) == d
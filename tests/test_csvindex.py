@@ -0,0 +1,124 @@
+import os
+import sys
+import datetime as dt
+from collections import OrderedDict
+from pyaurora import csvindex
+from pyaurora.csvindex import (CSVIndex, buildindex, indexpath, loadindex,
+        readrange)
+from pyaurora.output import tocsv
+
+
+T0 = dt.datetime(2015, 7, 20, 12)
+
+
+def row(i):
+    return OrderedDict([('utc', T0 + dt.timedelta(seconds=10 * i)),
+            ('gridPowerAll', float(i))])
+
+
+def write(path, rows, index=None):
+    with open(path, 'a') as fout:
+        target = tocsv(fout, index=index)
+        for i in rows:
+            target.send(row(i))
+    if index is not None:
+        index.close()
+
+
+def powers(rows):
+    return [int(float(r['gridPowerAll'])) for r in rows]
+
+
+def at(i):
+    return T0 + dt.timedelta(seconds=10 * i)
+
+
+def headerlength(path):
+    with open(path, 'rb') as f:
+        return len(f.readline())
+
+
+def test_tocsv_keeps_index(tmp_path):
+    path = str(tmp_path / 'aurora.csv')
+    write(path, range(100), CSVIndex(path, stride=30))
+    utcs, offsets = loadindex(path)
+    assert len(offsets) == 4
+    assert offsets[0] == headerlength(path)
+    assert utcs[1] == csvindex.utcseconds(at(30))
+    with open(path, 'rb') as f:
+        f.seek(offsets[1])
+        assert f.readline().startswith(b'2015-07-20 12:05:00,30.0')
+
+    assert powers(readrange([path], at(42), at(45))) == [42, 43, 44]
+    assert powers(readrange([path], at(95), at(200))) == list(range(95, 100))
+    assert powers(readrange([path], 0.0, float('inf'))) == list(range(100))
+
+
+def test_index_started_on_existing_csv(tmp_path):
+    path = str(tmp_path / 'aurora.csv')
+    write(path, range(50))
+    write(path, range(50, 60), CSVIndex(path, stride=30))
+    assert loadindex(path)[1][0] == headerlength(path)
+    assert powers(readrange([path], at(0), at(100))) == list(range(60))
+
+
+def test_index_not_starting_at_first_row_rebuilt(tmp_path):
+    path = str(tmp_path / 'aurora.csv')
+    write(path, range(50))
+    # as CSVIndex did on a non-empty file before it indexed it first
+    with open(indexpath(path), 'wb') as f:
+        f.write(csvindex.INDEX_MAGIC)
+    index = CSVIndex.__new__(CSVIndex)
+    index.stride, index.count = 30, 0
+    index.f = open(indexpath(path), 'ab', buffering=0)
+    write(path, range(50, 60), index)
+    assert powers(readrange([path], at(10), at(12))) == [10, 11]
+    assert loadindex(path)[1][0] == headerlength(path)
+
+
+def test_records_past_lost_rows_dropped(tmp_path):
+    path = str(tmp_path / 'aurora.csv')
+    write(path, range(10), CSVIndex(path, stride=1))
+    size = os.path.getsize(path)
+    # the writer died with these rows still in its buffer
+    index = CSVIndex(path, stride=1)
+    index.add(at(10), size)
+    index.add(at(11), size + 29)
+    index.close()
+    assert len(loadindex(path)[1]) == 12
+
+    write(path, range(20, 30), CSVIndex(path, stride=1))
+    utcs, offsets = loadindex(path)
+    assert len(offsets) == 20
+    assert offsets[10] == size
+    assert powers(readrange([path], at(10), at(25))) == list(range(20, 25))
+
+
+def test_readrange_across_files(tmp_path):
+    paths = [str(tmp_path / 'aurora_{0}.csv'.format(n)) for n in range(3)]
+    for n, path in enumerate(paths):
+        write(path, range(20 * n, 20 * n + 20))
+    # indexed on first use
+    assert powers(readrange(paths, at(15), at(45))) == list(range(15, 45))
+    assert all(os.path.exists(indexpath(path)) for path in paths)
+
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['csvindex'] + list(args))
+    csvindex.main()
+
+
+def test_cli(tmp_path, monkeypatch, capsys):
+    paths = [str(tmp_path / 'aurora_{0}.csv'.format(n)) for n in range(2)]
+    for n, path in enumerate(paths):
+        write(path, range(100 * n, 100 * n + 100))
+
+    run(monkeypatch, '--build', *paths)
+    assert capsys.readouterr().out == ''
+    assert all(loadindex(path)[1] for path in paths)
+
+    run(monkeypatch, '--start', '2015-07-20 12:16:30', '--end',
+            '2015-07-20 12:17', *reversed(paths))
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == ['utc,gridPowerAll', '2015-07-20 12:16:30,99.0',
+            '2015-07-20 12:16:40,100.0', '2015-07-20 12:16:50,101.0']
@@ -0,0 +1,106 @@
+import asyncio
+import socket as skt
+from collections import OrderedDict
+import aurora
+import pyaurora as pv
+from pyaurora import catalog
+from pyaurora.command import Cmd, DspOp
+from pyaurora.gateway import Gateway, ERRORFRAME
+
+
+def freeport():
+    with skt.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def adapter(reader, writer):
+    # answers getState, ignores everything else
+    try:
+        while True:
+            frame = await reader.readexactly(10)
+            if frame[1] == Cmd.getState:
+                writer.write(catalog.simulate(Cmd.getState,
+                        values={'inverterState': 2}))
+    except asyncio.IncompleteReadError:
+        writer.close()
+
+
+async def exchange(port, frames):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    resps = []
+    for frame in frames:
+        writer.write(frame)
+        resps.append(await asyncio.wait_for(reader.read(pv.MAXRESP), 5))
+    writer.close()
+    await writer.wait_closed()
+    await asyncio.sleep(0.05)
+    return resps
+
+
+def test_unanswered_request_gets_error_frame():
+
+    async def run():
+        server = await asyncio.start_server(adapter, '127.0.0.1', 0)
+        gw = Gateway('127.0.0.1', server.sockets[0].getsockname()[1],
+                readdelay=0, timeout=0.2, backoff=0)
+        port = freeport()
+        await gw.start(port)
+        return await exchange(port, [pv.makecmd(2, Cmd.getDsp,
+                DspOp.gridPowerAll.value), pv.makecmd(2, Cmd.getState)])
+
+    err, ok = asyncio.run(run())
+    assert err == ERRORFRAME
+    assert catalog.fields['inverterState'][0].decode(pv.stripcrc(ok)) == \
+            OrderedDict([('transmissionState', 0), ('globalState', 0),
+                ('inverterState', 2), ('channel1State', 0),
+                ('channel2State', 0), ('alarmState', 0)])
+
+
+def test_unreachable_adapter_gets_error_frame():
+
+    async def run():
+        gw = Gateway('127.0.0.1', freeport(), timeout=0.2, backoff=60)
+        port = freeport()
+        await gw.start(port)
+        return await exchange(port, [pv.makecmd(2, Cmd.getState)] * 2)
+
+    assert asyncio.run(run()) == [ERRORFRAME, ERRORFRAME]
+
+
+class Canned(object):
+
+    def __init__(self, resp):
+        self.resp = resp
+
+    def send(self, buf):
+        return len(buf)
+
+    def recv(self, n):
+        return self.resp
+
+
+def test_execcmd_raises_for_error_frame():
+    try:
+        pv.execcmd(Canned(ERRORFRAME), 2, Cmd.getState, readdelay=0)
+    except pv.GatewayError as e:
+        assert 'getState' in str(e)
+    else:
+        assert False, 'no GatewayError'
+
+
+def test_gatewaypoll_skips_failed_poll():
+    sent = []
+
+    class Target(object):
+        def send(self, d):
+            sent.append(d)
+
+    rdr = lambda cmd, subcmd=None: pv.execcmd(Canned(ERRORFRAME), 2, cmd,
+            subcmd, readdelay=0)
+    aurora.gatewaypoll(rdr, ['gridPowerAll'], Target())
+    assert sent == []
+    ok = lambda cmd, subcmd=None: pv.stripcrc(catalog.simulate(cmd, subcmd,
+            {'gridPowerAll': 1500.0}))
+    aurora.gatewaypoll(ok, ['gridPowerAll'], Target())
+    assert sent[0]['gridPowerAll'] == 1500.0
@@ -0,0 +1,107 @@
+import json
+import datetime as dt
+from collections import OrderedDict
+import pytest
+
+requests = pytest.importorskip('requests')
+
+from pyaurora import httpsink
+from pyaurora.httpsink import HTTPSink
+
+
+class Response(object):
+
+    def __init__(self, status):
+        self.status_code = status
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+class Session(object):
+    '''
+    Answers with `statuses` in turn (200 once they run out), a status of
+    None is a connection error.
+    '''
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.posts = []
+
+    def post(self, url, data=None, timeout=None):
+        self.posts.append(data)
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status is None:
+            raise requests.ConnectionError('refused')
+        return Response(status)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(httpsink.time, 'sleep', delays.append)
+    return delays
+
+
+def make(session, **kwargs):
+    sink = HTTPSink('http://localhost/aurora', **kwargs)
+    sink.session = session
+    return sink
+
+
+def sample(i):
+    return OrderedDict([('utc', dt.datetime(2020, 6, 1, 12, 0, i)),
+            ('gridPowerAll', float(i))])
+
+
+def test_batches_samples_and_strings():
+    session = Session()
+    sink = make(session, batchsize=3)
+    for i in range(7):
+        sink.send(sample(i) if i % 2 else json.dumps({'n': i}))
+    sink.close(timeout=10)
+    batches = [json.loads(body) for body in session.posts]
+    assert all(1 <= len(b) <= 3 for b in batches)
+    items = [d for b in batches for d in b]
+    assert [d.get('n', d.get('gridPowerAll')) for d in items] == \
+            [0, 1.0, 2, 3.0, 4, 5.0, 6]
+    assert items[1]['utc'] == '2020-06-01T12:00:01'
+    assert sink.stats()['processed'] == 7
+
+
+def test_single_posts_with_form_variable():
+    session = Session()
+    sink = make(session, batchsize=1, datavar='inverter_data')
+    sink.send(sample(1))
+    sink.close(timeout=10)
+    assert len(session.posts) == 1
+    assert json.loads(session.posts[0]['inverter_data'])['gridPowerAll'] == \
+            1.0
+
+
+def test_retry_with_backoff(sleeps):
+    session = Session([None, 503])
+    sink = make(session, batchsize=1, retries=3, backoff=0.5)
+    sink.send(sample(1))
+    sink.close(timeout=10)
+    assert len(session.posts) == 3
+    assert sleeps == [0.5, 1.0]
+    st = sink.stats()
+    assert (st['processed'], st['failed']) == (1, 0)
+
+
+def test_failure_counts(sleeps):
+    session = Session([500] * 9)
+    sink = make(session, batchsize=1, retries=2, backoff=0.25)
+    for i in range(3):
+        sink.send(sample(i))
+    sink.close(timeout=10)
+    # each tried three times
+    assert len(session.posts) == 9
+    assert sleeps == [0.25, 0.5] * 3
+    st = sink.stats()
+    assert (st['processed'], st['failed']) == (0, 3)
@@ -0,0 +1,61 @@
+import logging
+import functools as ft
+import pytest
+from pyaurora import protocol
+from pyaurora.catalog import SimulatedInverter
+from pyaurora.command import Cmd, DspOp
+from pyaurora.logconfig import RateLimitFilter
+
+
+class Capture(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def frames():
+    lg = protocol.frames
+    level, filters, handlers = lg.level, lg.filters[:], lg.handlers[:]
+    propagate = lg.propagate
+    lg.setLevel(logging.DEBUG)
+    lg.propagate = False
+    yield lg
+    lg.setLevel(level)
+    lg.filters[:], lg.handlers[:] = filters, handlers
+    lg.propagate = propagate
+
+
+def test_dropped_frames_not_hex_encoded(frames, monkeypatch):
+    calls = []
+    real = protocol.bytes2hex
+    monkeypatch.setattr(protocol, 'bytes2hex',
+            lambda buf: calls.append(buf) or real(buf))
+    limit = RateLimitFilter(rate=0.0, burst=2)
+    frames.addFilter(limit)
+    capture = Capture()
+    frames.addHandler(capture)
+
+    rdr = ft.partial(protocol.execcmd, SimulatedInverter(), 2, readdelay=0)
+    for op in list(DspOp)[:10]:
+        rdr(Cmd.getDsp, op)
+
+    assert len(capture.messages) == 2
+    assert limit.dropped == 18
+    # only the frames that passed the filter, the first command and its
+    # response, were ever hex encoded
+    cmds = {bytes(buf) for buf in calls if len(buf) == 10}
+    assert cmds == {bytes(protocol.makecmd(2, Cmd.getDsp, list(DspOp)[0]))}
+    assert len({bytes(buf) for buf in calls}) == 2
+    assert capture.messages[0].startswith("cmd buffer: b'02")
+
+
+def test_ratelimit_refills():
+    f = RateLimitFilter(rate=1000.0, burst=1)
+    assert f.filter(None)
+    f.t -= 1.0
+    assert f.filter(None)
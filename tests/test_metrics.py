@@ -0,0 +1,49 @@
+import threading
+from pyaurora.metrics import Registry
+
+
+def test_exposition():
+    reg = Registry()
+    reg.counter('polls', 'Polls.').inc(3)
+    reg.gauge('depth', lambda: 2, 'Queue depth.')
+    h = reg.histogram('rtt', buckets=(0.1, 1.0), cmd='getDsp')
+    h.observe(0.05)
+    h.observe(0.5)
+    text = reg.exposition()
+    assert '# HELP polls Polls.\n# TYPE polls counter\npolls_total 3\n' in text
+    assert 'depth 2\n' in text
+    assert 'rtt_bucket{cmd="getDsp",le="0.1"} 1\n' in text
+    assert 'rtt_bucket{cmd="getDsp",le="+Inf"} 2\n' in text
+    assert 'rtt_count{cmd="getDsp"} 2\n' in text
+
+
+def test_none_gauge_skipped():
+    reg = Registry()
+    reg.gauge('latency', lambda: None)
+    reg.gauge('depth', lambda: 0)
+    lines = reg.exposition().splitlines()
+    assert 'depth 0' in lines
+    assert not [l for l in lines if l.startswith('latency')]
+
+
+def test_concurrent_registration():
+    reg = Registry()
+    stop = threading.Event()
+    errors = []
+
+    def scrape():
+        try:
+            while not stop.is_set():
+                reg.exposition()
+        except Exception as e:
+            errors.append(e)
+
+    t = threading.Thread(target=scrape)
+    t.start()
+    try:
+        for i in range(5000):
+            reg.histogram('rtt', cmd='c{0}'.format(i))
+    finally:
+        stop.set()
+        t.join()
+    assert not errors
@@ -0,0 +1,185 @@
+import json
+import struct
+import asyncio
+import datetime as dt
+from collections import OrderedDict
+from pyaurora.push import PushServer, wsframe
+
+
+def sample(power):
+    return OrderedDict([('utc', dt.datetime(2020, 6, 1, 12)),
+            ('gridPowerAll', power)])
+
+
+def run(test, **kwargs):
+    '''
+    Run coroutine function `test` with a started server and its port.
+    '''
+    # keepalives find the SSE clients that went away
+    kwargs.setdefault('keepalive', 0.05)
+
+    async def main():
+        server = PushServer(**kwargs)
+        srv = await server.start(0)
+        try:
+            await asyncio.wait_for(test(server,
+                    srv.sockets[0].getsockname()[1]), 5)
+            # let the handlers see their clients go
+            await asyncio.wait_for(connected(server, 0), 5)
+        finally:
+            srv.close()
+
+    asyncio.run(main())
+
+
+async def connect(port, path, headers=()):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    lines = ['GET {0} HTTP/1.1'.format(path), 'Host: localhost']
+    lines += ['{0}: {1}'.format(k, v) for k, v in headers]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    head = await reader.readuntil(b'\r\n\r\n')
+    return reader, writer, head.decode('latin-1')
+
+
+async def connected(server, n=1):
+    while len(server.clients) != n:
+        await asyncio.sleep(0.01)
+
+
+async def readsse(reader):
+    msg = await reader.readuntil(b'\n\n')
+    while msg == b': keepalive\n\n':
+        msg = await reader.readuntil(b'\n\n')
+    assert msg.startswith(b'data: ')
+    return json.loads(msg[6:].decode('utf-8'))
+
+
+async def readws(reader):
+    b0, b1 = await reader.readexactly(2)
+    if b0 == 0x89:
+        # ping
+        return await readws(reader)
+    n = b1 & 0x7f
+    if n == 126:
+        n = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack('!Q', await reader.readexactly(8))[0]
+    return b0, await reader.readexactly(n)
+
+
+WSHEADERS = [('Upgrade', 'websocket'), ('Connection', 'Upgrade'),
+        ('Sec-WebSocket-Key', 'dGhlIHNhbXBsZSBub25jZQ=='),
+        ('Sec-WebSocket-Version', '13')]
+
+
+def test_sse():
+
+    async def test(server, port):
+        reader, writer, head = await connect(port, '/events')
+        assert head.startswith('HTTP/1.1 200 OK')
+        assert 'Content-Type: text/event-stream' in head
+        await connected(server)
+        server.publish(sample(1500.0))
+        server.publish('{"raw": true}')
+        d = await readsse(reader)
+        assert d == {'utc': '2020-06-01T12:00:00', 'gridPowerAll': 1500.0}
+        assert await readsse(reader) == {'raw': True}
+        writer.close()
+
+    run(test)
+
+
+def test_latest_sent_to_new_client():
+
+    async def test(server, port):
+        server.publish(sample(1.0))
+        server.publish(sample(2.0))
+        reader, writer, head = await connect(port, '/events')
+        assert (await readsse(reader))['gridPowerAll'] == 2.0
+        writer.close()
+        reader, writer, head = await connect(port, '/ws', WSHEADERS)
+        opcode, payload = await readws(reader)
+        assert json.loads(payload.decode('utf-8'))['gridPowerAll'] == 2.0
+        writer.close()
+
+    run(test)
+
+
+def test_ws_handshake_frames_and_close():
+
+    async def test(server, port):
+        reader, writer, head = await connect(port, '/ws', WSHEADERS)
+        assert head.startswith('HTTP/1.1 101 Switching Protocols')
+        # the example from RFC 6455
+        assert 'Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=' in head
+        await connected(server)
+        server.publish(sample(1500.0))
+        big = OrderedDict([('text', 'x' * 300)])
+        server.publish(big)
+        opcode, payload = await readws(reader)
+        assert opcode == 0x81
+        assert json.loads(payload.decode('utf-8'))['gridPowerAll'] == 1500.0
+        opcode, payload = await readws(reader)
+        assert json.loads(payload.decode('utf-8')) == big
+
+        # a masked text frame is ignored, a close is echoed
+        mask = b'\x01\x02\x03\x04'
+        text = bytes(b ^ mask[i % 4] for i, b in enumerate(b'hello'))
+        writer.write(b'\x81\x85' + mask + text)
+        status = bytes(b ^ mask[i % 4] for i, b in
+                enumerate(struct.pack('!H', 1000) + b'bye'))
+        writer.write(b'\x88\x85' + mask + status)
+        opcode, payload = await readws(reader)
+        assert opcode == 0x88
+        assert payload == struct.pack('!H', 1000)
+        assert await reader.read() == b''
+        assert not server.clients
+
+    run(test)
+
+
+def test_bad_requests():
+
+    async def test(server, port):
+        reader, writer, head = await connect(port, '/nowhere')
+        assert head.startswith('HTTP/1.1 404')
+        writer.close()
+        reader, writer, head = await connect(port, '/ws')
+        assert head.startswith('HTTP/1.1 400')
+        writer.close()
+
+    run(test)
+
+
+def test_slow_client_dropped():
+
+    async def test(server, port):
+        slow, slowwriter, head = await connect(port, '/events')
+        fast, fastwriter, head = await connect(port, '/ws', WSHEADERS)
+        await connected(server, 2)
+        # nothing runs between these so the queues fill
+        for i in range(3):
+            server.publish(sample(float(i)))
+        assert len(server.clients) == 0
+        await connected(server, 0)
+        assert await slow.read() == b''
+        assert await fast.read() == b''
+
+        # a client that keeps up stays
+        reader, writer, head = await connect(port, '/events')
+        assert (await readsse(reader))['gridPowerAll'] == 2.0
+        await connected(server)
+        for i in range(5):
+            server.publish(sample(float(i)))
+            assert (await readsse(reader))['gridPowerAll'] == i
+        assert len(server.clients) == 1
+        writer.close()
+
+    run(test, maxqueue=2)
+
+
+def test_wsframe_lengths():
+    assert wsframe(b'x' * 125)[:2] == b'\x81\x7d'
+    assert wsframe(b'x' * 126)[:4] == b'\x81\x7e\x00\x7e'
+    assert wsframe(b'x' * 0x10000)[:10] == b'\x81\x7f' + struct.pack('!Q',
+            0x10000)
@@ -0,0 +1,121 @@
+import time
+import sqlite3
+import datetime as dt
+from collections import OrderedDict
+import pytest
+from pyaurora import replay as rp
+from pyaurora.replay import readrows, replay
+from pyaurora.sqlsink import tosql
+from pyaurora.wire import toarchive
+
+
+T0 = dt.datetime(2020, 6, 1, 12)
+
+
+def sample(i, **extra):
+    d = OrderedDict([('utc', T0 + dt.timedelta(seconds=i)),
+            ('gridPowerAll', 100.0 * i)])
+    d.update(extra)
+    return d
+
+
+class Collect(object):
+
+    def __init__(self):
+        self.items = []
+        self.times = []
+
+    def send(self, d):
+        self.items.append(d)
+        self.times.append(time.perf_counter())
+
+
+def test_paced_at_speed():
+    target = Collect()
+    stats = replay([sample(i) for i in range(4)], target, speed=10)
+    # one second apart in the original, a tenth of a second here
+    gaps = [b - a for a, b in zip(target.times, target.times[1:])]
+    assert all(g == pytest.approx(0.1, abs=0.05) for g in gaps)
+    assert stats['seconds'] == pytest.approx(0.3, abs=0.05)
+    assert stats['samples'] == 4
+    assert stats['lag'] < 0.05
+
+
+def test_as_fast_as_possible_with_limit():
+    target = Collect()
+    stats = replay((sample(3600 * i) for i in range(1000)), target,
+            speed=None, limit=10)
+    assert [d['gridPowerAll'] for d in target.items] == [360000.0 * i
+            for i in range(10)]
+    assert stats['samples'] == 10
+    assert stats['seconds'] < 1.0
+    assert stats['p50'] <= stats['p99'] <= stats['max']
+    assert stats['rate'] > 0
+
+
+def test_multiplexed_inverters():
+    target = Collect()
+    samples = [sample(0), sample(1, inverter='real')]
+    stats = replay(samples, target, speed=None, inverters=3)
+    assert stats['samples'] == 6
+    assert [d['inverter'] for d in target.items] == ['inv0', 'inv1',
+            'inv2'] * 2
+    for d in target.items:
+        assert list(d)[:3] == ['utc', 'inverter', 'gridPowerAll']
+    assert target.items[4]['gridPowerAll'] == 100.0
+    # the originals are untouched
+    assert samples[1]['inverter'] == 'real'
+
+
+def test_latencies_bounded(monkeypatch):
+    monkeypatch.setattr(rp, 'RESERVOIR', 50)
+    kept = []
+    real = rp._percentile
+
+    def percentile(values, p):
+        kept.append(len(values))
+        return real(values, p)
+
+    monkeypatch.setattr(rp, '_percentile', percentile)
+    stats = replay((sample(i) for i in range(1000)), Collect(), speed=None,
+            inverters=2)
+    assert stats['samples'] == 2000
+    assert kept == [50, 50]
+    assert stats['max'] >= stats['p99']
+
+
+def test_readdb(tmp_path):
+    path = str(tmp_path / 'aurora.db')
+    conn = sqlite3.connect(path)
+    target = tosql(conn, batchsize=3)
+    # a flush before anything was sent is harmless
+    target.send(None)
+    for i in range(10):
+        target.send(sample(i))
+    target.send(None)
+    conn.close()
+
+    rows = list(readrows([path]))
+    assert [d['gridPowerAll'] for d in rows] == [100.0 * i for i in range(10)]
+    assert rows[0]['utc'] == T0
+    rows = list(readrows([path], sample(3)['utc'], sample(6)['utc']))
+    assert [d['gridPowerAll'] for d in rows] == [300.0, 400.0, 500.0]
+
+
+def test_readbin(tmp_path):
+    path = str(tmp_path / 'aurora.arc')
+    with open(path, 'ab') as fout:
+        target = toarchive(fout, ['gridPowerAll'])
+        for i in range(10):
+            target.send(sample(i))
+
+    rows = list(readrows([path]))
+    assert len(rows) == 10
+    assert rows[9]['utc'] == sample(9)['utc']
+    rows = list(readrows([path], sample(3)['utc'], sample(6)['utc']))
+    assert [d['gridPowerAll'] for d in rows] == [300.0, 400.0, 500.0]
+
+
+def test_unknown_file_type():
+    with pytest.raises(ValueError):
+        list(readrows(['aurora.txt']))
@@ -0,0 +1,51 @@
+import datetime as dt
+from collections import OrderedDict
+from pyaurora.dateawarejsonenc import DateAwareJSONEncoder
+from pyaurora.samplejsonenc import SampleJSONEncoder
+
+
+def sample(**kwargs):
+    d = OrderedDict(utc=dt.datetime(2015, 7, 20, 12, 0, 5, 250000))
+    d.update(gridPowerAll=1234.5, dailyEnergy=4567, state='ok', missing=None)
+    d.update(kwargs)
+    return d
+
+
+def test_same_as_dateaware():
+    enc = SampleJSONEncoder()
+    ref = DateAwareJSONEncoder()
+    for d in (sample(), sample(nan=float('nan')), sample(inf=float('inf'),
+            ninf=float('-inf')), sample(nested=[1, 2]), {}):
+        assert enc.encode(d) == ref.encode(d)
+
+
+def test_orjson_opt_in():
+    d = sample(nan=float('nan'))
+    assert not SampleJSONEncoder().useorjson
+    assert 'NaN' in SampleJSONEncoder().encode(d)
+
+
+def test_prefix_cache_bounded():
+    enc = SampleJSONEncoder(maxprefixes=8)
+    ref = DateAwareJSONEncoder()
+    for i in range(100):
+        d = OrderedDict(('f{0}'.format(j), float(j)) for j in range(i % 13))
+        d['k{0}'.format(i)] = i
+        assert enc.encode(d) == ref.encode(d)
+        assert len(enc._prefixes) <= 8
+
+
+def test_default_encoders_are_dateaware():
+    from pyaurora.output import tojson
+    from pyaurora.wire import JSONCodec
+
+    out = []
+
+    class Target(object):
+        def send(self, s):
+            out.append(s)
+
+    d = sample(nan=float('nan'))
+    tojson(Target()).send(d)
+    assert out == [DateAwareJSONEncoder().encode(d)]
+    assert isinstance(JSONCodec().enc, DateAwareJSONEncoder)
@@ -0,0 +1,95 @@
+import datetime as dt
+from collections import OrderedDict
+import pytest
+from pyaurora.metrics import registry
+from pyaurora.scheduler import AdaptiveInterval, adapt
+
+
+T0 = dt.datetime(2020, 6, 1, 12)
+
+
+def sample(seconds, power, current=5.0):
+    return OrderedDict([('utc', T0 + dt.timedelta(seconds=seconds)),
+            ('gridPowerAll', power), ('in1Current', current)])
+
+
+def gauge():
+    for line in registry.exposition().splitlines():
+        if line.startswith('aurora_poll_interval_seconds '):
+            return float(line.split()[1])
+
+
+def test_grows_while_calm_up_to_max():
+    ctl = AdaptiveInterval(2, 10)
+    assert ctl.update(sample(0, 1000.0)) == 2
+    # no rate until there are two samples
+    assert ctl.activity is None
+    intervals = [ctl.update(sample(10 * i, 1000.0)) for i in range(1, 8)]
+    assert intervals[:4] == [3.0, 4.5, 6.75, 10]
+    assert intervals[4:] == [10, 10, 10]
+    assert ctl.activity == 0.0
+
+
+def test_drops_to_min_when_fast():
+    ctl = AdaptiveInterval(2, 60)
+    for i in range(10):
+        ctl.update(sample(10 * i, 1000.0))
+    assert ctl.interval == 60
+    # 20 W/s is fast
+    assert ctl.update(sample(100, 1400.0)) == 2
+    assert ctl.activity == pytest.approx(2.0)
+    # the current alone is enough
+    ctl.update(sample(110, 1400.0, 5.0))
+    assert ctl.update(sample(120, 1400.0, 6.0)) == 2
+
+
+def test_moderate_activity_keeps_interval():
+    ctl = AdaptiveInterval(2, 60)
+    ctl.update(sample(0, 1000.0))
+    assert ctl.update(sample(10, 1000.0)) == 3.0
+    # half the fast rate, between calm and fast
+    assert ctl.update(sample(20, 1100.0)) == 3.0
+    assert ctl.activity == pytest.approx(0.5)
+
+
+def test_clamped_and_validated():
+    ctl = AdaptiveInterval(5, 5)
+    for i in range(5):
+        assert ctl.update(sample(10 * i, 1000.0 * i)) == 5
+    with pytest.raises(ValueError):
+        AdaptiveInterval(10, 5)
+    with pytest.raises(ValueError):
+        AdaptiveInterval(0, 5)
+
+
+def test_missing_and_garbled_values_ignored():
+    ctl = AdaptiveInterval(2, 60)
+    ctl.update(sample(0, 1000.0))
+    d = sample(10, 'n/a', None)
+    assert ctl.update(d) == 2
+    assert ctl.activity is None
+
+
+def test_gauge_reports_latest_controller():
+    first = AdaptiveInterval(2, 60)
+    first.update(sample(0, 1000.0))
+    first.update(sample(10, 1000.0))
+    assert gauge() == 3.0
+    second = AdaptiveInterval(7, 60)
+    second.update(sample(0, 1000.0))
+    assert gauge() == 7
+
+
+def test_adapt_passes_samples_on():
+    seen = []
+
+    class Collect(object):
+        def send(self, d):
+            seen.append(d)
+
+    ctl = AdaptiveInterval(2, 60)
+    target = adapt(Collect(), ctl)
+    target.send(sample(0, 1000.0))
+    target.send(sample(10, 1000.0))
+    assert len(seen) == 2
+    assert ctl.interval == 3.0
@@ -0,0 +1,121 @@
+import os
+import math
+import multiprocessing
+import datetime as dt
+from collections import OrderedDict
+import pytest
+from pyaurora.shm import LatestTable, LatestReader, TornSlot, _SEQ
+
+
+FIELDS = ['gridPowerAll', 'boosterTemp']
+
+
+def sample(power, temp=40.0):
+    return OrderedDict([('utc', dt.datetime(2020, 6, 1, 12)),
+            ('gridPowerAll', power), ('boosterTemp', temp)])
+
+
+def writer(path, inverter, power, opened):
+    table = LatestTable(path, FIELDS)
+    # everyone has the file open before anyone claims a slot
+    opened.wait()
+    for i in range(50):
+        table.write(inverter, sample(power + i))
+    table.close()
+
+
+def test_processes_claim_their_own_slots(tmp_path):
+    path = str(tmp_path / 'latest')
+    ctx = multiprocessing.get_context('fork')
+    opened = ctx.Barrier(4)
+    procs = [ctx.Process(target=writer, args=(path, 'inv{0}'.format(n),
+            1000.0 * n, opened)) for n in range(1, 5)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+
+    rdr = LatestReader(path)
+    assert sorted(rdr.inverters()) == ['inv1', 'inv2', 'inv3', 'inv4']
+    for n in range(1, 5):
+        d, seq = rdr.read('inv{0}'.format(n))
+        assert d['gridPowerAll'] == 1000.0 * n + 49
+        assert seq == 100
+    rdr.close()
+
+
+def test_restarted_writer_reuses_its_slot(tmp_path):
+    path = str(tmp_path / 'latest')
+    a = LatestTable(path, FIELDS)
+    a.write('inv2', sample(1.0))
+    b = LatestTable(path, FIELDS)
+    b.write('inv3', sample(2.0))
+    a.close()
+    a = LatestTable(path, FIELDS)
+    a.write('inv2', sample(3.0))
+
+    rdr = LatestReader(path)
+    assert rdr.inverters() == ['inv2', 'inv3']
+    assert rdr.get('inv2', 'gridPowerAll') == 3.0
+    assert rdr.get('inv3', 'gridPowerAll') == 2.0
+    rdr.close()
+    a.close()
+    b.close()
+
+
+def test_no_free_slot(tmp_path):
+    table = LatestTable(str(tmp_path / 'latest'), FIELDS, nslots=1)
+    table.write('inv2', sample(1.0))
+    with pytest.raises(ValueError):
+        table.write('inv3', sample(1.0))
+    table.close()
+
+
+def test_dead_writer_does_not_hang_readers(tmp_path):
+    path = str(tmp_path / 'latest')
+    table = LatestTable(path, FIELDS)
+    table.write('inv2', sample(1.0))
+    off = table._offset(0)
+    # die mid update
+    _SEQ.pack_into(table.mm, off, _SEQ.unpack_from(table.mm, off)[0] + 1)
+
+    rdr = LatestReader(path, retries=100)
+    with pytest.raises(TornSlot):
+        rdr.read('inv2')
+    with pytest.raises(TornSlot):
+        rdr.get('inv2', 'gridPowerAll')
+
+    # the restarted writer repairs its slot
+    table.close()
+    table = LatestTable(path, FIELDS)
+    table.write('inv2', sample(5.0))
+    assert rdr.get('inv2', 'gridPowerAll') == 5.0
+    assert rdr.read('inv2')[1] % 2 == 0
+    rdr.close()
+    table.close()
+
+
+def test_new_layout_replaces_file_under_readers(tmp_path):
+    path = str(tmp_path / 'latest')
+    old = LatestTable(path, FIELDS)
+    old.write('inv2', sample(1.0))
+    rdr = LatestReader(path)
+    ino = os.stat(path).st_ino
+
+    new = LatestTable(path, FIELDS + ['dailyEnergy'])
+    new.write('inv2', sample(2.0))
+    assert os.stat(path).st_ino != ino
+    # the old mapping is intact, no SIGBUS
+    assert rdr.get('inv2', 'gridPowerAll') == 1.0
+    assert rdr.read('inv2')[0]['boosterTemp'] == 40.0
+    rdr.close()
+
+    rdr = LatestReader(path)
+    assert rdr.fields == FIELDS + ['dailyEnergy']
+    assert rdr.get('inv2', 'gridPowerAll') == 2.0
+    assert math.isnan(rdr.get('inv2', 'dailyEnergy'))
+    rdr.close()
+    old.close()
+    new.close()
+    assert os.listdir(str(tmp_path)) == ['latest']
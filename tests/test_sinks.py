@@ -0,0 +1,82 @@
+import io
+import sys
+import datetime as dt
+from collections import OrderedDict
+import pytest
+import pyaurora as pv
+from pyaurora import sinks
+
+
+def test_make_csv():
+    fout = io.StringIO()
+    target = sinks.make('csv', fout)
+    target.send(OrderedDict([('utc', dt.datetime(2015, 7, 20)), ('a', 1.5)]))
+    assert fout.getvalue().splitlines() == ['utc,a', '2015-07-20 00:00:00,1.5']
+
+
+def test_registered_sinks_load():
+    for name in sinks.available():
+        try:
+            assert callable(sinks.load(name))
+        except ImportError:
+            pass
+
+
+def test_unknown_sink():
+    with pytest.raises(KeyError):
+        sinks.make('nosuchsink')
+
+
+def test_missing_backend(monkeypatch):
+    monkeypatch.setitem(sinks._registry, 'broken',
+            'pyaurora.nosuchmodule:tobroken')
+    with pytest.raises(ImportError):
+        sinks.make('broken')
+
+
+def test_getattr_missing_submodule():
+    with pytest.raises(AttributeError):
+        pv.nosuchmodule
+
+
+def test_getattr_missing_dependency(monkeypatch):
+    pytest.importorskip('numpy')
+    monkeypatch.delattr(pv, 'analytics', raising=False)
+    monkeypatch.delitem(sys.modules, 'pyaurora.analytics', raising=False)
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    with pytest.raises(ImportError):
+        pv.analytics
+
+
+def csvsample(**values):
+    d = OrderedDict([('utc', dt.datetime(2015, 7, 20))])
+    d.update(values)
+    return d
+
+
+def test_csv_append_same_header(tmp_path):
+    path = str(tmp_path / 'aurora.csv')
+    for i in range(2):
+        with open(path, 'a') as fout:
+            sinks.make('csv', fout).send(csvsample(a=i))
+    with open(path) as fin:
+        assert fin.read().splitlines() == ['utc,a',
+                '2015-07-20 00:00:00,0', '2015-07-20 00:00:00,1']
+
+
+def test_csv_append_other_header_refused(tmp_path):
+    path = str(tmp_path / 'aurora.csv')
+    with open(path, 'a') as fout:
+        sinks.make('csv', fout).send(csvsample(a=1))
+    with open(path, 'a') as fout:
+        target = sinks.make('csv', fout)
+        with pytest.raises(ValueError):
+            target.send(csvsample(a=2, rIsoRes=3.0))
+    with open(path) as fin:
+        assert len(fin.read().splitlines()) == 2
+
+    # a readable file is checked too
+    fout = io.StringIO()
+    fout.write('utc,b\r\n')
+    with pytest.raises(ValueError):
+        sinks.make('csv', fout).send(csvsample(a=1))
@@ -0,0 +1,124 @@
+import os
+import time
+import pytest
+from pyaurora.spool import Spool, StoreAndForward, RECORD, SEGFMT
+from pyaurora.worker import QueueWorker
+
+
+def wait(cond, timeout=5.0):
+    t0 = time.monotonic()
+    while not cond() and time.monotonic() - t0 < timeout:
+        time.sleep(0.005)
+    return cond()
+
+
+def test_append_read_ack(tmp_path):
+    spool = Spool(str(tmp_path))
+    seqs = [spool.append('r{0}'.format(i).encode()) for i in range(5)]
+    assert seqs == [1, 2, 3, 4, 5]
+    assert spool.read(1, 10) == [(s, 'r{0}'.format(s - 1).encode())
+            for s in seqs]
+    spool.ack(2)
+    spool.ack(1)
+    assert spool.cursor == 2
+    assert [s for s, p in spool.read(1, 10)] == [3, 4, 5]
+    assert spool.pending() == 3
+    spool.close()
+
+
+def test_torn_tail_recovery(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(3):
+        spool.append(b'payload')
+    spool.close()
+    path = os.path.join(str(tmp_path), SEGFMT.format(1))
+    good = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(RECORD.pack(4, 100, 0) + b'torn')
+
+    spool = Spool(str(tmp_path))
+    assert os.path.getsize(path) == good
+    assert spool.nextseq == 4
+    assert spool.append(b'next') == 4
+    assert [s for s, p in spool.read(1, 10)] == [1, 2, 3, 4]
+    spool.close()
+
+
+def test_corrupt_record_stops_scan(tmp_path):
+    spool = Spool(str(tmp_path))
+    for i in range(3):
+        spool.append(b'payload')
+    spool.close()
+    path = os.path.join(str(tmp_path), SEGFMT.format(1))
+    with open(path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b'X')
+    spool = Spool(str(tmp_path))
+    assert [s for s, p in spool.read(1, 10)] == [1, 2]
+    spool.close()
+
+
+def test_segment_rollover_and_limit(tmp_path):
+    size = RECORD.size + 100
+    spool = Spool(str(tmp_path), segmentsize=3 * size, maxbytes=6 * size)
+    for i in range(20):
+        spool.append(bytes(100))
+    assert len(spool.segments) <= 3
+    assert spool._size() <= 6 * size + 3 * size
+    assert spool.dropped > 0
+    assert spool.pending() == 20 - spool.dropped
+    seqs = [s for s, p in spool.read(1, 100)]
+    assert seqs == list(range(spool.cursor + 1, 21))
+    spool.close()
+
+
+def test_acked_segments_deleted(tmp_path):
+    size = RECORD.size + 10
+    spool = Spool(str(tmp_path), segmentsize=2 * size)
+    for i in range(6):
+        spool.append(bytes(10))
+    assert len(spool.segments) == 3
+    for seq in range(1, 5):
+        spool.ack(seq)
+    assert spool.segments == [5]
+    spool.close()
+
+
+def test_cursor_saved_after_delivery(tmp_path):
+    delivered = []
+    spool = Spool(str(tmp_path), syncevery=1000, syncinterval=1000)
+    sf = StoreAndForward(delivered.extend, spool, batchsize=5)
+    for i in range(10):
+        sf.send(i)
+    assert wait(lambda: len(delivered) == 10)
+    # simulate a crash: the spool is not closed
+    assert wait(lambda: Spool(str(tmp_path)).cursor == 10)
+    sf.close()
+
+
+def test_replay_rate_below_one(tmp_path):
+    up = [False]
+    delivered = []
+
+    def deliver(batch):
+        if not up[0]:
+            raise IOError('down')
+        delivered.extend(batch)
+
+    sf = StoreAndForward(deliver, Spool(str(tmp_path)), batchsize=10,
+            rate=0.5, backoff=0.01, maxbackoff=0.01)
+    for i in range(3):
+        sf.send(i)
+    assert wait(lambda: sf.stats()['failed'] > 0)
+    up[0] = True
+    assert wait(lambda: len(delivered) >= 1, timeout=3)
+    assert sorted(delivered)[0] == 0
+    sf.close()
+
+
+def test_stats_keys_match_queueworker(tmp_path):
+    worker = QueueWorker(lambda batch: None)
+    sf = StoreAndForward(lambda batch: None, Spool(str(tmp_path)))
+    assert set(worker.stats()) <= set(sf.stats())
+    worker.close(1)
+    sf.close(1)
@@ -0,0 +1,49 @@
+import datetime as dt
+from collections import OrderedDict
+import pytest
+from pyaurora.wire import SchemaError, toarchive, readarchive
+
+
+FIELDS = ('gridPowerAll', 'boosterTemp')
+
+
+def sample(i, fields=FIELDS):
+    d = OrderedDict([('utc', dt.datetime(2020, 6, 1, 12, 0, i))])
+    for n, name in enumerate(fields):
+        d[name] = float(i + n)
+    return d
+
+
+def write(path, fields, samples):
+    with open(path, 'ab') as fout:
+        target = toarchive(fout, fields)
+        for i in samples:
+            target.send(sample(i, fields))
+
+
+def test_append_same_fields(tmp_path):
+    path = str(tmp_path / 'aurora.arc')
+    write(path, FIELDS, range(3))
+    write(path, FIELDS, range(3, 5))
+    with open(path, 'rb') as fin:
+        got = list(readarchive(fin))
+    assert [d['utc'].second for d in got] == [0, 1, 2, 3, 4]
+    assert got[4]['boosterTemp'] == 5.0
+
+
+def test_append_other_fields_refused(tmp_path):
+    path = str(tmp_path / 'aurora.arc')
+    write(path, FIELDS, range(3))
+    size = (tmp_path / 'aurora.arc').stat().st_size
+    with pytest.raises(SchemaError):
+        write(path, FIELDS + ('dailyEnergy',), range(3, 5))
+    assert (tmp_path / 'aurora.arc').stat().st_size == size
+    with open(path, 'rb') as fin:
+        assert len(list(readarchive(fin))) == 3
+
+
+def test_append_to_non_archive_refused(tmp_path):
+    path = tmp_path / 'aurora.csv'
+    path.write_text('utc\n')
+    with pytest.raises(ValueError):
+        write(str(path), FIELDS, range(1))
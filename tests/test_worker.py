@@ -0,0 +1,204 @@
+import time
+import threading
+import pytest
+from pyaurora.output import coroutine
+from pyaurora.worker import QueueWorker, SpillFile, WorkerStopped, queued
+
+
+def test_close_full_queue_stuck_handler():
+    started = threading.Event()
+    release = threading.Event()
+
+    def handler(batch):
+        started.set()
+        release.wait(5)
+
+    worker = QueueWorker(handler, maxsize=2, policy='drop-newest')
+    worker.send(0)
+    assert started.wait(2)
+    for i in range(1, 5):
+        worker.send(i)
+    t0 = time.monotonic()
+    worker.close(timeout=0.2)
+    assert time.monotonic() - t0 < 1.0
+    release.set()
+    worker._thread.join(2)
+    assert not worker._thread.is_alive()
+    assert worker.processed == 1
+
+
+def test_close_drains_queue():
+    seen = []
+    worker = QueueWorker(seen.extend, maxsize=100, batchsize=7)
+    for i in range(50):
+        worker.send(i)
+    worker.close(timeout=5)
+    assert seen == list(range(50))
+    assert worker.stats()['processed'] == 50
+
+
+def test_queued_dead_target_stops_worker():
+
+    @coroutine
+    def failing():
+        yield
+        raise ValueError('broken')
+
+    worker = queued(failing(), maxsize=10)
+    worker.send(1)
+    worker._thread.join(2)
+    assert not worker._thread.is_alive()
+    assert isinstance(worker.error, ValueError)
+    with pytest.raises(WorkerStopped):
+        worker.send(2)
+    assert worker.failed == 1
+
+
+def test_handler_errors_counted_without_stop():
+
+    def handler(batch):
+        if batch[0] % 2:
+            raise ValueError(batch)
+
+    worker = QueueWorker(handler, maxsize=10)
+    for i in range(4):
+        worker.send(i)
+    worker.close(timeout=5)
+    s = worker.stats()
+    assert (s['processed'], s['failed']) == (2, 2)
+
+
+def test_stats_has_no_side_effects():
+    worker = QueueWorker(lambda batch: time.sleep(0.001), maxsize=100)
+    for i in range(20):
+        worker.send(i)
+    worker.close(timeout=5)
+    first = worker.stats()
+    second = worker.stats()
+    assert first['processed'] == second['processed'] == 20
+    assert first['rate'] > 0
+    assert second['rate'] == pytest.approx(first['rate'], rel=0.5)
+
+
+def blocked(maxsize, policy, **kwargs):
+    '''
+    A worker whose handler is stuck on its first item until `release` is
+    set, so everything sent after that lands in (or overflows) the queue.
+    '''
+    seen = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def handler(batch):
+        started.set()
+        release.wait(5)
+        seen.extend(batch)
+
+    worker = QueueWorker(handler, maxsize=maxsize, policy=policy, **kwargs)
+    worker.send(0)
+    assert started.wait(2)
+    return worker, seen, release
+
+
+def test_drop_oldest_policy():
+    worker, seen, release = blocked(3, 'drop-oldest')
+    for i in range(1, 8):
+        worker.send(i)
+    release.set()
+    worker.close(timeout=5)
+    assert seen == [0, 5, 6, 7]
+    assert worker.stats()['dropped'] == 4
+
+
+def test_drop_newest_policy():
+    worker, seen, release = blocked(3, 'drop-newest')
+    for i in range(1, 8):
+        worker.send(i)
+    release.set()
+    worker.close(timeout=5)
+    assert seen == [0, 1, 2, 3]
+    assert worker.stats()['dropped'] == 4
+
+
+def test_block_policy():
+    worker, seen, release = blocked(2, 'block')
+    worker.send(1)
+    worker.send(2)
+    sent = threading.Event()
+
+    def sender():
+        worker.send(3)
+        sent.set()
+
+    threading.Thread(target=sender, daemon=True).start()
+    assert not sent.wait(0.2)
+    release.set()
+    assert sent.wait(2)
+    worker.close(timeout=5)
+    assert seen == [0, 1, 2, 3]
+    assert worker.stats()['dropped'] == 0
+
+
+def test_spill_policy(tmp_path):
+    worker, seen, release = blocked(2, 'spill', spilldir=str(tmp_path),
+            batchsize=3)
+    for i in range(1, 10):
+        worker.send(i)
+    s = worker.stats()
+    assert (s['queued'], s['spilled']) == (2, 7)
+    release.set()
+    worker.close(timeout=5)
+    assert sorted(seen) == list(range(10))
+    s = worker.stats()
+    assert (s['processed'], s['dropped'], s['spilled']) == (10, 0, 0)
+
+
+def test_spillfile(tmp_path):
+    spill = SpillFile(str(tmp_path))
+    for i in range(5):
+        spill.write({'n': i})
+    assert len(spill) == 5
+    assert spill.read(2) == [{'n': 0}, {'n': 1}]
+    spill.write({'n': 5})
+    assert spill.read(10) == [{'n': i} for i in range(2, 6)]
+    assert len(spill) == 0
+    # emptied once the reader caught up
+    assert spill.f.seek(0, 2) == 0
+    assert spill.read(1) == []
+    spill.write('again')
+    assert spill.read(1) == ['again']
+
+
+def test_slow_output_does_not_stall_others():
+    aurora = pytest.importorskip('aurora')
+    release = threading.Event()
+    fast = []
+
+    @coroutine
+    def slow():
+        while True:
+            yield
+            release.wait(5)
+
+    @coroutine
+    def collect():
+        while True:
+            fast.append((yield))
+
+    outputs, workers = aurora.queueoutputs([('csv', slow()),
+            ('archive', collect())], 2, 'drop-oldest')
+    assert [name for name, target in outputs] == ['csv', 'archive']
+    for i in range(10):
+        for name, target in outputs:
+            target.send(i)
+        # a poll interval, long enough for a healthy output to keep up
+        time.sleep(0.02)
+    t0 = time.monotonic()
+    while len(fast) < 10 and time.monotonic() - t0 < 2:
+        time.sleep(0.01)
+    assert fast == list(range(10))
+    assert workers[0].stats()['dropped'] > 0
+    assert workers[1].stats()['dropped'] == 0
+    release.set()
+    for worker in workers:
+        worker.close(timeout=5)